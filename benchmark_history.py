@@ -0,0 +1,112 @@
+# benchmark_history.py
+"""
+Сравнение представлений истории диалога: список pydantic Message (прежняя
+модель, с кэшами форматов UI и модели) против CompactHistory.
+
+Измеряются объём памяти (tracemalloc) и время загрузки истории из JSONL.
+
+Пример:
+    python benchmark_history.py --messages 20000 --message-size 800
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from typing import Callable, Tuple
+
+import container  # noqa: F401  (контейнер инициализируется до импорта сервисов)
+import services  # noqa: F401
+from models.compact_history import CompactHistory, HistoryModelView
+from models.enums import MessageRole
+from models.message import Message
+
+
+def _write_jsonl(path: str, messages: int, message_size: int):
+    text = ("Пример текста сообщения для бенчмарка истории. " * (message_size // 48 + 1))[:message_size]
+    started = datetime(2024, 1, 1)
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(messages):
+            record = {
+                "role": "user" if i % 2 == 0 else "assistant",
+                "content": f"{i}: {text}",
+                "timestamp": (started + timedelta(seconds=i)).isoformat(),
+            }
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def load_as_messages(path: str):
+    """Прежний путь: Message на каждую строку плюс кэши UI и модели."""
+    history = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            data = json.loads(line)
+            data["role"] = MessageRole(data["role"])
+            data["timestamp"] = datetime.fromisoformat(data["timestamp"])
+            history.append(Message(**data))
+    ui_cache = [{"role": m.role.value, "content": m.content} for m in history]
+    model_cache = [{"role": m.role.value, "content": m.content} for m in history]
+    return history, ui_cache, model_cache
+
+
+def load_as_compact(path: str):
+    """Новый путь: сразу в массивы, кэш только для UI, модель — представление."""
+    history = CompactHistory()
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            data = json.loads(line)
+            history.append_raw(data["role"], data["content"], datetime.fromisoformat(data["timestamp"]))
+    ui_cache = [{"role": role.value, "content": content} for role, content in history.iter_pairs()]
+    return history, ui_cache, HistoryModelView(history)
+
+
+def measure(loader: Callable, path: str, repeats: int) -> Tuple[float, int]:
+    """Возвращает (лучшее время загрузки в мс, удерживаемую память в байтах)."""
+    best = float("inf")
+    for _ in range(repeats):
+        started = time.perf_counter()
+        loader(path)
+        best = min(best, (time.perf_counter() - started) * 1000)
+
+    tracemalloc.start()
+    result = loader(path)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return best, current
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк представления истории диалога")
+    parser.add_argument("--messages", type=int, default=10000)
+    parser.add_argument("--message-size", type=int, default=600, help="длина сообщения в символах")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix=".jsonl")
+    os.close(fd)
+    try:
+        _write_jsonl(path, args.messages, args.message_size)
+        print(f"📊 Сообщений: {args.messages}, размер сообщения: {args.message_size} симв., "
+              f"файл: {os.path.getsize(path) / 1024 / 1024:.1f} МБ")
+
+        results = {
+            "list[Message]": measure(load_as_messages, path, args.repeats),
+            "CompactHistory": measure(load_as_compact, path, args.repeats),
+        }
+    finally:
+        os.remove(path)
+
+    print(f"\n{'представление':<18}{'загрузка, мс':>16}{'память, МБ':>14}")
+    print("-" * 48)
+    for name, (load_ms, memory) in results.items():
+        print(f"{name:<18}{load_ms:>16.1f}{memory / 1024 / 1024:>14.2f}")
+
+    (old_ms, old_mem), (new_ms, new_mem) = results.values()
+    print(f"\n⚡ Загрузка быстрее в {old_ms / new_ms:.2f} раза, память меньше в {old_mem / new_mem:.2f} раза")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+# benchmark_search.py
+"""
+Бенчмарк пути поиска без сети: поставщики local (BM25 по сгенерированному
+корпусу) и mock с заданными задержками, опрос с дедлайном, слияние
+результатов и упаковка фрагментов для модели.
+
+Сценарии:
+- только local;
+- local + быстрый mock (слияние и дедупликация);
+- local + быстрый mock + медленный mock (дольше дедлайна) — задержка
+  ограничена дедлайном, а не самым медленным поставщиком.
+
+Пример:
+    python benchmark_search.py --documents 20000 --queries 200 --deadline 0.3
+"""
+import argparse
+import asyncio
+import copy
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+
+import container  # noqa: F401  (контейнер инициализируется до импорта сервисов)
+import services  # noqa: F401
+from container import container as app_container
+from services.search.manager import SearchManager
+
+_WORDS = (
+    "модель поиск индекс запрос ответ данные сеть сервер кэш память процессор видеокарта "
+    "python rust linux ядро версия релиз обновление курс погода матч новости цена рынок "
+    "компания продукт телефон ноутбук библиотека функция класс ошибка тест производительность"
+).split()
+
+
+def _write_corpus(directory: str, documents: int, seed: int):
+    rng = random.Random(seed)
+    with open(os.path.join(directory, "corpus.jsonl"), "w", encoding="utf-8") as f:
+        for i in range(documents):
+            paragraphs = [" ".join(rng.choices(_WORDS, k=40)) for _ in range(3)]
+            f.write(json.dumps({
+                "title": " ".join(rng.choices(_WORDS, k=4)),
+                "url": f"https://corpus.local/doc/{i}",
+                "content": "\n\n".join(paragraphs),
+            }, ensure_ascii=False) + "\n")
+
+
+def _make_manager(base_config: dict, corpus_dir: str, providers: dict, deadline: float) -> SearchManager:
+    config = copy.deepcopy(base_config)
+    search_cfg = config.setdefault("search", {})
+    search_cfg["active_providers"] = list(providers)
+    search_cfg["providers"] = {**providers, "local": {"corpus_dir": corpus_dir}}
+    search_cfg.setdefault("fanout", {})["deadline"] = deadline
+    search_cfg["cache"] = {"enabled": False}
+    search_cfg.setdefault("preclassifier", {})["log_decisions"] = False
+    return SearchManager(config)
+
+
+async def _run(manager: SearchManager, queries):
+    latencies = []
+    result_counts = []
+    for query in queries:
+        started = time.perf_counter()
+        results, _ = await manager.search(query)
+        manager.format_results(results, query)
+        latencies.append(time.perf_counter() - started)
+        result_counts.append(len(results))
+    return latencies, result_counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк поиска без сети")
+    parser.add_argument("--documents", type=int, default=10000)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--deadline", type=float, default=0.3, help="дедлайн опроса, сек")
+    parser.add_argument("--slow-latency", type=float, default=2.0, help="задержка медленного mock, сек")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    queries = [" ".join(rng.choices(_WORDS, k=rng.randint(2, 5))) for _ in range(args.queries)]
+    base_config = app_container.get_config()
+
+    scenarios = {
+        "local": {"local": {}},
+        "local + mock": {"local": {}, "mock": {"type": "mock", "latency": 0.02}},
+        "local + mock + slow": {
+            "local": {},
+            "mock": {"type": "mock", "latency": 0.02},
+            "slow": {"type": "mock", "latency": args.slow_latency},
+        },
+    }
+
+    with tempfile.TemporaryDirectory() as corpus_dir:
+        started = time.perf_counter()
+        _write_corpus(corpus_dir, args.documents, args.seed)
+        print(f"📊 Корпус: {args.documents} документов ({time.perf_counter() - started:.1f} сек), "
+              f"запросов: {args.queries}, дедлайн: {args.deadline} сек")
+
+        print(f"\n{'сценарий':<22}{'p50, мс':>10}{'p95, мс':>10}{'max, мс':>10}{'результатов':>14}")
+        print("-" * 66)
+        for name, providers in scenarios.items():
+            manager = _make_manager(base_config, corpus_dir, providers, args.deadline)
+            # Первый запрос строит индекс корпуса — в замеры не входит
+            asyncio.run(manager.search(queries[0]))
+            latencies, counts = asyncio.run(_run(manager, queries))
+            latencies.sort()
+            print(f"{name:<22}{1000 * statistics.median(latencies):>10.1f}"
+                  f"{1000 * latencies[int(len(latencies) * 0.95) - 1]:>10.1f}"
+                  f"{1000 * latencies[-1]:>10.1f}{statistics.mean(counts):>14.1f}")
+            manager.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+# benchmark_storage.py
+"""
+Сравнение движков хранения диалогов (files и sqlite) на синтетических данных.
+
+Измеряется задержка типичных операций приложения: создание диалога,
+дозапись сообщения, перезапись последнего сообщения, сохранение состояния
+контекста, холодная загрузка списка диалогов и гидратация истории.
+
+Пример:
+    python benchmark_storage.py --dialogs 200 --messages 50
+"""
+import argparse
+import shutil
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List
+
+import container  # noqa: F401  (контейнер инициализируется до импорта сервисов)
+import services  # noqa: F401
+from models.dialog import Dialog
+from models.enums import MessageRole
+from services.storage import STORAGE_ENGINES, create_storage_backend
+
+
+def _timed(fn: Callable, samples: List[float]):
+    started = time.perf_counter()
+    result = fn()
+    samples.append((time.perf_counter() - started) * 1000)
+    return result
+
+
+def _summary(samples: List[float]) -> str:
+    if not samples:
+        return "—"
+    ordered = sorted(samples)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    return f"{statistics.mean(samples):8.3f} / {p95:8.3f}"
+
+
+def run_engine(engine: str, dialogs: int, messages: int, message_size: int) -> Dict[str, List[float]]:
+    """Прогоняет сценарий на одном движке во временной папке."""
+    save_dir = tempfile.mkdtemp(prefix=f"bench_{engine}_")
+    config = {"save_dir": save_dir, "sqlite_path": None}
+    samples: Dict[str, List[float]] = {
+        "save_dialog": [], "append_message": [], "rewrite_last": [],
+        "save_context": [], "load_dialogs": [], "load_history": [],
+    }
+    text = ("Пример текста сообщения для бенчмарка. " * (message_size // 40 + 1))[:message_size]
+    state = {"raw_tail": text * 4, "l1_chunks": [{"summary": text} for _ in range(8)]}
+
+    try:
+        storage = create_storage_backend(config, engine)
+        base_time = datetime(2024, 1, 1)
+        for i in range(dialogs):
+            dialog = Dialog(id=str(i + 1), name=f"Диалог {i + 1}", created=base_time + timedelta(seconds=i))
+            _timed(lambda: storage.save_dialog(dialog), samples["save_dialog"])
+            for j in range(messages):
+                role = MessageRole.USER if j % 2 == 0 else MessageRole.ASSISTANT
+                message = dialog.add_message(role, text)
+                _timed(lambda: storage.append_message(dialog, message), samples["append_message"])
+            _timed(lambda: storage.rewrite_last_message(dialog), samples["rewrite_last"])
+            _timed(lambda: storage.save_context_state(dialog, state), samples["save_context"])
+        storage.close()
+
+        # Холодный старт: новый экземпляр хранилища
+        storage = create_storage_backend(config, engine)
+        loaded = _timed(storage.load_dialogs, samples["load_dialogs"])
+        for dialog in loaded.values():
+            _timed(lambda: storage.load_history(dialog), samples["load_history"])
+        storage.close()
+    finally:
+        shutil.rmtree(save_dir, ignore_errors=True)
+
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк движков хранения диалогов")
+    parser.add_argument("--dialogs", type=int, default=100)
+    parser.add_argument("--messages", type=int, default=40)
+    parser.add_argument("--message-size", type=int, default=600, help="длина сообщения в символах")
+    parser.add_argument("--engines", nargs="+", choices=STORAGE_ENGINES, default=list(STORAGE_ENGINES))
+    args = parser.parse_args()
+
+    print(f"📊 Диалогов: {args.dialogs}, сообщений в диалоге: {args.messages}, "
+          f"размер сообщения: {args.message_size} симв.")
+
+    results = {}
+    for engine in args.engines:
+        started = time.perf_counter()
+        results[engine] = run_engine(engine, args.dialogs, args.messages, args.message_size)
+        print(f"   ✅ {engine}: {time.perf_counter() - started:.2f} с")
+
+    operations = list(next(iter(results.values())).keys())
+    header = f"{'операция (мс: среднее / p95)':<32}" + "".join(f"{engine:>22}" for engine in args.engines)
+    print("\n" + header)
+    print("-" * len(header))
+    for operation in operations:
+        row = f"{operation:<32}" + "".join(f"{_summary(results[engine][operation]):>22}" for engine in args.engines)
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
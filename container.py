@@ -1,6 +1,7 @@
 # container.py (обновлённая версия)
 from typing import Dict, Any, Callable
 import threading
+import time
 
 class Container:
     def __init__(self):
@@ -69,6 +70,10 @@ class Container:
         
         return self._services[name]
     
+    def get_if_created(self, name: str) -> Any:
+        """Возвращает сервис, только если он уже создан (без ленивого создания)"""
+        return self._services.get(name)
+    
     # Быстрые методы доступа для обратной совместимости
     def get_config(self):
         return self.get("config_service").get_config()
@@ -107,4 +112,40 @@ def get_model_service():
 def get_logger():
     return container.get_logger()
 
-gpu_lock = threading.RLock()
\ No newline at end of file
+class TimedRLock:
+    """
+    RLock с замером ожидания и удержания (внешний уровень вложенности).
+    observer(wait, hold) подключают метрики (services/metrics.py).
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._acquired_at = 0.0
+        self.observer = None
+
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        started = time.perf_counter()
+        if not self._lock.acquire(blocking, timeout):
+            return False
+        self._depth += 1
+        if self._depth == 1:
+            self._acquired_at = time.perf_counter()
+            if self.observer is not None:
+                self.observer(self._acquired_at - started, None)
+        return True
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0 and self.observer is not None:
+            self.observer(None, time.perf_counter() - self._acquired_at)
+        self._lock.release()
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+
+gpu_lock = TimedRLock()
\ No newline at end of file
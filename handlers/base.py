@@ -50,8 +50,8 @@ class BaseHandler:
         self._last_chat_switch = current_time
         return True
 
-    def get_chat_list_data(self, scroll_target: str = 'none') -> str:
+    def get_chat_list_data(self, scroll_target: str = 'none', full: bool = False) -> str:
         if self._chat_list_handler is None:
             from .chat_list import ChatListHandler
             self._chat_list_handler = ChatListHandler()
-        return self._chat_list_handler.get_chat_list_data(scroll_target=scroll_target)
\ No newline at end of file
+        return self._chat_list_handler.get_chat_list_data(scroll_target=scroll_target, full=full)
\ No newline at end of file
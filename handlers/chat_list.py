@@ -1,12 +1,92 @@
 # handlers/chat_list.py
 import json
+import threading
+from collections import OrderedDict
+from datetime import date
+from typing import Optional
 from .base import BaseHandler
 from services.user_config_service import user_config_service
 
+
+# Сколько сессий (вкладок) помнят последний отправленный список
+_MAX_SESSIONS = 64
+
+
+class _SentChatList:
+    """
+    Последний список чатов, отправленный в браузер одной сессии.
+
+    Каждый ответ получает версию; если известна версия клиента и журнал
+    индекса диалогов её помнит, вместо полного списка отправляется разница
+    относительно неё. Клиент, у которого версия не совпала с base_version,
+    запрашивает полный список командой chatlist:resync.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = 0
+        self.payload = None
+        self.index_version = None
+        self.date = None
+        self.current_id = None
+        self.flags = None
+
+    def reset(self):
+        self.payload = None
+
+
+class _SentChatLists:
+    """
+    Состояние отправки по сессиям Gradio: у каждой вкладки своё поле
+    chat_list_data и своя версия. Давно не обращавшиеся сессии вытесняются —
+    такая вкладка при следующем обновлении получит полный список.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sessions: "OrderedDict[Optional[str], _SentChatList]" = OrderedDict()
+
+    def get(self, session: Optional[str]) -> _SentChatList:
+        with self._lock:
+            sent = self._sessions.get(session)
+            if sent is None:
+                sent = self._sessions[session] = _SentChatList()
+                while len(self._sessions) > _MAX_SESSIONS:
+                    self._sessions.popitem(last=False)
+            else:
+                self._sessions.move_to_end(session)
+            return sent
+
+
+_sent_lists = _SentChatLists()
+
+
+def _current_session() -> Optional[str]:
+    """session_hash запроса Gradio, обрабатываемого в текущем контексте (None вне события)."""
+    try:
+        from gradio.context import LocalContext
+    except ImportError:
+        return None
+    request_var = getattr(LocalContext, "request", None)
+    request = request_var.get(None) if request_var is not None else None
+    return getattr(request, "session_hash", None)
+
+
+def _js_dialog(row, is_current):
+    return {
+        "id": row['id'],
+        "name": row['name'].replace('\n', ' ').replace('\r', ' '),
+        "history_length": row['history_length'],
+        "updated": row['updated'],
+        "is_current": is_current,
+        "pinned": row.get('pinned', False),
+        "pinned_position": row.get('pinned_position')
+    }
+
+
 class ChatListHandler(BaseHandler):
-    def get_chat_list_data(self, scroll_target: str = 'none'):
+    def get_chat_list_data(self, scroll_target: str = 'none', full: bool = False):
         try:
-            grouped_dialogs = self.dialog_service.get_dialog_list_with_groups()
             user_config = user_config_service.get_user_config(force_reload=True)
             thinking_state = user_config.generation.enable_thinking
             if thinking_state is None:
@@ -15,35 +95,110 @@ class ChatListHandler(BaseHandler):
             if search_state is None:
                 search_state = False
 
-            js_data = {
-                "groups": {},
-                "flat": [],
-                "_scroll_target": scroll_target,
-                "_thinking_state": thinking_state,
-                "_search_state": search_state
-            }
-            for group_name, dialogs in grouped_dialogs.items():
-                group_dialogs = []
-                for d in dialogs:
-                    js_dialog = {
-                        "id": d['id'],
-                        "name": d['name'].replace('\n', ' ').replace('\r', ' '),
-                        "history_length": d['history_length'],
-                        "updated": d['updated'],
-                        "is_current": d['is_current'],
-                        "pinned": d.get('pinned', False),
-                        "pinned_position": d.get('pinned_position')
-                    }
-                    group_dialogs.append(js_dialog)
-                    js_data["flat"].append(js_dialog)
-                js_data["groups"][group_name] = group_dialogs
-            return json.dumps(js_data, ensure_ascii=False)
+            dialog_service = self.dialog_service
+            index = dialog_service.index
+            flags = (scroll_target, thinking_state, search_state)
+            today = date.today()
+            sent = _sent_lists.get(_current_session())
+
+            with index.lock, sent.lock:
+                current_id = dialog_service.current_dialog_id
+                state = (index.version, today, current_id, flags)
+                if not full and sent.payload is not None and \
+                        state == (sent.index_version, sent.date, sent.current_id, sent.flags):
+                    return sent.payload
+
+                changes = None
+                if not full and sent.payload is not None and sent.date == today:
+                    changes = index.changes_since(sent.index_version)
+
+                base_version = sent.version
+                sent.version += 1
+                js_data = {
+                    "version": sent.version,
+                    "current_id": current_id,
+                    "_scroll_target": scroll_target,
+                    "_thinking_state": thinking_state,
+                    "_search_state": search_state
+                }
+                if changes is None:
+                    self._fill_full(js_data, current_id)
+                else:
+                    if current_id != sent.current_id:
+                        changes.update(i for i in (current_id, sent.current_id) if i is not None)
+                    js_data["base_version"] = base_version
+                    js_data["diff"] = self._build_diff(changes, current_id, today)
+
+                payload = json.dumps(js_data, ensure_ascii=False)
+                sent.payload = payload
+                sent.index_version, sent.date, sent.current_id, sent.flags = state
+                return payload
         except Exception as e:
             self.logger.error("Ошибка получения списка чатов: %s", e)
+            sent = _sent_lists.get(_current_session())
+            with sent.lock:
+                sent.reset()
             return json.dumps({
                 "groups": {},
                 "flat": [],
                 "_scroll_target": "none",
                 "_thinking_state": False,
                 "_search_state": False
-            }, ensure_ascii=False)
\ No newline at end of file
+            }, ensure_ascii=False)
+
+    def _fill_full(self, js_data, current_id):
+        """Полный список: все группы и плоский список."""
+        grouped_dialogs = self.dialog_service.grouper.get_dialog_list_with_groups(current_id)
+        js_data["groups"] = {}
+        js_data["flat"] = []
+        for group_name, dialogs in grouped_dialogs.items():
+            group_dialogs = [_js_dialog(d, d['is_current']) for d in dialogs]
+            js_data["groups"][group_name] = group_dialogs
+            js_data["flat"].extend(group_dialogs)
+
+    def _build_diff(self, changes, current_id, today):
+        """
+        Разница по изменившимся диалогам: удалённые и вставленные/обновлённые.
+        Для каждого обновлённого указаны группа и следующий за ним диалог группы;
+        обновления идут с конца списка, чтобы соседи уже стояли на местах.
+        """
+        index = self.dialog_service.index
+        grouper = self.dialog_service.grouper
+        removed = []
+        upserted = []
+        for dialog_id in changes:
+            location = grouper.locate(dialog_id, today)
+            if location is None:
+                removed.append(dialog_id)
+                continue
+            group, before, order_key = location
+            js_dialog = _js_dialog(index.row(dialog_id), dialog_id == current_id)
+            js_dialog["group"] = group
+            js_dialog["before"] = before
+            upserted.append((order_key, js_dialog))
+        upserted.sort(key=lambda item: item[0], reverse=True)
+        return {"removed": removed, "upserted": [js_dialog for _, js_dialog in upserted]}
+
+    def search_chats(self, query: str) -> str:
+        """Результаты поиска по чатам для боковой панели (JSON)."""
+        query = (query or "").strip()
+        try:
+            results = self.dialog_service.search_dialogs(query) if query else []
+        except Exception as e:
+            self.logger.error("Ошибка поиска по чатам: %s", e)
+            results = []
+        return json.dumps({
+            "query": query,
+            "results": [
+                {
+                    "id": r["dialog_id"],
+                    "name": r["name"].replace('\n', ' ').replace('\r', ' '),
+                    "name_match": r["name_match"],
+                    "snippet": r["snippet"],
+                    "role": r["role"],
+                    "timestamp": r["timestamp"],
+                    "matches": r["matches"],
+                }
+                for r in results
+            ]
+        }, ensure_ascii=False)
@@ -55,7 +55,7 @@ class ChatOperationsHandler(BaseHandler):
             # 1. Поиск существующего пустого чата с автоименем, не равного текущему
             empty_auto_chat = None
             for dialog in self.dialog_service.dialogs.values():
-                if len(dialog.history) == 0:
+                if dialog.message_count == 0:
                     auto_name = f"{default_name} {dialog.id}"
                     if dialog.name == auto_name and dialog.id != current.id:
                         empty_auto_chat = dialog
@@ -71,7 +71,7 @@ class ChatOperationsHandler(BaseHandler):
                 return history, "", empty_auto_chat.id, "", chat_list_data, empty_auto_chat.id
 
             # 2. Если текущий диалог пуст и имеет автосгенерированное имя – не создаём новый
-            if current and len(current.history) == 0:
+            if current and current.message_count == 0:
                 auto_name = f"{default_name} {current.id}"
                 if current.name == auto_name:
                     history = current.to_ui_format()
@@ -122,6 +122,11 @@ class CommandHandler(BaseHandler):
     def handle_search_toggle(self, command: str):
         return self._toggle_bool_setting({"search_enabled": None})
 
+    def handle_chat_list_resync(self, command: str):
+        """Полный список чатов для клиента, у которого разошлась версия списка."""
+        history, chat_id = self._current_history_and_id()
+        return history, chat_id, self.get_chat_list_data(scroll_target='none', full=True)
+
     def handle_settings_apply(self, command: str):
         """Формат: settings:apply:{"max_tokens":2048,"temperature":0.8}"""
         try:
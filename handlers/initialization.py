@@ -14,7 +14,7 @@ class InitializationHandler(BaseHandler):
 
             dialog = self.dialog_service.get_dialog(chat_id)
             history = dialog.to_ui_format() if dialog else []
-            chat_list_data = self.get_chat_list_data(scroll_target='top')
+            chat_list_data = self.get_chat_list_data(scroll_target='top', full=True)
 
             from handlers.mediator import _build_settings_json
             settings_json = _build_settings_json()
@@ -58,6 +58,7 @@ class UIMediator:
         self._init_handler = InitializationHandler()
         self._message_handler = MessageHandler()
         self.register("get_chat_list_data", self._chat_list_handler.get_chat_list_data)
+        self.register("search_chats", self._chat_list_handler.search_chats)
         self.register("handle_chat_selection", self._handle_chat_selection)
         self.register("create_chat", self._chat_ops_handler.create_chat_with_js_handler)
         self.register("send_message_stream", self._message_handler.send_message_stream_handler)
@@ -101,6 +102,8 @@ class UIMediator:
                 history = current_dialog.to_ui_format() if current_dialog else []
                 new_id = current_dialog.id if current_dialog else ""
             return history, new_id, chat_list_data
+        elif chat_id.startswith('chatlist:resync'):
+            return self._command_handler.handle_chat_list_resync(chat_id)
         elif chat_id.startswith('settings:apply:'):
             return self._command_handler.handle_settings_apply(chat_id)
         else:
@@ -119,6 +122,9 @@ class UIMediator:
         async for result in self.dispatch("send_message_stream", prompt, chat_id, max_tokens, temperature, search_enabled):
             yield result
 
+    def search_chats_handler(self, query: str):
+        return self.dispatch("search_chats", query)
+
     def init_app_handler(self):
         return self.dispatch("init_app")
 
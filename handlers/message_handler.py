@@ -8,6 +8,7 @@ from .base import BaseHandler
 from services.user_config_service import user_config_service
 from models.enums import MessageRole
 from services.model.thinking_handler import ThinkingHandler
+from services.tracing import tracer
 
 
 class MessageHandler(BaseHandler):
@@ -40,35 +41,35 @@ class MessageHandler(BaseHandler):
     # Приватные хелперы
     # ──────────────────────────────────────────────
 
-    def _normalize_and_save(self, dialog_id: str, thinking_seconds: float = None,
-                            thinking_stopped: bool = False) -> Optional[List[dict]]:
+    async def _normalize_and_save(self, dialog_id: str, thinking_seconds: float = None,
+                                  thinking_stopped: bool = False) -> Optional[List[dict]]:
         """
         Нормализует последнее сообщение ассистента для хранения.
         Перезаписывает последнюю строку history_*.jsonl с обновлённым контентом.
         Возвращает обновлённый UI-формат если контент изменился, иначе None.
         """
-        dialog = self.dialog_service.get_dialog(dialog_id)
-        if not (dialog and dialog.history and dialog.history[-1].role == MessageRole.ASSISTANT):
+        dialog = await self.dialog_service.get_dialog_async(dialog_id)
+        if not (dialog and dialog.history and dialog.history.role(-1) == MessageRole.ASSISTANT):
             return None
 
-        msg = dialog.history[-1]
+        content = dialog.history.content(-1)
         normalized = ThinkingHandler.normalize_for_storage(
-            msg.content, thinking_seconds, stopped=thinking_stopped
+            content, thinking_seconds, stopped=thinking_stopped
         )
-        if normalized == msg.content:
+        if normalized == content:
             return None
 
-        msg.content = normalized
+        dialog.replace_last_content(normalized)
         self.dialog_service.storage.rewrite_last_message(dialog)
         return dialog.to_ui_format()
 
     async def _log_generation_speed_async(self, dialog_id: str, start_time: float) -> None:
         """Логирует скорость генерации асинхронно (tokenizer.encode в thread pool)."""
-        dialog = self.dialog_service.get_dialog(dialog_id)
-        if not (dialog and dialog.history and dialog.history[-1].role == MessageRole.ASSISTANT):
+        dialog = await self.dialog_service.get_dialog_async(dialog_id)
+        if not (dialog and dialog.history and dialog.history.role(-1) == MessageRole.ASSISTANT):
             return
 
-        final_text = dialog.history[-1].content
+        final_text = dialog.history.content(-1)
         elapsed = time.time() - start_time
         if elapsed <= 0:
             return
@@ -124,9 +125,6 @@ class MessageHandler(BaseHandler):
             enable_thinking = user_config.generation.enable_thinking or False
             search_enabled = user_config.search_enabled or False
 
-            dialog = self.dialog_service.get_dialog(chat_id) if chat_id else None
-            total_context_chars = len(dialog.get_context_for_generation()) if dialog else 0
-
             start_time = time.time()
             first_token_received = False
             thinking_start_time: Optional[float] = None
@@ -171,7 +169,7 @@ class MessageHandler(BaseHandler):
                             and last.get('content', '').strip():
                         self.logger.stats(
                             "⚡ TTFT: %.3f сек, контекст: %d символов",
-                            time.time() - start_time, total_context_chars,
+                            time.time() - start_time, self.chat_service.get_context_chars(dialog_id_out),
                         )
                         first_token_received = True
 
@@ -188,9 +186,11 @@ class MessageHandler(BaseHandler):
 
             if final_dialog_id:
                 # Логируем скорость асинхронно (tokenizer в thread pool)
-                await self._log_generation_speed_async(final_dialog_id, start_time)
+                with tracer.span("log_generation_speed"):
+                    await self._log_generation_speed_async(final_dialog_id, start_time)
                 # _normalize_and_save — no-op для non-thinking, disk IO для thinking
-                updated = self._normalize_and_save(final_dialog_id, thinking_seconds, thinking_stopped)
+                with tracer.span("normalize_and_save"):
+                    updated = await self._normalize_and_save(final_dialog_id, thinking_seconds, thinking_stopped)
                 if updated:
                     yield updated, "", final_dialog_id, final_chat_list_data, ""
 
@@ -199,8 +199,8 @@ class MessageHandler(BaseHandler):
             history = []
             try:
                 if chat_id:
-                    self._normalize_and_save(chat_id)
-                    dialog = self.dialog_service.get_dialog(chat_id)
+                    await self._normalize_and_save(chat_id)
+                    dialog = await self.dialog_service.get_dialog_async(chat_id)
                     history = dialog.to_ui_format() if dialog else []
             except Exception as inner_e:
                 self.logger.error("Ошибка при восстановлении после сбоя: %s", inner_e)
@@ -0,0 +1,94 @@
+# migrate_storage.py
+"""
+Однократный перенос диалогов между движками хранения.
+
+Копирует метаданные, историю сообщений и состояние контекста всех диалогов
+из одного движка в другой (files ↔ sqlite). Файлы индекса памяти лежат в
+папках chat_* и не переносятся — оба движка используют одну и ту же save_dir.
+
+Пример:
+    python migrate_storage.py --to sqlite
+    python migrate_storage.py --from sqlite --to files --overwrite
+После переноса укажите dialogs.storage_engine в config/app_config.yaml.
+"""
+import argparse
+import sys
+import time
+
+import services  # noqa: F401
+from container import container
+from services.storage import STORAGE_ENGINES, create_storage_backend
+
+
+def migrate(source, target, overwrite: bool = False) -> dict:
+    """Переносит все диалоги из source в target, возвращает счётчики."""
+    stats = {"dialogs": 0, "messages": 0, "context_states": 0, "skipped": 0}
+    existing = target.load_dialogs()
+
+    for dialog_id, dialog in sorted(source.load_dialogs().items(), key=lambda item: int(item[0])):
+        if dialog_id in existing:
+            if not overwrite:
+                print(f"   ⏭️  Диалог {dialog_id} уже есть в целевом хранилище, пропуск")
+                stats["skipped"] += 1
+                continue
+            target.delete_dialog_folder(existing[dialog_id])
+
+        source.load_history(dialog)
+        messages = list(dialog.history)
+
+        # Сообщения дописываются по одному, как при обычной работе,
+        # поэтому метаданные сохраняются с пустой историей
+        dialog.set_loaded_history([])
+        target.save_dialog(dialog)
+        for message in messages:
+            dialog.history.append(message)
+            target.append_message(dialog, message)
+
+        state = source.load_context_state(dialog)
+        if state is not None and target.save_context_state(dialog, state):
+            stats["context_states"] += 1
+
+        stats["dialogs"] += 1
+        stats["messages"] += len(messages)
+
+    return stats
+
+
+def main():
+    dialogs_config = container.get_config().get("dialogs", {})
+
+    parser = argparse.ArgumentParser(description="Перенос диалогов между движками хранения")
+    parser.add_argument("--from", dest="source", choices=STORAGE_ENGINES, default="files")
+    parser.add_argument("--to", dest="target", choices=STORAGE_ENGINES, default="sqlite")
+    parser.add_argument("--save-dir", default=dialogs_config.get("save_dir", "saved_dialogs"))
+    parser.add_argument("--sqlite-path", default=dialogs_config.get("sqlite_path"))
+    parser.add_argument("--overwrite", action="store_true",
+                        help="перезаписать диалоги, уже существующие в целевом хранилище")
+    args = parser.parse_args()
+
+    if args.source == args.target:
+        print("❌ Исходный и целевой движки совпадают")
+        return 1
+
+    config = dict(dialogs_config, save_dir=args.save_dir, sqlite_path=args.sqlite_path)
+    source = create_storage_backend(config, args.source)
+    target = create_storage_backend(config, args.target)
+
+    print(f"🚚 Перенос диалогов: {args.source} → {args.target} ({args.save_dir})")
+    started = time.perf_counter()
+    try:
+        stats = migrate(source, target, overwrite=args.overwrite)
+    finally:
+        source.close()
+        target.close()
+
+    print(
+        f"✅ Перенесено диалогов: {stats['dialogs']}, сообщений: {stats['messages']}, "
+        f"состояний контекста: {stats['context_states']}, пропущено: {stats['skipped']} "
+        f"за {time.perf_counter() - started:.2f} с"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
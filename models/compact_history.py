@@ -0,0 +1,165 @@
+# models/compact_history.py
+"""
+Компактное хранение истории сообщений диалога.
+
+Вместо списка pydantic-объектов Message история хранится параллельными
+массивами: роли (uint8), метки времени (int64, микросекунды от эпохи) и
+таблица строк содержимого. Строки не перекодируются, поэтому кэш формата
+UI ссылается на те же объекты, а не держит копии. Объекты Message
+создаются только на границах API (индексация, итерация), а для передачи
+модели используется лёгкое представление HistoryModelView.
+"""
+from array import array
+from datetime import datetime, timedelta
+from typing import Iterable, Iterator, List, Sequence, Tuple, Union
+
+from .enums import MessageRole
+from .message import Message
+
+
+_ROLES: Tuple[MessageRole, ...] = (MessageRole.USER, MessageRole.ASSISTANT, MessageRole.SYSTEM)
+_ROLE_CODES = {role: code for code, role in enumerate(_ROLES)}
+_ROLE_VALUE_CODES = {role.value: code for code, role in enumerate(_ROLES)}
+
+# Наивная эпоха: метки времени в истории хранятся без часового пояса
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def _to_micros(timestamp: datetime) -> int:
+    return (timestamp - _EPOCH) // _MICROSECOND
+
+
+def _from_micros(micros: int) -> datetime:
+    return _EPOCH + timedelta(microseconds=micros)
+
+
+class CompactHistory:
+    """История сообщений на параллельных массивах."""
+
+    __slots__ = ("_roles", "_timestamps", "_contents")
+
+    def __init__(self, messages: Iterable[Message] = ()):
+        self._roles = array("B")
+        self._timestamps = array("q")
+        self._contents: List[str] = []
+        for message in messages:
+            self.append(message)
+
+    @classmethod
+    def coerce(cls, value) -> "CompactHistory":
+        """Приводит список Message/словарей к CompactHistory."""
+        if isinstance(value, CompactHistory):
+            return value
+        history = cls()
+        for item in value or ():
+            if isinstance(item, Message):
+                history.append(item)
+            else:
+                timestamp = item.get("timestamp")
+                if isinstance(timestamp, str):
+                    timestamp = datetime.fromisoformat(timestamp)
+                history.append_raw(item["role"], item["content"], timestamp or datetime.now())
+        return history
+
+    # ========== Добавление и изменение ==========
+
+    def append(self, message: Message):
+        self.append_raw(message.role, message.content, message.timestamp)
+
+    def append_raw(self, role: Union[MessageRole, str], content: str, timestamp: datetime):
+        """Добавляет сообщение без создания объекта Message (загрузка с диска)."""
+        code = _ROLE_CODES.get(role)
+        if code is None:
+            code = _ROLE_VALUE_CODES[role]
+        self._roles.append(code)
+        self._timestamps.append(_to_micros(timestamp))
+        self._contents.append(content)
+
+    def replace_last_content(self, content: str):
+        """Заменяет содержимое последнего сообщения."""
+        if not self._roles:
+            raise IndexError("история пуста")
+        self._contents[-1] = content
+
+    def clear(self):
+        self._roles = array("B")
+        self._timestamps = array("q")
+        self._contents = []
+
+    # ========== Доступ без создания Message ==========
+
+    def role(self, index: int) -> MessageRole:
+        return _ROLES[self._roles[index]]
+
+    def content(self, index: int) -> str:
+        return self._contents[index]
+
+    def timestamp(self, index: int) -> datetime:
+        return _from_micros(self._timestamps[index])
+
+    def iter_roles(self) -> Iterator[MessageRole]:
+        for code in self._roles:
+            yield _ROLES[code]
+
+    def iter_pairs(self) -> Iterator[Tuple[MessageRole, str]]:
+        """(роль, содержимое) для каждого сообщения."""
+        for code, content in zip(self._roles, self._contents):
+            yield _ROLES[code], content
+
+    @property
+    def nbytes(self) -> int:
+        """Оценка объёма истории в памяти (строки считаются по длине в символах)."""
+        return (
+            sum(len(content) for content in self._contents)
+            + self._roles.itemsize * len(self._roles)
+            + self._timestamps.itemsize * len(self._timestamps)
+            + 8 * len(self._contents)
+        )
+
+    # ========== Интерфейс последовательности Message ==========
+
+    def __len__(self) -> int:
+        return len(self._roles)
+
+    def __bool__(self) -> bool:
+        return len(self._roles) > 0
+
+    def _materialize(self, index: int) -> Message:
+        return Message(role=self.role(index), content=self.content(index), timestamp=self.timestamp(index))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._materialize(i) for i in range(len(self._roles))[index]]
+        return self._materialize(range(len(self._roles))[index])
+
+    def __iter__(self) -> Iterator[Message]:
+        for i in range(len(self._roles)):
+            yield self._materialize(i)
+
+    def __repr__(self) -> str:
+        return f"CompactHistory(messages={len(self)}, bytes={self.nbytes})"
+
+
+class HistoryModelView(Sequence):
+    """Представление истории в формате модели: словари создаются по требованию."""
+
+    __slots__ = ("_history",)
+
+    def __init__(self, history: CompactHistory):
+        self._history = history
+
+    def __len__(self) -> int:
+        return len(self._history)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(len(self._history))[index]]
+        return {"role": self._history.role(index).value, "content": self._history.content(index)}
+
+    def __iter__(self) -> Iterator[dict]:
+        for role, content in self._history.iter_pairs():
+            yield {"role": role.value, "content": content}
+
+    def to_list(self) -> List[dict]:
+        return list(self)
@@ -1,11 +1,12 @@
 # models/context/__init__.py
-from .enums import ChunkType
+from .enums import ChunkType, ContextSection
 from .chunk import InteractionChunk, L2SummaryBlock
 from .cumulative import CumulativeContext
 from .state import DialogContextState
 
 __all__ = [
     'ChunkType',
+    'ContextSection',
     'InteractionChunk',
     'L2SummaryBlock',
     'CumulativeContext',
@@ -1,11 +1,18 @@
 # models/context/cumulative.py
 from pydantic import BaseModel, Field, ConfigDict
 from datetime import datetime
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
+import uuid
 
 from .chunk import L2SummaryBlock
 
 
+CUMULATIVE_HEADER = "# Кумулятивный контекст (история обсуждения):\n"
+
+# Уровень блоков, полученных напрямую из L2 суммаризации
+BASE_BLOCK_LEVEL = 2
+
+
 class CumulativeContext(BaseModel):
     """Кумулятивная строка P с блоками суммаризации"""
     
@@ -18,9 +25,21 @@ class CumulativeContext(BaseModel):
     total_chars: int = Field(default=0, description="Общее количество символов")
     last_updated: datetime = Field(default_factory=datetime.now, description="Время последнего обновления")
     
+    @staticmethod
+    def render_block(block_id: str, summary: str, level: int = BASE_BLOCK_LEVEL) -> str:
+        """Возвращает текстовое представление блока в кумулятивной строке"""
+        if level > BASE_BLOCK_LEVEL:
+            return f"<sum_block id='{block_id}' level='{level}'>\n{summary}\n</sum_block>\n\n"
+        return f"<sum_block id='{block_id}'>\n{summary}\n</sum_block>\n\n"
+    
+    @staticmethod
+    def block_level(block: Dict[str, Any]) -> int:
+        """Уровень блока (для блоков, сохранённых до появления уровней, — L2)"""
+        return block.get('level', BASE_BLOCK_LEVEL)
+    
     def add_block(self, l2_block: L2SummaryBlock):
         """Добавляет блок L2 в кумулятивную строку"""
-        block_text = f"<sum_block id='{l2_block.id}'>\n{l2_block.summary}\n</sum_block>\n\n"
+        block_text = self.render_block(l2_block.id, l2_block.summary)
         self.content += block_text
         self.total_chars += len(block_text)
         self.blocks.append({
@@ -30,15 +49,88 @@ class CumulativeContext(BaseModel):
             'summary_chars': l2_block.summary_char_count,
             'original_chars': l2_block.original_char_count,
             'compression_ratio': l2_block.compression_ratio,
-            'added_at': datetime.now().isoformat()
+            'added_at': datetime.now().isoformat(),
+            'level': BASE_BLOCK_LEVEL,
+            'children': []
         })
         self.last_updated = datetime.now()
     
+    def select_compaction_candidates(self, fanout: int = 2) -> List[Dict[str, Any]]:
+        """
+        Выбирает старейшие блоки для слияния в блок более высокого уровня.
+        
+        Блоки упорядочены хронологически, и уровни не возрастают от старых к новым.
+        Сливаются fanout старейших блоков самого низкого уровня, у которого их
+        набралось достаточно (как перенос разряда в двоичном счётчике), поэтому
+        число блоков растёт логарифмически от длины диалога. Если такого уровня
+        нет, сливаются fanout старейших блоков независимо от уровня.
+        """
+        fanout = max(2, fanout)
+        if len(self.blocks) < fanout:
+            return []
+        
+        levels = sorted({self.block_level(b) for b in self.blocks})
+        for level in levels:
+            same_level = [b for b in self.blocks if self.block_level(b) == level]
+            if len(same_level) >= fanout:
+                return same_level[:fanout]
+        return self.blocks[:fanout]
+    
+    def merge_blocks(self, block_ids: List[str], summary: str) -> Optional[Dict[str, Any]]:
+        """
+        Заменяет блоки block_ids одним блоком более высокого уровня.
+        
+        Родословная сохраняется: новый блок хранит ID поглощённых блоков
+        (children) и объединённый список исходных чанков L1 (chunk_ids).
+        """
+        merged = [b for b in self.blocks if b['id'] in block_ids]
+        if len(merged) != len(block_ids):
+            # Блоки изменились, пока шла суммаризация
+            return None
+        
+        original_chars = sum(b.get('original_chars', 0) for b in merged)
+        new_block = {
+            'id': uuid.uuid4().hex[:16],
+            'chunk_ids': [cid for b in merged for cid in b.get('chunk_ids', [])],
+            'summary': summary,
+            'summary_chars': len(summary),
+            'original_chars': original_chars,
+            'compression_ratio': original_chars / max(len(summary), 1),
+            'added_at': datetime.now().isoformat(),
+            'level': max(self.block_level(b) for b in merged) + 1,
+            'children': [b['id'] for b in merged]
+        }
+        
+        position = self.blocks.index(merged[0])
+        remaining = [b for b in self.blocks if b['id'] not in block_ids]
+        remaining.insert(position, new_block)
+        self.blocks = remaining
+        self._rebuild_content()
+        return new_block
+    
+    def _rebuild_content(self):
+        """Пересобирает строку из списка блоков"""
+        self.content = "".join(
+            self.render_block(b['id'], b['summary'], self.block_level(b)) for b in self.blocks
+        )
+        self.total_chars = len(self.content)
+        self.last_updated = datetime.now()
+    
+    def get_level_sizes(self) -> Dict[str, Dict[str, int]]:
+        """Возвращает количество блоков и символов по уровням"""
+        sizes: Dict[str, Dict[str, int]] = {}
+        for block in self.blocks:
+            level = f"l{self.block_level(block)}"
+            entry = sizes.setdefault(level, {'blocks': 0, 'chars': 0})
+            entry['blocks'] += 1
+            entry['chars'] += block.get('summary_chars', len(block.get('summary', '')))
+        return sizes
+    
     def get_formatted(self) -> str:
         """Возвращает отформатированную кумулятивную строку"""
         if not self.content:
             return ""
-        return f"# Кумулятивный контекст (история обсуждения):\n{self.content}"
+        return f"{CUMULATIVE_HEADER}{self.content}"
     
     def model_dump_jsonable(self) -> dict:
         """Возвращает словарь, пригодный для JSON сериализации"""
@@ -6,4 +6,12 @@ class ChunkType(str, Enum):
     RAW = "raw"                 # Сырое взаимодействие
     L1_SUMMARY = "l1_summary"   # Суммаризация первого уровня
     L2_SUMMARY = "l2_summary"   # Суммаризация второго уровня
-    CUMULATIVE = "cumulative"   # Кумулятивная строка
\ No newline at end of file
+    L3_SUMMARY = "l3_summary"   # Слияние блоков кумулятивной строки (третий уровень и выше)
+    CUMULATIVE = "cumulative"   # Кумулятивная строка
+
+
+class ContextSection(str, Enum):
+    """Секции итогового контекста, версионируемые независимо"""
+    CUMULATIVE = "cumulative"   # Кумулятивная строка (блоки L2)
+    L1 = "l1"                   # Конспекты L1
+    RAW_TAIL = "raw_tail"       # Сырой хвост
@@ -2,10 +2,8 @@
 from pydantic import BaseModel, Field, ConfigDict, PrivateAttr
 from datetime import datetime
 from typing import List, Dict, Any, Optional
-import hashlib
-import json
 
-from .enums import ChunkType
+from .enums import ChunkType, ContextSection
 from .chunk import InteractionChunk, L2SummaryBlock
 from .cumulative import CumulativeContext
 
@@ -20,6 +18,7 @@ class DialogContextState(BaseModel):
     # Сырой хвост (последние n символов) - ЕДИНСТВЕННОЕ место, где хранится несуммаризованный текст
     raw_tail: str = Field(default="", description="Сырые последние сообщения")
     raw_tail_char_limit: int = Field(default=2000, description="Лимит символов для сырого хвоста")
+    raw_tail_token_count: int = Field(default=0, description="Число токенов в сыром хвосте")
     
     # Чанки первого уровня (только суммаризации)
     l1_chunks: List[InteractionChunk] = Field(default_factory=list, description="Чанки суммаризации L1")
@@ -39,10 +38,15 @@ class DialogContextState(BaseModel):
     total_characters_processed: int = Field(default=0, description="Всего обработано символов")
     total_summarizations_l1: int = Field(default=0, description="Всего L1 суммаризаций")
     total_summarizations_l2: int = Field(default=0, description="Всего L2 суммаризаций")
+    total_summarizations_l3: int = Field(default=0, description="Всего слияний блоков кумулятивной строки")
     last_summarization_time: Optional[datetime] = Field(default=None, description="Время последней суммаризации")
     
-    # Приватное поле для кэширования хэша состояния
-    _hash: Optional[str] = PrivateAttr(default=None)
+    # Версии состояния: общая и по секциям. Растут монотонно при каждой мутации,
+    # не сериализуются (после загрузки отсчёт начинается заново).
+    _version: int = PrivateAttr(default=0)
+    _section_versions: Dict[str, int] = PrivateAttr(
+        default_factory=lambda: {section.value: 0 for section in ContextSection}
+    )
     
     def get_stats(self) -> Dict[str, Any]:
         """Возвращает статистику контекста"""
@@ -51,10 +55,14 @@ class DialogContextState(BaseModel):
             'total_characters_processed': self.total_characters_processed,
             'total_summarizations_l1': self.total_summarizations_l1,
             'total_summarizations_l2': self.total_summarizations_l2,
+            'total_summarizations_l3': self.total_summarizations_l3,
             'current_raw_tail_chars': len(self.raw_tail),
+            'current_raw_tail_tokens': self.raw_tail_token_count,
             'current_l1_chunks': len(self.l1_chunks),
             'current_l2_blocks': len(self.l2_blocks),
             'cumulative_chars': self.cumulative_context.total_chars,
+            'cumulative_blocks': len(self.cumulative_context.blocks),
+            'cumulative_levels': self.cumulative_context.get_level_sizes(),
             'compression_ratio_overall': self.total_characters_processed / max(
                 len(self.raw_tail) + 
                 sum(c.summary_char_count for c in self.l1_chunks) + 
@@ -62,19 +70,54 @@ class DialogContextState(BaseModel):
             )
         }
     
-    def get_hash(self) -> str:
-        """Возвращает хэш текущего состояния (вычисляет при необходимости)."""
-        if self._hash is None:
-            # Получаем словарь в JSON-совместимых типах (применяются json_encoders)
-            data = self.model_dump(mode='json')
-            # Сериализуем с сортировкой ключей для детерминизма
-            json_str = json.dumps(data, sort_keys=True)
-            self._hash = hashlib.sha256(json_str.encode('utf-8')).hexdigest()
-        return self._hash
-    
-    def invalidate_hash(self):
-        """Сбрасывает кэшированный хэш (вызывать после любых изменений состояния)."""
-        self._hash = None
+    @property
+    def version(self) -> int:
+        """Общая версия состояния (меняется при любой мутации)."""
+        return self._version
+    
+    def get_section_version(self, section: ContextSection) -> int:
+        """Версия отдельной секции контекста."""
+        return self._section_versions[ContextSection(section).value]
+    
+    def mark_changed(self, *sections: ContextSection):
+        """Отмечает изменение секций (вызывать после прямой мутации полей)."""
+        self._version += 1
+        for section in sections:
+            self._section_versions[ContextSection(section).value] = self._version
+    
+    # ===== Мутаторы, поддерживающие версии секций =====
+    
+    def append_raw_tail(self, text: str, token_count: int = 0):
+        """Дописывает текст в сырой хвост."""
+        self.raw_tail += text
+        self.raw_tail_token_count += token_count
+        self.mark_changed(ContextSection.RAW_TAIL)
+    
+    def trim_raw_tail(self, char_count: int, token_count: int = 0):
+        """Удаляет первые char_count символов из сырого хвоста."""
+        self.raw_tail = self.raw_tail[char_count:]
+        self.raw_tail_token_count = max(0, self.raw_tail_token_count - token_count)
+        self.mark_changed(ContextSection.RAW_TAIL)
+    
+    def add_l1_chunk(self, chunk: InteractionChunk):
+        """Добавляет чанк L1."""
+        self.l1_chunks.append(chunk)
+        self.mark_changed(ContextSection.L1)
+    
+    def apply_l2_block(self, l2_block: L2SummaryBlock, l1_chunk_ids: List[str]):
+        """Добавляет блок L2 в кумулятивную строку и удаляет поглощённые чанки L1."""
+        self.cumulative_context.add_block(l2_block)
+        self.l1_chunks = [c for c in self.l1_chunks if c.id not in l1_chunk_ids]
+        self.l2_blocks.append(l2_block)
+        self.mark_changed(ContextSection.CUMULATIVE, ContextSection.L1)
+    
+    def apply_compaction(self, block_ids: List[str], summary: str) -> bool:
+        """Сливает блоки кумулятивной строки в один блок более высокого уровня."""
+        merged = self.cumulative_context.merge_blocks(block_ids, summary)
+        if merged is None:
+            return False
+        self.mark_changed(ContextSection.CUMULATIVE)
+        return True
     
     def model_dump_jsonable(self) -> dict:
         """Возвращает словарь, пригодный для JSON сериализации"""
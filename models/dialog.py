@@ -1,12 +1,16 @@
 # models/dialog.py (изменения в модели Dialog)
-from pydantic import BaseModel, Field, ConfigDict, PrivateAttr, model_serializer
+from pydantic import BaseModel, Field, ConfigDict, PrivateAttr, field_validator
 from datetime import datetime
-from typing import List, Optional, Dict, Any
+from typing import Callable, Iterable, List, Optional, Dict, Any, Union
 
 from .enums import MessageRole
 from .message import Message
+from .compact_history import CompactHistory, HistoryModelView
 from services.model.thinking_handler import ThinkingHandler
 
+# Поля, от которых зависят порядок и вид диалога в списке боковой панели
+_LISTED_FIELDS = frozenset({"name", "updated", "pinned", "pinned_position", "visible"})
+
 
 class Dialog(BaseModel):
     """Модель диалога с кэшированием формата для UI и для модели (инкрементальное обновление)"""
@@ -20,7 +24,7 @@ class Dialog(BaseModel):
 
     id: str
     name: str
-    history: List[Message] = []
+    history: CompactHistory = Field(default_factory=CompactHistory)
     created: datetime = Field(default_factory=datetime.now)
     updated: datetime = Field(default_factory=datetime.now)
     status: str = "active"
@@ -32,22 +36,67 @@ class Dialog(BaseModel):
     _ui_cache: Optional[List[Dict[str, str]]] = PrivateAttr(default=None)
     _ui_cache_version: int = PrivateAttr(default=-1)
 
-    # Приватные поля для кэширования формата модели
-    _model_cache: Optional[List[Dict[str, str]]] = PrivateAttr(default=None)
-    _model_cache_version: int = PrivateAttr(default=-1)
-
     # Счётчик версий истории (увеличивается при любом изменении)
     _history_version: int = PrivateAttr(default=0)
 
+    # Ленивая загрузка истории: при старте диалоги создаются из индекса метаданных,
+    # история подгружается при первом обращении через DialogManager
+    _history_loaded: bool = PrivateAttr(default=True)
+    _stored_message_count: int = PrivateAttr(default=0)
+
+    # Подписчик на изменения полей списка (индекс диалогов DialogManager)
+    _change_listener: Optional[Callable[["Dialog"], None]] = PrivateAttr(default=None)
+
+    @field_validator("history", mode="before")
+    @classmethod
+    def _coerce_history(cls, value):
+        return CompactHistory.coerce(value)
+
     def model_post_init(self, __context):
         """Инициализация после создания модели (в т.ч. при загрузке из json)."""
         self._history_version = len(self.history)
         self._invalidate_caches()
 
+    def __setattr__(self, name, value):
+        super().__setattr__(name, value)
+        if name in _LISTED_FIELDS and self._change_listener is not None:
+            self._change_listener(self)
+
+    def set_change_listener(self, listener: Optional[Callable[["Dialog"], None]]):
+        """Подписывает индекс списка диалогов на изменения имени, дат, закрепления и видимости."""
+        self._change_listener = listener
+
     def _invalidate_caches(self):
         """Сбрасывает все кэши."""
         self._ui_cache = None
-        self._model_cache = None
+
+    # ========== ЛЕНИВАЯ ЗАГРУЗКА ИСТОРИИ ==========
+
+    @property
+    def is_history_loaded(self) -> bool:
+        return self._history_loaded
+
+    @property
+    def message_count(self) -> int:
+        """Количество сообщений (без загрузки истории)."""
+        if self._history_loaded:
+            return len(self.history)
+        return self._stored_message_count
+
+    def mark_history_unloaded(self, message_count: int):
+        """Помечает историю как не загруженную (известно только число сообщений)."""
+        self.history = CompactHistory()
+        self._history_loaded = False
+        self._stored_message_count = message_count
+        self._invalidate_caches()
+
+    def set_loaded_history(self, messages: Union[CompactHistory, Iterable[Message]]):
+        """Подставляет загруженную с диска историю."""
+        self.history = CompactHistory.coerce(messages)
+        self._history_loaded = True
+        self._stored_message_count = len(messages)
+        self._history_version += 1
+        self._invalidate_caches()
 
     def mark_visible(self):
         """Делает диалог видимым в списке (после первого сообщения)."""
@@ -63,8 +112,8 @@ class Dialog(BaseModel):
         from services.context.factory import ContextManagerFactory
         return ContextManagerFactory.get_for_dialog(self)
 
-    def get_context_for_generation(self) -> str:
-        return self.context_manager.get_context_for_generation()
+    def get_context_for_generation(self, query: Optional[str] = None) -> str:
+        return self.context_manager.get_context_for_generation(query)
 
     def add_interaction_to_context(self, user_message: str, assistant_message: str):
         self.context_manager.add_interaction(user_message, assistant_message)
@@ -79,27 +128,18 @@ class Dialog(BaseModel):
             return self._ui_cache
 
         formatted = []
-        for msg in self.history:
-            content = msg.content
-            if msg.role == MessageRole.ASSISTANT:
+        for role, content in self.history.iter_pairs():
+            if role == MessageRole.ASSISTANT:
                 content = ThinkingHandler.format_for_ui(content)
-            formatted.append({"role": msg.role.value, "content": content})
+            formatted.append({"role": role.value, "content": content})
 
         self._ui_cache = formatted
         self._ui_cache_version = self._history_version
         return formatted
 
-    def to_model_format(self) -> List[Dict[str, str]]:
-        if self._model_cache is not None and self._model_cache_version == self._history_version:
-            return self._model_cache
-
-        formatted = [
-            {"role": msg.role.value, "content": msg.content}
-            for msg in self.history
-        ]
-        self._model_cache = formatted
-        self._model_cache_version = self._history_version
-        return formatted
+    def to_model_format(self) -> HistoryModelView:
+        """Лёгкое представление истории для модели (без копирования содержимого)."""
+        return HistoryModelView(self.history)
 
     # ========== МЕТОДЫ, ИЗМЕНЯЮЩИЕ ИСТОРИЮ ==========
 
@@ -111,6 +151,12 @@ class Dialog(BaseModel):
         self._history_version += 1
         return message
 
+    def replace_last_content(self, content: str):
+        """Заменяет содержимое последнего сообщения (например, после нормализации)."""
+        self.history.replace_last_content(content)
+        self._history_version += 1
+        self._invalidate_caches()
+
     def clear_history(self):
         self.history.clear()
         self.updated = datetime.now()
@@ -8,6 +8,10 @@ import os
 from container import container
 from ui import create_main_ui
 from services.context.global_manager import global_summary_manager
+from services.context.memory_index import shutdown_indexing
+from services.storage import flush_all as flush_storage
+from services.tracing import tracer
+from services.watchdog import loop_watchdog
 
 
 def cleanup_on_exit():
@@ -17,6 +21,17 @@ def cleanup_on_exit():
         logger.info("👋 Завершение работы")
         # Останавливаем глобальный воркер суммаризации
         global_summary_manager.stop()
+        # Дописываем в индексы памяти уже поставленные фрагменты
+        shutdown_indexing()
+        # Сбрасываем отложенные записи метаданных диалогов
+        flush_storage()
+        # Самые долгие блокировки циклов событий за время работы
+        loop_watchdog.stop()
+        loop_watchdog.log_summary()
+        # Закрываем пул HTTP-соединений поиска, если поиск успел понадобиться
+        search_service = container.get_if_created("search_service")
+        if search_service is not None:
+            search_service.shutdown()
         if hasattr(sys, '_gradio_server'):
             sys._gradio_server.close()
             time.sleep(0.05)
@@ -27,10 +42,67 @@ def cleanup_on_exit():
         try:
             logger = container.get("logger")
             logger.info("✅ Работа приложения завершена")
+            # Сообщения пишутся фоновым потоком — дожидаемся очереди
+            logger.complete()
         except:
             pass
 
 
+class WatchLoopMiddleware:
+    """ASGI-прослойка: при первом запросе ставит цикл событий сервера под наблюдение watchdog."""
+
+    def __init__(self, app):
+        self.app = app
+        self._watching = False
+
+    async def __call__(self, scope, receive, send):
+        if not self._watching:
+            self._watching = True
+            loop_watchdog.watch_running_loop("gradio")
+        await self.app(scope, receive, send)
+
+
+def build_side_routes(config: dict) -> list:
+    """Служебные HTTP-маршруты рядом с интерфейсом Gradio (метрики, трассы, watchdog)."""
+    from starlette.responses import JSONResponse, Response
+    from starlette.routing import Route
+    from services.metrics import metrics, CONTENT_TYPE
+
+    routes = []
+    metrics_config = config.get("metrics", {})
+    if metrics_config.get("enabled", True):
+        async def metrics_endpoint(request):
+            return Response(metrics.render(), media_type=CONTENT_TYPE)
+
+        routes.append(Route(metrics_config.get("path", "/metrics"), metrics_endpoint, methods=["GET"]))
+
+    tracing_config = config.get("tracing", {})
+    if tracing_config.get("enabled", True):
+        async def traces_endpoint(request):
+            # ?request_id=<id> — одна трасса, ?limit=N — последние N
+            request_id = request.query_params.get("request_id")
+            if request_id:
+                trace = tracer.get(request_id)
+                if trace is None:
+                    return JSONResponse({"error": f"трасса {request_id} не найдена"}, status_code=404)
+                traces = [trace]
+            else:
+                limit = request.query_params.get("limit")
+                traces = tracer.recent(int(limit) if limit and limit.isdigit() else None)
+            return JSONResponse(tracer.export_chrome(traces))
+
+        routes.append(Route(tracing_config.get("path", "/traces"), traces_endpoint, methods=["GET"]))
+
+    watchdog_config = config.get("watchdog", {})
+    if watchdog_config.get("enabled", True):
+        async def watchdog_endpoint(request):
+            limit = request.query_params.get("limit")
+            return JSONResponse(loop_watchdog.get_report(int(limit) if limit and limit.isdigit() else None))
+
+        routes.append(Route(watchdog_config.get("path", "/watchdog"), watchdog_endpoint, methods=["GET"]))
+    return routes
+
+
 async def warmup_model_async(model_service, logger):
     """Асинхронный прогрев модели через stream_response."""
     warmup_messages = [{"role": "user", "content": "Привет"}]
@@ -132,7 +204,13 @@ def main():
 
         # Перенастраиваем логгер согласно уровню из конфига
         new_level = app_config.get("logging_level", "ewis")
-        logger.configure(new_level)
+        logger.configure(
+            new_level,
+            enqueue=app_config.get("logging_async", True),
+            json_path=app_config.get("logging_json_path"),
+        )
+        tracer.configure(config.get("tracing", {}))
+        loop_watchdog.configure(config.get("watchdog", {}))
         logger.info("   ✅ Конфигурация загружена успешно")
         logger.info("      Уровень логирования: %s", new_level)
     except Exception as e:
@@ -182,6 +260,12 @@ def main():
         logger.warning("   ⚠️  Модель не загружена — будет загружена при первом запросе")
 
     try:
+        from starlette.middleware import Middleware
+
+        side_routes = build_side_routes(config)
+        for route in side_routes:
+            logger.info("   📈 Служебный маршрут: %s", route.path)
+
         queue_config = config.get("queue", {})
         demo.queue(
             max_size=queue_config.get("max_size", 5),
@@ -194,7 +278,10 @@ def main():
             show_error=server_config.get("show_error", True),
             theme=app_config.get("theme", "soft"),
             css=css_content,
-            head=simple_js
+            head=simple_js,
+            # Маршруты и прослойка передаются в конструктор FastAPI-приложения
+            # Gradio; маршруты проверяются раньше его собственных
+            app_kwargs={"routes": side_routes, "middleware": [Middleware(WatchLoopMiddleware)]},
         )
     except Exception as e:
         logger.error("❌ Ошибка запуска сервера: %s", e)
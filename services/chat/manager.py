@@ -47,3 +47,7 @@ class ChatManager:
             search_enabled=search_enabled,     # ← передаём дальше
         ):
             yield result
+
+    def get_context_chars(self, dialog_id: Optional[str]) -> int:
+        """Размер контекста последней генерации диалога."""
+        return self.stream_processor.get_context_chars(dialog_id)
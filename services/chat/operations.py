@@ -38,7 +38,8 @@ class ChatOperations:
         max_tokens: Optional[int] = None,
         temperature: Optional[float] = None,
         enable_thinking: Optional[bool] = None,
-        stop_event: Optional[threading.Event] = None
+        stop_event: Optional[threading.Event] = None,
+        prefill=None
     ) -> AsyncGenerator[str, None]:  # Изменено: теперь только строка
         """Прокси-метод для stream_response модели."""
         async for chunk in self.model_service.stream_response(
@@ -46,7 +47,8 @@ class ChatOperations:
             max_tokens=max_tokens,
             temperature=temperature,
             enable_thinking=enable_thinking,
-            stop_event=stop_event
+            stop_event=stop_event,
+            prefill=prefill
         ):
             yield chunk
     
@@ -10,6 +10,7 @@ from services.chat.naming_service import ChatNamingService
 from services.chat.naming import is_default_name
 from services.chat.partial_cache import PartialUpdateCache
 from services.chat.core import validate_message, sanitize_user_input
+from services.tracing import tracer
 from container import container
 import re
 
@@ -47,6 +48,8 @@ class MessageStreamProcessor:
         self.cache = PartialUpdateCache()
         self._logger = None
         self._chat_list_handler = None
+        # Размер контекста последней генерации по диалогу (для лога TTFT)
+        self._context_chars: Dict[str, int] = {}
 
     @property
     def logger(self):
@@ -60,6 +63,10 @@ class MessageStreamProcessor:
             self._chat_list_handler = ChatListHandler()
         return self._chat_list_handler.get_chat_list_data(scroll_target=scroll_target)
 
+    def get_context_chars(self, dialog_id: Optional[str]) -> int:
+        """Размер контекста (символы), собранного для последней генерации диалога."""
+        return self._context_chars.get(dialog_id, 0)
+
     def _make_status_history(self, base_history: List[Dict], text: str) -> List[Dict]:
         return list(base_history) + [{"role": MessageRole.ASSISTANT.value, "content": text}]
 
@@ -79,13 +86,17 @@ class MessageStreamProcessor:
             return
 
         prompt = sanitize_user_input(prompt)
-        dialog = self.operations.dialog_service.get_dialog(dialog_id)
+        dialog = await self.operations.dialog_service.get_dialog_async(dialog_id)
         if not dialog:
             yield [], "Диалог не найден", dialog_id, self._get_chat_list_data('today'), ""
             return
 
-        context_str = dialog.get_context_for_generation()
-        self.logger.debug(f"📚 Контекст для генерации: {len(context_str)} символов")
+        with tracer.span("build_context") as span:
+            # В потоке: поиск по индексу памяти строит эмбеддинг запроса (модель под gpu_lock)
+            context_str = await asyncio.to_thread(dialog.get_context_for_generation, query=prompt)
+            span.set(chars=len(context_str))
+        self._context_chars[dialog_id] = len(context_str)
+        self.logger.debug("📚 Контекст для генерации: %d символов", len(context_str))
 
         messages = []
         if context_str:
@@ -99,12 +110,16 @@ class MessageStreamProcessor:
         accumulated_response = ""
         suffix_on_stop = "...<генерация прервана пользователем>"
 
+        prefill = None
         try:
             messages_to_use = messages
             search_cfg = self.config.get("search", {})
             status_cfg = search_cfg.get("status_messages", {})
 
             if search_enabled and search_cfg.get("enabled", False):
+                # Контекст диалога прогоняется через модель, пока идёт поиск
+                prefill = self._start_prefill(messages, enable_thinking, search_cfg)
+
                 deciding_text = status_cfg.get("deciding", "🔍 Анализирую запрос...")
                 if deciding_text:
                     yield (
@@ -112,10 +127,12 @@ class MessageStreamProcessor:
                         deciding_text, dialog_id, initial_chat_list, ""
                     )
 
-                augmented, searched, query = await self._run_search(
-                    prompt=prompt,
-                    formatted_history=messages,
-                )
+                with tracer.span("search") as span:
+                    augmented, searched, query = await self._run_search(
+                        prompt=prompt,
+                        formatted_history=messages,
+                    )
+                    span.set(searched=searched)
 
                 if searched:
                     searching_tpl = status_cfg.get("searching", "🌐 Ищу в сети: {query}")
@@ -139,7 +156,8 @@ class MessageStreamProcessor:
                 max_tokens=max_tokens,
                 temperature=temperature,
                 enable_thinking=enable_thinking,
-                stop_event=stop_event
+                stop_event=stop_event,
+                prefill=prefill
             ):
                 accumulated_response += batch
                 display_text = _collapse_blank_lines(accumulated_response)
@@ -159,7 +177,7 @@ class MessageStreamProcessor:
             # send_message_stream_handler._normalize_and_save вызовет
             # rewrite_last_message и должен найти строку в файле.
             # Без thinking диск не нужен до yield (normalize — no-op), откладываем.
-            updated_dialog = self.operations.dialog_service.get_dialog(dialog_id)
+            updated_dialog = await self.operations.dialog_service.get_dialog_async(dialog_id)
 
             if enable_thinking:
                 self.operations.dialog_service.add_message(
@@ -206,18 +224,21 @@ class MessageStreamProcessor:
             async def background_tasks():
                 if assistant_message_obj is not None:
                     try:
-                        storage = self.operations.dialog_service.storage
-                        if was_not_visible:
-                            storage.save_dialog(updated_dialog)
-                        storage.append_message(updated_dialog, assistant_message_obj)
+                        with tracer.span("background.save_message", track="background"):
+                            storage = self.operations.dialog_service.storage
+                            if was_not_visible:
+                                storage.save_dialog(updated_dialog)
+                            storage.append_message(updated_dialog, assistant_message_obj)
                     except Exception as e:
                         self.logger.error("Ошибка сохранения сообщения: %s", e)
 
                 try:
-                    dialog = self.operations.dialog_service.get_dialog(dialog_id)
-                    if dialog:
-                        dialog.add_interaction_to_context(prompt, final_text)
-                        dialog.save_context_state()
+                    with tracer.span("background.context", track="background"):
+                        dialog = await self.operations.dialog_service.get_dialog_async(dialog_id)
+                        if dialog:
+                            # В потоке: создание менеджера контекста читает его состояние с диска
+                            await asyncio.to_thread(dialog.add_interaction_to_context, prompt, final_text)
+                            dialog.save_context_state()
                 except Exception as e:
                     self.logger.warning("Ошибка при работе с контекстом: %s", e)
 
@@ -228,7 +249,7 @@ class MessageStreamProcessor:
             self.logger.error("❌ Ошибка в process_message_stream: %s", e)
             self.cache.clear(cache_key)
             try:
-                dialog = self.operations.dialog_service.get_dialog(dialog_id)
+                dialog = await self.operations.dialog_service.get_dialog_async(dialog_id)
                 base_history = dialog.to_ui_format() if dialog else []
             except Exception:
                 base_history = []
@@ -237,6 +258,31 @@ class MessageStreamProcessor:
                 "content": f"⚠️ Ошибка: {str(e)[:100]}"
             }]
             yield error_history, "", dialog_id, self._get_chat_list_data('today'), ""
+        finally:
+            # Неиспользованный prefill (ошибка, закрытый генератор) освобождает кэш
+            if prefill is not None:
+                prefill.cancel()
+
+    def _start_prefill(self, messages: List[Dict], enable_thinking: Optional[bool], search_cfg: dict):
+        """
+        Запускает prefill общего префикса промптов с блоком поиска и без него
+        (контекст диалога стоит до блока результатов поиска).
+        """
+        prefill_cfg = search_cfg.get("pipelined_prefill", {})
+        if not prefill_cfg.get("enabled", True):
+            return None
+        try:
+            from services.search.formatter import build_augmented_messages
+            variants = [messages, build_augmented_messages(messages, "…")]
+            return self.operations.model_service.start_prefill(
+                variants,
+                enable_thinking=enable_thinking,
+                step_size=prefill_cfg.get("step_size", 512),
+                min_tokens=prefill_cfg.get("min_tokens", 128),
+            )
+        except Exception as e:
+            self.logger.warning("⚠️ Не удалось запустить prefill: %s", e)
+            return None
 
     async def _run_search(
         self,
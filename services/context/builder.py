@@ -2,46 +2,233 @@
 """
 Построение контекста для генерации из состояния.
 """
-from models.context import DialogContextState
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from models.context import DialogContextState, ContextSection
+from models.context.cumulative import CumulativeContext, CUMULATIVE_HEADER
+from services.context.tokens import token_counter, CHARS_PER_TOKEN_ESTIMATE
+from container import container
+
+
+SYSTEM_INSTRUCTION = """Ты получаешь контекст диалога в нескольких частях:
+
+1. <sum_block>...</sum_block> - кумулятивные суммаризации всего диалога (высший уровень обобщения)
+2. ## Чанк: - конспекты групп сообщений среднего уровня детализации
+3. Последние сообщения - полный текст последней части диалога (максимальная детализация)
+
+Внимательно изучи ВЕСЬ предоставленный контекст перед ответом. Особое внимание уделяй последним сообщениям."""
+
+L1_HEADER = "# Конспекты недавних обсуждений (средний уровень детализации):\n"
+RAW_TAIL_HEADER = "# Последние сообщения (полный текст, максимальная детализация):\n"
+SEPARATOR = "\n" + "="*50 + "\n"
+
+SECTION_ORDER = (ContextSection.CUMULATIVE, ContextSection.L1, ContextSection.RAW_TAIL)
+
+# Граница между взаимодействиями в сыром хвосте
+_INTERACTION_BOUNDARY = re.compile(r"(?<=\n\n)(?=Пользователь:)")
 
 
 class ContextBuilder:
-    """Формирует итоговую строку контекста для передачи модели."""
+    """
+    Формирует итоговую строку контекста для передачи модели.
 
-    @staticmethod
-    def build(state: DialogContextState, history_length: int) -> str:
-        """Собирает контекст из всех уровней суммаризации."""
+    Каждая секция кэшируется вместе с версией, под которой она была собрана,
+    поэтому добавление в raw_tail пересобирает только секцию хвоста.
+    Если задан бюджет в токенах, при его превышении отбрасываются наименее
+    ценные части: старейшие блоки кумулятивной строки, затем старейшие чанки
+    L1, затем начало сырого хвоста.
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        budget_config = (config or {}).get("budget", {})
+        max_prompt_tokens = budget_config.get("max_prompt_tokens", 0)
+        reserved_tokens = budget_config.get("reserved_tokens", 0)
+        self.max_tokens = max(0, max_prompt_tokens - reserved_tokens) if max_prompt_tokens else 0
+
+        self._state_id: Optional[int] = None
+        self._sections: Dict[ContextSection, Tuple[int, str]] = {}
+        self._section_tokens: Dict[ContextSection, Tuple[int, int]] = {}
+        self._assembled_version: Optional[int] = None
+        self._assembled_retrieved: str = ""
+        self._assembled: str = ""
+        self._trimmed_builds = 0
+        self._logger = None
+
+    @property
+    def logger(self):
+        if self._logger is None:
+            self._logger = container.get_logger()
+        return self._logger
+
+    def invalidate(self):
+        """Сбрасывает все кэши (например, после замены состояния)."""
+        self._state_id = None
+        self._sections.clear()
+        self._section_tokens.clear()
+        self._assembled_version = None
+        self._assembled_retrieved = ""
+        self._assembled = ""
+
+    def build(self, state: DialogContextState, history_length: int, retrieved: str = "") -> str:
+        """
+        Собирает контекст из всех уровней суммаризации.
+
+        retrieved — уже отформатированные фрагменты из индекса памяти диалога,
+        вставляются перед сырым хвостом.
+        """
         if history_length < 2:
             return ""
 
-        parts = []
+        if self._state_id != id(state):
+            self.invalidate()
+            self._state_id = id(state)
 
-        # Системное сообщение с инструкцией
-        system = """Ты получаешь контекст диалога в нескольких частях:
+        if self._assembled_version == state.version and self._assembled_retrieved == retrieved:
+            return self._assembled
 
-1. <sum_block>...</sum_block> - кумулятивные суммаризации всего диалога (высший уровень обобщения)
-2. ## Чанк: - конспекты групп сообщений среднего уровня детализации
-3. Последние сообщения - полный текст последней части диалога (максимальная детализация)
+        parts = [SYSTEM_INSTRUCTION]
+        for section in SECTION_ORDER:
+            if section == ContextSection.RAW_TAIL and retrieved:
+                parts.append(retrieved)
+            text = self._get_section(state, section)
+            if text:
+                parts.append(text)
+        parts.append(SEPARATOR)
 
-Внимательно изучи ВЕСЬ предоставленный контекст перед ответом. Особое внимание уделяй последним сообщениям."""
-        parts.append(system)
+        if self.max_tokens and self._count_tokens(state) + token_counter.count(retrieved) > self.max_tokens:
+            parts = self._build_within_budget(state, retrieved)
+
+        self._assembled = "\n\n".join(parts)
+        self._assembled_version = state.version
+        self._assembled_retrieved = retrieved
+        return self._assembled
+
+    def _get_section(self, state: DialogContextState, section: ContextSection) -> str:
+        """Возвращает текст секции из кэша или пересобирает его."""
+        version = state.get_section_version(section)
+        cached = self._sections.get(section)
+        if cached is not None and cached[0] == version:
+            return cached[1]
 
-        # Кумулятивная строка
-        if state.cumulative_context.content:
-            parts.append(state.cumulative_context.get_formatted())
+        text = self._render_section(state, section)
+        self._sections[section] = (version, text)
+        return text
 
-        # Чанки L1
-        if state.l1_chunks:
-            l1_context = "# Конспекты недавних обсуждений (средний уровень детализации):\n"
-            for i, chunk in enumerate(state.l1_chunks, 1):
-                l1_context += f"\n## Чанк {i}:\n{chunk.summary}\n"
-            parts.append(l1_context)
+    @staticmethod
+    def _render_section(state: DialogContextState, section: ContextSection) -> str:
+        if section == ContextSection.CUMULATIVE:
+            # Кумулятивная строка
+            return state.cumulative_context.get_formatted()
+
+        if section == ContextSection.L1:
+            # Чанки L1
+            return ContextBuilder._render_l1([chunk.summary for chunk in state.l1_chunks])
 
         # Сырой хвост
-        if state.raw_tail:
-            raw_context = "# Последние сообщения (полный текст, максимальная детализация):\n"
-            raw_context += state.raw_tail
-            parts.append(raw_context)
+        if not state.raw_tail:
+            return ""
+        return RAW_TAIL_HEADER + state.raw_tail
+
+    @staticmethod
+    def _render_l1(summaries: List[str]) -> str:
+        if not summaries:
+            return ""
+        l1_parts = [L1_HEADER]
+        for i, summary in enumerate(summaries, 1):
+            l1_parts.append(f"\n## Чанк {i}:\n{summary}\n")
+        return "".join(l1_parts)
+
+    def _count_tokens(self, state: DialogContextState) -> int:
+        """Размер собранного контекста в токенах (по секциям, с кэшированием)."""
+        total = token_counter.count(SYSTEM_INSTRUCTION) + token_counter.count(SEPARATOR)
+        for section in SECTION_ORDER:
+            version = state.get_section_version(section)
+            cached = self._section_tokens.get(section)
+            if cached is None or cached[0] != version:
+                if section == ContextSection.RAW_TAIL:
+                    # Хвост учитывается инкрементально при добавлении взаимодействий
+                    tokens = token_counter.count(RAW_TAIL_HEADER) + state.raw_tail_token_count if state.raw_tail else 0
+                else:
+                    tokens = token_counter.count(self._get_section(state, section))
+                cached = (version, tokens)
+                self._section_tokens[section] = cached
+            total += cached[1]
+        return total
+
+    # ===== Бюджетирование =====
+
+    def _build_within_budget(self, state: DialogContextState, retrieved: str = "") -> List[str]:
+        """Собирает части контекста, укладываясь в бюджет токенов."""
+        remaining = self.max_tokens - token_counter.count(SYSTEM_INSTRUCTION) - token_counter.count(SEPARATOR)
+
+        # 1. Сырой хвост — самое ценное, берём от новых взаимодействий к старым
+        raw_segments = [s for s in _INTERACTION_BOUNDARY.split(state.raw_tail) if s]
+        kept_raw: List[str] = []
+        if raw_segments:
+            remaining -= token_counter.count(RAW_TAIL_HEADER)
+            for segment in reversed(raw_segments):
+                tokens = token_counter.count(segment)
+                if tokens > remaining:
+                    if not kept_raw and remaining > 0:
+                        # Даже последнее взаимодействие не влезает — оставляем его конец
+                        kept_raw.append(segment[-remaining * CHARS_PER_TOKEN_ESTIMATE:])
+                        remaining = 0
+                    break
+                kept_raw.append(segment)
+                remaining -= tokens
+            kept_raw.reverse()
+
+        # 2. Фрагменты из индекса памяти (уже ограничены своим бюджетом)
+        retrieved_tokens = token_counter.count(retrieved)
+        keep_retrieved = bool(retrieved) and retrieved_tokens <= remaining
+        if keep_retrieved:
+            remaining -= retrieved_tokens
+
+        # 3. Чанки L1 — от новых к старым
+        kept_l1: List[str] = []
+        if state.l1_chunks and remaining > 0:
+            remaining -= token_counter.count(L1_HEADER)
+            for chunk in reversed(state.l1_chunks):
+                tokens = token_counter.count(chunk.summary)
+                if tokens > remaining:
+                    break
+                kept_l1.append(chunk.summary)
+                remaining -= tokens
+            kept_l1.reverse()
+
+        # 4. Блоки кумулятивной строки — от новых к старым
+        kept_blocks: List[str] = []
+        blocks = state.cumulative_context.blocks
+        if blocks and remaining > 0:
+            remaining -= token_counter.count(CUMULATIVE_HEADER)
+            for block in reversed(blocks):
+                block_text = CumulativeContext.render_block(
+                    block['id'], block['summary'], CumulativeContext.block_level(block)
+                )
+                tokens = token_counter.count(block_text)
+                if tokens > remaining:
+                    break
+                kept_blocks.append(block_text)
+                remaining -= tokens
+            kept_blocks.reverse()
+
+        self._trimmed_builds += 1
+        self.logger.warning(
+            "✂️ [ContextBuilder] Контекст превысил бюджет %d ток.: оставлено блоков %d/%d, "
+            "чанков L1 %d/%d, взаимодействий хвоста %d/%d",
+            self.max_tokens, len(kept_blocks), len(blocks), len(kept_l1), len(state.l1_chunks),
+            len(kept_raw), len(raw_segments)
+        )
 
-        parts.append("\n" + "="*50 + "\n")
-        return "\n\n".join(parts)
\ No newline at end of file
+        parts = [SYSTEM_INSTRUCTION]
+        if kept_blocks:
+            parts.append(CUMULATIVE_HEADER + "".join(kept_blocks))
+        if kept_l1:
+            parts.append(self._render_l1(kept_l1))
+        if keep_retrieved:
+            parts.append(retrieved)
+        if kept_raw:
+            parts.append(RAW_TAIL_HEADER + "".join(kept_raw))
+        parts.append(SEPARATOR)
+        return parts
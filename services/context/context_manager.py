@@ -4,7 +4,7 @@
 """
 import threading
 from datetime import datetime
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 
 from models.dialog import Dialog
 from models.context import DialogContextState, InteractionChunk, ChunkType
@@ -12,6 +12,8 @@ from models.enums import MessageRole
 from services.context.trigger import SummarizationTrigger
 from services.context.persistence import ContextStatePersistence
 from services.context.builder import ContextBuilder
+from services.context.tokens import token_counter
+from services.context.memory_index import DialogMemoryIndex, create_embedder, submit_indexing
 from services.context.utils import (
     parse_text_to_interactions,
     group_interactions_into_chunks,
@@ -20,9 +22,18 @@ from services.context.utils import (
 )
 from .interaction import SimpleInteraction
 from services.context.global_manager import global_summary_manager
+from services.logger import lazy
 from container import container
 
 
+MEMORY_HEADER = "# Фрагменты из ранней истории диалога (найдены по смыслу последнего сообщения):\n"
+MEMORY_KIND_LABELS = {
+    "raw": "исходные сообщения",
+    "l1": "конспект",
+    "l2": "сводная запись",
+}
+
+
 class ContextManager:
     """Управляет контекстом диалога с многоуровневой суммаризацией."""
 
@@ -31,26 +42,45 @@ class ContextManager:
         self.config = config
         self._logger = container.get_logger()
 
+        token_counter.configure(config.get("accounting", {}))
         self.trigger = SummarizationTrigger(config)
         self.persistence = ContextStatePersistence(dialog, config)
-        self.builder = ContextBuilder()
+        self.builder = ContextBuilder(config)
 
         self.state = self._load_or_initialize()
 
+        memory_config = config.get("memory", {})
+        self.memory_index: Optional[DialogMemoryIndex] = None
+        if memory_config.get("enabled", False):
+            self.memory_index = DialogMemoryIndex(
+                self.persistence.get_memory_index_base_path(),
+                create_embedder(memory_config)
+            )
+
         self._state_lock = threading.RLock()
         self._l1_in_progress = False
 
         # Счётчик ожидающих L1-чанков и длина обрабатываемого хвоста.
         # Инициализируются здесь, сбрасываются после завершения всех чанков.
         self._pending_l1_chunks: int = 0
+        # Результаты чанков текущего L1 пакета (по порядку) и признак ошибки в нём
+        self._l1_batch: List[Optional[Tuple[str, int, List[int]]]] = []
+        self._l1_batch_failed = False
         self._original_len_l1: int = 0
+        self._original_tokens_l1: int = 0
+        self._l2_in_progress = False
+        self._l3_in_progress = False
 
-        self._cached_context: Optional[str] = None
-        self._cached_state_hash: Optional[str] = None
+    def is_busy(self) -> bool:
+        """Идёт ли фоновая суммаризация (менеджер нельзя выгружать из памяти)."""
+        return self._l1_in_progress or self._l2_in_progress or self._l3_in_progress
 
     def _load_or_initialize(self) -> DialogContextState:
         loaded = self.persistence.load()
         if loaded:
+            if loaded.raw_tail and not loaded.raw_tail_token_count:
+                # Состояние сохранено до появления учёта токенов
+                loaded.raw_tail_token_count = token_counter.count(loaded.raw_tail)
             return loaded
 
         structure = self.config.get("structure", {})
@@ -73,50 +103,54 @@ class ContextManager:
             )
             interaction_text = interaction.text + "\n\n"
             interaction_chars = len(interaction_text)
+            interaction_tokens = token_counter.count(interaction_text)
 
             self._logger.debug(
-                f"📏 [ContextManager] raw_tail до добавления: {len(self.state.raw_tail)} символов, "
-                f"лимит {self.state.raw_tail_char_limit}"
+                "📏 [ContextManager] raw_tail до добавления: %d символов, лимит %d",
+                len(self.state.raw_tail), self.state.raw_tail_char_limit
             )
 
-            if not self._l1_in_progress and self.trigger.should_trigger_l1(self.state.raw_tail):
+            if not self._l1_in_progress and self.trigger.should_trigger_l1(self.state):
                 self._logger.debug("🚨 [ContextManager] Превышен лимит raw_tail, запускаем L1 суммаризацию")
                 self._l1_in_progress = True
                 raw_tail_to_summarize = self.state.raw_tail
                 original_len = len(raw_tail_to_summarize)
+                self._original_tokens_l1 = self.state.raw_tail_token_count
                 self._trigger_l1_summarization_for_full_tail(raw_tail_to_summarize, original_len)
-                self.state.raw_tail += interaction_text
+                self.state.append_raw_tail(interaction_text, interaction_tokens)
                 self._logger.debug(
-                    f"📏 [ContextManager] raw_tail после добавления (L1 запущена): {len(self.state.raw_tail)} символов"
+                    "📏 [ContextManager] raw_tail после добавления (L1 запущена): %d символов", len(self.state.raw_tail)
                 )
             else:
-                self.state.raw_tail += interaction_text
+                self.state.append_raw_tail(interaction_text, interaction_tokens)
                 self._logger.debug(
-                    f"📏 [ContextManager] raw_tail после добавления: {len(self.state.raw_tail)} символов"
+                    "📏 [ContextManager] raw_tail после добавления: %d символов", len(self.state.raw_tail)
                 )
 
             self.state.total_interactions += 1
             self.state.total_characters_processed += interaction_chars
-            self.state.invalidate_hash()
+            interaction_ref = str(self.state.total_interactions)
             self.persistence.save(self.state)
 
+        self._index_memory("raw", interaction_ref, interaction.text)
+
     def _get_current_message_indices(self) -> List[int]:
         indices = [
-            i for i, msg in enumerate(self.dialog.history)
-            if msg.role in (MessageRole.USER, MessageRole.ASSISTANT)
+            i for i, role in enumerate(self.dialog.history.iter_roles())
+            if role in (MessageRole.USER, MessageRole.ASSISTANT)
         ]
         return sorted(set(indices)) or [len(self.dialog.history) - 1]
 
     def _trigger_l1_summarization_for_full_tail(self, raw_tail_text: str, original_len: int):
         """Синхронно парсит raw_tail, разбивает на чанки и планирует L1 задачи."""
         self._logger.debug(
-            f"🔍 [ContextManager] _trigger_l1_summarization_for_full_tail: "
-            f"получен текст длиной {len(raw_tail_text)} символов (original_len={original_len})"
+            "🔍 [ContextManager] _trigger_l1_summarization_for_full_tail: "
+            "получен текст длиной %d символов (original_len=%d)", len(raw_tail_text), original_len
         )
 
         interactions = parse_text_to_interactions(raw_tail_text)
         self._logger.debug(
-            f"🔍 [ContextManager] parse_text_to_interactions вернул {len(interactions)} взаимодействий"
+            "🔍 [ContextManager] parse_text_to_interactions вернул %d взаимодействий", len(interactions)
         )
 
         if not interactions:
@@ -126,109 +160,154 @@ class ContextManager:
             return
 
         l1_config = self.config.get("structure", {}).get("l1_chunks", {})
-        target_chars = l1_config.get("target_char_limit", 1000)
         allow_overflow = l1_config.get("allow_single_interaction_overflow", True)
 
-        chunks = group_interactions_into_chunks(interactions, target_chars, allow_overflow)
+        if self.trigger.uses_tokens:
+            target_size = l1_config.get("target_token_limit", 1000)
+            size_fn = lambda interaction: token_counter.count(interaction.text)
+        else:
+            target_size = l1_config.get("target_char_limit", 1000)
+            size_fn = None
+
+        chunks = group_interactions_into_chunks(interactions, target_size, allow_overflow, size_fn)
         self._logger.debug(
-            f"🔍 [ContextManager] Сформировано {len(chunks)} чанков для L1 суммаризации"
+            "🔍 [ContextManager] Сформировано %d чанков для L1 суммаризации", len(chunks)
         )
 
         summarization_params = self.config.get("generation_params", {}).get("l1", {})
-        self._logger.debug(f"🔍 [ContextManager] Параметры L1 суммаризации: {summarization_params}")
+        self._logger.debug("🔍 [ContextManager] Параметры L1 суммаризации: %s", summarization_params)
 
         self._pending_l1_chunks = len(chunks)
+        self._l1_batch = [None] * len(chunks)
+        self._l1_batch_failed = False
         self._original_len_l1 = original_len
 
         for idx, chunk_interactions in enumerate(chunks):
             chunk_text = "\n\n".join(format_interaction_for_summary(i) for i in chunk_interactions)
             message_indices = extract_message_indices_from_interactions(chunk_interactions)
             self._logger.debug(
-                f"🔍 [ContextManager] Чанк {idx+1}: длина {len(chunk_text)} символов, "
-                f"сообщения {message_indices}"
-            )
-
-            global_summary_manager.schedule_l1_summary(
-                dialog_id=self.dialog.id,
-                text=chunk_text,
-                callback=lambda summary, data: self._on_l1_summary_complete(
-                    summary, data["text"], message_indices
-                ),
-                **summarization_params
+                "🔍 [ContextManager] Чанк %d: длина %d символов, сообщения %s",
+                idx + 1, len(chunk_text), message_indices
             )
 
-    def _on_l1_summary_complete(self, summary: str, original_text: str, message_indices: List[int]):
-        """Обработка завершения L1 суммаризации (вызывается из фонового потока воркера)."""
-        self._logger.debug(
-            f"✅ [ContextManager] L1 суммаризация завершена, длина суммаризации {len(summary)} символов, "
-            f"исходный текст {len(original_text)} символов"
-        )
+            try:
+                global_summary_manager.schedule_l1_summary(
+                    dialog_id=self.dialog.id,
+                    text=chunk_text,
+                    callback=lambda summary, data, idx=idx, indices=message_indices: self._on_l1_summary_complete(
+                        summary, data["text"], indices, idx
+                    ),
+                    **summarization_params
+                )
+            except Exception as e:
+                # Чанк не попал в очередь — учитываем как неудачный, чтобы снять флаг L1
+                self._logger.error("❌ [ContextManager] Не удалось запланировать L1 суммаризацию: %s", e)
+                self._on_l1_summary_complete(None, chunk_text, message_indices, idx)
+
+    def _on_l1_summary_complete(self, summary: Optional[str], original_text: str,
+                                message_indices: List[int], idx: int):
+        """
+        Обработка завершения L1 суммаризации чанка (вызывается из фонового потока
+        воркера; None — ошибка). Чанки пакета применяются вместе, когда готовы все.
+        """
+        indexed = []
         with self._state_lock:
-            chunk = InteractionChunk.create_from_summary(
-                summary=summary,
-                original_char_count=len(original_text),
-                message_indices=message_indices
-            )
-            chunk.chunk_type = ChunkType.L1_SUMMARY
-
-            self.state.l1_chunks.append(chunk)
-            self.state.total_summarizations_l1 += 1
-            self.state.last_summarization_time = self.state.last_summarization_time or datetime.now()
-            self._logger.debug(
-                f"📊 [ContextManager] L1 чанк добавлен, всего чанков: {len(self.state.l1_chunks)}"
-            )
+            if summary is None:
+                self._l1_batch_failed = True
+                self._logger.warning(
+                    "⚠️ [ContextManager] L1 суммаризация чанка %d не удалась (%d символов)",
+                    idx + 1, len(original_text)
+                )
+            else:
+                self._logger.debug(
+                    "✅ [ContextManager] L1 суммаризация чанка %d завершена, длина суммаризации %d символов, "
+                    "исходный текст %d символов", idx + 1, len(summary), len(original_text)
+                )
+                self._l1_batch[idx] = (summary, len(original_text), message_indices)
 
             self._pending_l1_chunks -= 1
+            if self._pending_l1_chunks > 0:
+                return
+
+            original_len = self._original_len_l1
+            if self._l1_batch_failed:
+                # Пакет отбрасывается целиком: конспекты без обрезки хвоста дублировали бы
+                # raw_tail в контексте, а следующая суммаризация — сами конспекты.
+                # Хвост остаётся, суммаризация повторится при следующем превышении лимита
+                self._logger.warning(
+                    "⚠️ [ContextManager] L1 пакет не суммаризирован полностью, конспекты отброшены, raw_tail сохранён"
+                )
+            else:
+                for chunk_summary, original_chars, chunk_indices in self._l1_batch:
+                    chunk = InteractionChunk.create_from_summary(
+                        summary=chunk_summary,
+                        original_char_count=original_chars,
+                        message_indices=chunk_indices
+                    )
+                    chunk.chunk_type = ChunkType.L1_SUMMARY
+                    self.state.add_l1_chunk(chunk)
+                    self.state.total_summarizations_l1 += 1
+                    indexed.append((chunk.id, chunk_summary))
+                self.state.last_summarization_time = self.state.last_summarization_time or datetime.now()
+                self._logger.debug(
+                    "📊 [ContextManager] Добавлено L1 чанков: %d, всего: %d", len(indexed), len(self.state.l1_chunks)
+                )
 
-            if self._pending_l1_chunks == 0:
-                original_len = self._original_len_l1
                 if len(self.state.raw_tail) >= original_len:
-                    self.state.raw_tail = self.state.raw_tail[original_len:]
+                    self.state.trim_raw_tail(original_len, self._original_tokens_l1)
                     self._logger.debug(
-                        f"🗑️ [ContextManager] Удалено {original_len} символов из raw_tail, "
-                        f"осталось {len(self.state.raw_tail)}"
+                        "🗑️ [ContextManager] Удалено %d символов из raw_tail, осталось %d",
+                        original_len, len(self.state.raw_tail)
                     )
                 else:
                     self._logger.warning(
-                        f"⚠️ [ContextManager] raw_tail короче ожидаемого "
-                        f"({len(self.state.raw_tail)} < {original_len}), возможно, данные потеряны"
+                        "⚠️ [ContextManager] raw_tail короче ожидаемого (%d < %d), возможно, данные потеряны",
+                        len(self.state.raw_tail), original_len
                     )
-                self._l1_in_progress = False
-                self._original_len_l1 = 0
+            self._l1_in_progress = False
+            self._original_len_l1 = 0
+            self._original_tokens_l1 = 0
+            self._l1_batch = []
+            self._l1_batch_failed = False
 
-            self.state.invalidate_hash()
             self.persistence.save(self.state)
 
-            if self.trigger.should_trigger_l2(len(self.state.l1_chunks)):
+            if not self._l2_in_progress and self.trigger.should_trigger_l2(len(self.state.l1_chunks)):
                 self._logger.debug(
-                    f"🚨 [ContextManager] Достигнут порог L2 ({len(self.state.l1_chunks)} чанков), "
-                    f"запускаем L2 суммаризацию"
+                    "🚨 [ContextManager] Достигнут порог L2 (%d чанков), запускаем L2 суммаризацию",
+                    len(self.state.l1_chunks)
                 )
+                self._l2_in_progress = True
                 future = global_summary_manager.run_coro(self._trigger_l2_summarization())
 
                 def _log_l2_future_error(fut):
                     exc = fut.exception()
                     if exc:
+                        self._l2_in_progress = False
                         self._logger.error(
-                            f"❌ [ContextManager] Ошибка в _trigger_l2_summarization: {exc}",
-                            exc_info=True
+                            "❌ [ContextManager] Ошибка в _trigger_l2_summarization: %s", exc,
+                            exc_info=exc
                         )
                 future.add_done_callback(_log_l2_future_error)
 
+        for chunk_id, chunk_summary in indexed:
+            self._index_memory("l1", chunk_id, chunk_summary)
+
     async def _trigger_l2_summarization(self):
         """Запускает L2 суммаризацию (выполняется в фоновом event loop воркера)."""
         self._logger.debug("🔍 [ContextManager] _trigger_l2_summarization запущен")
         with self._state_lock:
             if not self.state.l1_chunks:
                 self._logger.debug("🔍 [ContextManager] Нет L1 чанков для L2 суммаризации")
+                self._l2_in_progress = False
                 return
 
             ratio = max(0.1, min(1.0, self.state.l2_preserve_ratio))
             chunk_count = max(1, int(len(self.state.l1_chunks) * ratio))
             chunks_to_summarize = self.state.l1_chunks[:chunk_count]
             self._logger.debug(
-                f"🔍 [ContextManager] Для L2 отобрано {len(chunks_to_summarize)} чанков "
-                f"(из {len(self.state.l1_chunks)}), ratio={ratio:.2f}"
+                "🔍 [ContextManager] Для L2 отобрано %d чанков (из %d), ratio=%.2f",
+                len(chunks_to_summarize), len(self.state.l1_chunks), ratio
             )
 
             l1_summaries_text = "\n---\n".join(c.summary for c in chunks_to_summarize)
@@ -248,12 +327,17 @@ class ContextManager:
                 **summarization_params
             )
 
-    def _on_l2_summary_complete(self, summary: str, original_text: str,
+    def _on_l2_summary_complete(self, summary: Optional[str], original_text: str,
                                 l1_chunk_ids: List[str], original_char_count: int):
-        self._logger.debug(
-            f"✅ [ContextManager] L2 суммаризация завершена, длина суммаризации {len(summary)} символов"
-        )
         with self._state_lock:
+            self._l2_in_progress = False
+            if summary is None:
+                # L1 чанки остаются; L2 будет запущена снова после следующего L1
+                self._logger.warning("⚠️ [ContextManager] L2 суммаризация не удалась, L1 чанки оставлены")
+                return
+            self._logger.debug(
+                "✅ [ContextManager] L2 суммаризация завершена, длина суммаризации %d символов", len(summary)
+            )
             from models.context import L2SummaryBlock
             l2_block = L2SummaryBlock.create_from_summary(
                 chunk_ids=l1_chunk_ids,
@@ -262,28 +346,137 @@ class ContextManager:
             )
             l2_block.chunk_type = ChunkType.L2_SUMMARY
 
-            self.state.cumulative_context.add_block(l2_block)
-            self.state.l1_chunks = [c for c in self.state.l1_chunks if c.id not in l1_chunk_ids]
-            self.state.l2_blocks.append(l2_block)
+            self.state.apply_l2_block(l2_block, l1_chunk_ids)
             self.state.total_summarizations_l2 += 1
             self.state.last_summarization_time = self.state.last_summarization_time or datetime.now()
             self._logger.debug(
-                f"📊 [ContextManager] L2 блок добавлен, удалено L1 чанков: {len(l1_chunk_ids)}, "
-                f"осталось L1 чанков: {len(self.state.l1_chunks)}"
+                "📊 [ContextManager] L2 блок добавлен, удалено L1 чанков: %d, осталось L1 чанков: %d",
+                len(l1_chunk_ids), len(self.state.l1_chunks)
             )
 
-            self.state.invalidate_hash()
             self.persistence.save(self.state)
+            self._maybe_schedule_compaction()
+
+        self._index_memory("l2", l2_block.id, summary)
+
+    def _maybe_schedule_compaction(self):
+        """Планирует слияние старейших блоков, если кумулятивная строка превысила бюджет."""
+        with self._state_lock:
+            if self._l3_in_progress or not self.trigger.should_trigger_l3(self.state):
+                return
+
+            fanout = self.config.get("structure", {}).get("thresholds", {}).get("l3_merge_fanout", 2)
+            candidates = self.state.cumulative_context.select_compaction_candidates(fanout)
+            if not candidates:
+                return
+
+            block_ids = [b['id'] for b in candidates]
+            text = "\n---\n".join(b['summary'] for b in candidates)
+            self._l3_in_progress = True
+            self._logger.debug(
+                "🗜️ [ContextManager] Уплотнение кумулятивной строки: сливаем %d блоков", len(block_ids)
+            )
+
+            summarization_params = self.config.get("generation_params", {}).get("l3", {})
+            global_summary_manager.schedule_l3_summary(
+                dialog_id=self.dialog.id,
+                text=text,
+                block_ids=block_ids,
+                callback=lambda summary, ids: self._on_l3_summary_complete(summary, ids),
+                **summarization_params
+            )
+
+    def _on_l3_summary_complete(self, summary: Optional[str], block_ids: List[str]):
+        """Обработка завершения слияния блоков (вызывается из фонового потока воркера)."""
+        with self._state_lock:
+            self._l3_in_progress = False
+            if not summary:
+                self._logger.warning("⚠️ [ContextManager] Слияние блоков не удалось, блоки оставлены как есть")
+                return
+
+            if not self.state.apply_compaction(block_ids, summary):
+                self._logger.warning("⚠️ [ContextManager] Блоки для слияния изменились, результат отброшен")
+                return
+
+            self.state.total_summarizations_l3 += 1
+            self._logger.debug(
+                "📊 [ContextManager] Блоки слиты, уровни: %s", lazy(self.state.cumulative_context.get_level_sizes)
+            )
+            self.persistence.save(self.state)
+
+        # Одного слияния может не хватить, чтобы уложиться в бюджет
+        self._maybe_schedule_compaction()
+
+    # ===== Долговременная память (индекс эмбеддингов) =====
+
+    def _index_memory(self, kind: str, ref_id: str, text: str):
+        """
+        Ставит фрагмент в индекс памяти диалога (если он включён).
+        Эмбеддинг (модель под gpu_lock) и дозапись файлов выполняются в потоке
+        индексации — не в event loop, не под _state_lock и не в пуле StorageIO;
+        записи добавляются в порядке постановки.
+        """
+        if self.memory_index is None:
+            return
+        submit_indexing(self._add_to_memory_index, kind, ref_id, text)
+
+    def _add_to_memory_index(self, kind: str, ref_id: str, text: str):
+        try:
+            self.memory_index.add(kind, ref_id, text)
+        except Exception as e:
+            self._logger.warning("⚠️ [ContextManager] Ошибка обновления индекса памяти: %s", e)
+
+    def _retrieve_memory(self, query: Optional[str]) -> str:
+        """Находит в индексе фрагменты, релевантные запросу, в пределах бюджета токенов."""
+        if self.memory_index is None or not query:
+            return ""
+
+        memory_config = self.config.get("memory", {})
+        top_k = memory_config.get("top_k", 4)
+        min_score = memory_config.get("min_score", 0.15)
+        max_tokens = memory_config.get("max_tokens", 600)
+        max_snippet_chars = memory_config.get("max_snippet_chars", 800)
+
+        with self._state_lock:
+            raw_tail = self.state.raw_tail
+            visible_ids = {c.id for c in self.state.l1_chunks}
+            visible_ids.update(b['id'] for b in self.state.cumulative_context.blocks)
+
+        def already_in_context(entry: Dict[str, Any]) -> bool:
+            # Фрагменты, которые и так попадут в контекст, не дублируем
+            if entry.get("kind") == "raw":
+                return entry.get("text", "") in raw_tail
+            return entry.get("ref_id") in visible_ids
+
+        hits = self.memory_index.search(query, top_k, min_score, already_in_context)
+        if not hits:
+            return ""
+
+        parts = [MEMORY_HEADER]
+        used_tokens = token_counter.count(MEMORY_HEADER)
+        for score, entry in hits:
+            snippet = entry["text"]
+            if len(snippet) > max_snippet_chars:
+                snippet = snippet[:max_snippet_chars] + "..."
+            label = MEMORY_KIND_LABELS.get(entry.get("kind"), "фрагмент")
+            block = f"\n## Фрагмент ({label}):\n{snippet}\n"
+            tokens = token_counter.count(block)
+            if used_tokens + tokens > max_tokens:
+                continue
+            parts.append(block)
+            used_tokens += tokens
+
+        if len(parts) == 1:
+            return ""
+        self._logger.debug(
+            "🧠 [ContextManager] Из памяти извлечено фрагментов: %d, ~%d ток.", len(parts) - 1, used_tokens
+        )
+        return "".join(parts)
 
-    def get_context_for_generation(self) -> str:
+    def get_context_for_generation(self, query: Optional[str] = None) -> str:
+        retrieved = self._retrieve_memory(query)
         with self._state_lock:
-            current_hash = self.state.get_hash()
-            if current_hash == self._cached_state_hash and self._cached_context is not None:
-                return self._cached_context
-            context = self.builder.build(self.state, len(self.dialog.history))
-            self._cached_context = context
-            self._cached_state_hash = current_hash
-            return context
+            return self.builder.build(self.state, len(self.dialog.history), retrieved)
 
     def save_state(self, file_path: str = None) -> bool:
         with self._state_lock:
@@ -294,8 +487,7 @@ class ContextManager:
             loaded = self.persistence.load(file_path)
             if loaded:
                 self.state = loaded
-                self._cached_context = None
-                self._cached_state_hash = None
+                self.builder.invalidate()
                 return True
             return False
 
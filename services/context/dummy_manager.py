@@ -13,7 +13,7 @@ class DummyContextManager:
         self.dialog = dialog
         self.config = config
     
-    def get_context_for_generation(self) -> str:
+    def get_context_for_generation(self, query: str = None) -> str:
         """Возвращает пустой контекст"""
         return ""
     
@@ -29,6 +29,9 @@ class DummyContextManager:
         """Пустой метод"""
         pass
     
+    def is_busy(self) -> bool:
+        return False
+
     def cleanup(self):
         """Пустой метод"""
         pass
\ No newline at end of file
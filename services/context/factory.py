@@ -46,4 +46,16 @@ class ContextManagerFactory:
                 try:
                     manager.cleanup()
                 except:
-                    pass
\ No newline at end of file
+                    pass
+
+    @classmethod
+    def release_if_idle(cls, dialog_id: str) -> bool:
+        """Выгружает менеджер контекста, если он не занят фоновой суммаризацией."""
+        with cls._lock:
+            manager = cls._instances.get(dialog_id)
+            if manager is None:
+                return False
+            if manager.is_busy():
+                return False
+            cls.remove_for_dialog(dialog_id)
+            return True
@@ -83,6 +83,28 @@ class GlobalSummaryManager:
             params=kwargs
         )
 
+    def schedule_l3_summary(
+        self,
+        dialog_id: str,
+        text: str,
+        block_ids: List[str],
+        callback: Optional[Callable] = None,
+        **kwargs
+    ) -> str:
+        """Планирует слияние блоков кумулятивной строки для конкретного диалога."""
+        data = {
+            "dialog_id": dialog_id,
+            "text": text,
+            "block_ids": block_ids
+        }
+        return self.worker.submit_task(
+            task_type="l3",
+            text=text,
+            callback=callback,
+            data=data,
+            params=kwargs
+        )
+
     def run_coro(self, coro):
         """
         Запускает корутину в event loop воркера.
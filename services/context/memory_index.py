@@ -0,0 +1,258 @@
+# services/context/memory_index.py
+"""
+Векторный индекс долговременной памяти диалога.
+
+Хранит эмбеддинги сырых взаимодействий и суммаризаций L1/L2, чтобы при
+генерации подмешивать в контекст точные фрагменты старой истории, которые уже
+ушли из raw_tail и были сжаты суммаризацией.
+
+Файлы лежат рядом с context_*.chat:
+    memory_<suffix>.f32    — матрица эмбеддингов (float32, построчно, только дозапись)
+    memory_<suffix>.jsonl  — описания записей (тип, ID источника, текст)
+"""
+import json
+import os
+import re
+import threading
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from container import container, gpu_lock
+
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+# Отдельный поток индексации: эмбеддинг суммаризатором ждёт gpu_lock всю
+# генерацию и не должен занимать пул StorageIO, через который идут записи
+# и чтения истории. Один поток сохраняет порядок дозаписи в индексы.
+_indexing_executor: Optional[ThreadPoolExecutor] = None
+_indexing_lock = threading.Lock()
+
+
+def submit_indexing(fn: Callable, *args) -> Future:
+    """Ставит задачу индексации памяти в очередь потока memory-index."""
+    global _indexing_executor
+    with _indexing_lock:
+        if _indexing_executor is None:
+            _indexing_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="memory-index")
+        return _indexing_executor.submit(fn, *args)
+
+
+def shutdown_indexing():
+    """Дожидается поставленных задач индексации и останавливает поток (при завершении)."""
+    global _indexing_executor
+    with _indexing_lock:
+        executor, _indexing_executor = _indexing_executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
+
+
+class HashingEmbedder:
+    """
+    Эмбеддинги на хэшированных символьных n-граммах.
+
+    Работает на CPU без модели, детерминирован между запусками и устойчив
+    к словоизменению (общие n-граммы у «модели»/«модель»).
+    """
+
+    name = "hashing"
+
+    def __init__(self, dim: int = 512, ngram_range: Tuple[int, int] = (3, 5)):
+        self.dim = dim
+        self.ngram_range = ngram_range
+
+    def embed(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        min_n, max_n = self.ngram_range
+        for word in _WORD_RE.findall(text.lower()):
+            token = f"<{word}>"
+            for n in range(min_n, max_n + 1):
+                for i in range(max(1, len(token) - n + 1)):
+                    h = zlib.crc32(token[i:i + n].encode("utf-8"))
+                    vector[h % self.dim] += 1.0 if (h >> 31) & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector /= norm
+        return vector
+
+
+class SummarizerHiddenStateEmbedder:
+    """Эмбеддинги как усреднённые скрытые состояния модели суммаризации."""
+
+    name = "summarizer"
+
+    def __init__(self, max_tokens: int = 512):
+        self.max_tokens = max_tokens
+
+    @staticmethod
+    def _get_model():
+        from services.context.summarizer_factory import SummarizerFactory
+        if SummarizerFactory._shared_model is None:
+            raise RuntimeError("Модель суммаризации не загружена")
+        return SummarizerFactory._shared_model, SummarizerFactory._shared_tokenizer
+
+    def embed(self, text: str) -> np.ndarray:
+        import mlx.core as mx
+
+        model, tokenizer = self._get_model()
+        tokens = tokenizer.encode(text, add_special_tokens=False)[:self.max_tokens] or [0]
+        with gpu_lock:
+            hidden = model.model(mx.array(tokens)[None])
+            pooled = mx.mean(hidden[0], axis=0)
+            mx.eval(pooled)
+        vector = np.array(pooled.astype(mx.float32), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector /= norm
+        return vector
+
+
+def create_embedder(memory_config: Dict[str, Any]):
+    """Создаёт эмбеддер по секции context.memory."""
+    backend = memory_config.get("backend", "hashing")
+    if backend == "summarizer":
+        return SummarizerHiddenStateEmbedder(memory_config.get("max_embed_tokens", 512))
+    return HashingEmbedder(memory_config.get("dim", 512))
+
+
+class DialogMemoryIndex:
+    """Индекс памяти одного диалога с инкрементальной дозаписью на диск."""
+
+    def __init__(self, base_path: str, embedder):
+        self.vectors_path = f"{base_path}.f32"
+        self.entries_path = f"{base_path}.jsonl"
+        self.embedder = embedder
+        self._lock = threading.RLock()
+        self._entries: List[Dict[str, Any]] = []
+        self._matrix: Optional[np.ndarray] = None
+        self._size = 0
+        self._loaded = False
+        self._logger = None
+
+    @property
+    def logger(self):
+        if self._logger is None:
+            self._logger = container.get_logger()
+        return self._logger
+
+    def __len__(self) -> int:
+        self._ensure_loaded()
+        return self._size
+
+    def _ensure_loaded(self):
+        with self._lock:
+            if self._loaded:
+                return
+            self._loaded = True
+            if not (os.path.exists(self.vectors_path) and os.path.exists(self.entries_path)):
+                return
+            try:
+                with open(self.entries_path, "r", encoding="utf-8") as f:
+                    entries = [json.loads(line) for line in f if line.strip()]
+                if not entries:
+                    return
+                dim = entries[0].get("dim")
+                vectors = np.fromfile(self.vectors_path, dtype=np.float32)
+                if not dim or vectors.size % dim:
+                    raise ValueError("повреждён файл эмбеддингов")
+                vectors = vectors.reshape(-1, dim)
+                # После аварийного завершения файлы могут разойтись на одну запись
+                count = min(len(entries), len(vectors))
+                self._entries = entries[:count]
+                self._matrix = np.array(vectors[:count])
+                self._size = count
+            except Exception as e:
+                self.logger.warning("⚠️ [MemoryIndex] Не удалось загрузить индекс %s: %s", self.entries_path, e)
+                self._entries, self._matrix, self._size = [], None, 0
+
+    def add(self, kind: str, ref_id: str, text: str) -> bool:
+        """Добавляет запись в индекс и дописывает её на диск."""
+        if not text.strip():
+            return False
+        self._ensure_loaded()
+        try:
+            vector = self.embedder.embed(text)
+        except Exception as e:
+            self.logger.warning("⚠️ [MemoryIndex] Ошибка построения эмбеддинга: %s", e)
+            return False
+
+        with self._lock:
+            if self._matrix is not None and self._matrix.shape[1] != vector.shape[0]:
+                self.logger.warning("⚠️ [MemoryIndex] Размерность эмбеддингов изменилась, индекс пересоздаётся")
+                self._reset_files()
+
+            entry = {
+                "kind": kind,
+                "ref_id": ref_id,
+                "text": text,
+                "dim": int(vector.shape[0]),
+                "added_at": datetime.now().isoformat(),
+            }
+            self._append_row(vector)
+            self._entries.append(entry)
+
+            os.makedirs(os.path.dirname(self.vectors_path), exist_ok=True)
+            with open(self.vectors_path, "ab") as f:
+                f.write(vector.astype(np.float32).tobytes())
+            with open(self.entries_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        return True
+
+    def _append_row(self, vector: np.ndarray):
+        """Дописывает строку в матрицу с геометрическим ростом ёмкости."""
+        if self._matrix is None:
+            self._matrix = np.zeros((16, vector.shape[0]), dtype=np.float32)
+        elif self._size >= len(self._matrix):
+            grown = np.zeros((len(self._matrix) * 2, self._matrix.shape[1]), dtype=np.float32)
+            grown[:self._size] = self._matrix[:self._size]
+            self._matrix = grown
+        self._matrix[self._size] = vector
+        self._size += 1
+
+    def _reset_files(self):
+        self._entries, self._matrix, self._size = [], None, 0
+        for path in (self.vectors_path, self.entries_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def search(
+        self,
+        query: str,
+        top_k: int = 4,
+        min_score: float = 0.0,
+        exclude: Optional[Callable[[Dict[str, Any]], bool]] = None
+    ) -> List[Tuple[float, Dict[str, Any]]]:
+        """Возвращает до top_k записей, наиболее близких к запросу."""
+        self._ensure_loaded()
+        with self._lock:
+            if not self._size or not query.strip():
+                return []
+            matrix = self._matrix[:self._size]
+            entries = list(self._entries)
+
+        try:
+            query_vector = self.embedder.embed(query)
+        except Exception as e:
+            self.logger.warning("⚠️ [MemoryIndex] Ошибка построения эмбеддинга запроса: %s", e)
+            return []
+        if query_vector.shape[0] != matrix.shape[1]:
+            return []
+
+        scores = matrix @ query_vector
+        results = []
+        for idx in np.argsort(-scores):
+            score = float(scores[idx])
+            if score < min_score:
+                break
+            entry = entries[idx]
+            if exclude and exclude(entry):
+                continue
+            results.append((score, entry))
+            if len(results) >= top_k:
+                break
+        return results
@@ -1,6 +1,10 @@
 # services/context/persistence.py
 """
 Сохранение и загрузка состояния контекста.
+
+По умолчанию состояние пишется в хранилище, выбранное dialogs.storage_engine
+(файл context_*.chat или таблица context_states). Явно указанный путь
+(экспорт/импорт) всегда работает с файлом.
 """
 import os
 import json
@@ -8,6 +12,7 @@ from typing import Optional
 
 from models.dialog import Dialog
 from models.context import DialogContextState
+from services.storage import ContextStateStore, get_storage_backend
 from container import container
 
 
@@ -18,6 +23,7 @@ class ContextStatePersistence:
         self.dialog = dialog
         self.config = config
         self._logger = None
+        self._store: Optional[ContextStateStore] = None
 
     @property
     def logger(self):
@@ -25,49 +31,73 @@ class ContextStatePersistence:
             self._logger = container.get_logger()
         return self._logger
 
-    def get_state_file_path(self) -> str:
-        """Генерирует путь к файлу состояния контекста."""
+    @staticmethod
+    def _get_dialogs_config() -> dict:
         config_service = container.get("config_service")
-        app_config = config_service.get_config()
-        save_dir = app_config.get("dialogs", {}).get("save_dir", "saved_dialogs")
+        return config_service.get_config().get("dialogs", {})
+
+    @property
+    def store(self) -> ContextStateStore:
+        if self._store is None:
+            self._store = get_storage_backend(self._get_dialogs_config())
+        return self._store
+
+    def get_state_file_path(self) -> str:
+        """
+        Путь к файлу состояния контекста в папке чата. Папка не создаётся:
+        её создаёт файловое хранилище или первая запись индекса памяти.
+        """
+        save_dir = self._get_dialogs_config().get("save_dir", "saved_dialogs")
 
         datetime_str = self.dialog.created.strftime("%Y%m%dT%H%M%S")
         microseconds = self.dialog.created.strftime("%f")[:3]
         chat_folder = f"chat_{datetime_str}-{microseconds}"
         folder_path = os.path.join(save_dir, chat_folder)
-        os.makedirs(folder_path, exist_ok=True)
 
         context_file = f"context_{datetime_str}-{microseconds}.chat"
         return os.path.join(folder_path, context_file)
 
+    def get_memory_index_base_path(self) -> str:
+        """Путь (без расширения) к файлам индекса памяти рядом с файлом состояния."""
+        folder_path, context_file = os.path.split(self.get_state_file_path())
+        suffix = context_file[len("context_"):-len(".chat")]
+        return os.path.join(folder_path, f"memory_{suffix}")
+
     def save(self, state: DialogContextState, file_path: Optional[str] = None) -> bool:
-        """Сохраняет состояние в файл."""
-        if file_path is None:
-            file_path = self.get_state_file_path()
+        """Сохраняет состояние в хранилище или в указанный файл."""
         try:
             state_dict = state.model_dump_jsonable()
-            # Добавляем временную метку для отладки
-            self.logger.debug(f"💾 [Persistence] Сохранение состояния в {file_path}, l1_chunks={len(state.l1_chunks)}")
+            if file_path is None:
+                self.logger.debug(
+                    "💾 [Persistence] Сохранение состояния диалога %s, l1_chunks=%d", self.dialog.id, len(state.l1_chunks)
+                )
+                return self.store.save_context_state(self.dialog, state_dict)
+
+            self.logger.debug("💾 [Persistence] Сохранение состояния в %s, l1_chunks=%d", file_path, len(state.l1_chunks))
             with open(file_path, 'w', encoding='utf-8') as f:
                 json.dump(state_dict, f, ensure_ascii=False, indent=2)
-            self.logger.debug(f"✅ [Persistence] Состояние успешно сохранено")
+            self.logger.debug("✅ [Persistence] Состояние успешно сохранено")
             return True
         except Exception as e:
-            self.logger.error(f"❌ [Persistence] Ошибка сохранения состояния контекста: {e}", exc_info=True)
+            self.logger.error("❌ [Persistence] Ошибка сохранения состояния контекста: %s", e, exc_info=True)
             return False
 
     def load(self, file_path: Optional[str] = None) -> Optional[DialogContextState]:
-        """Загружает состояние из файла."""
-        if file_path is None:
-            file_path = self.get_state_file_path()
+        """Загружает состояние из хранилища или из указанного файла."""
         try:
-            if not os.path.exists(file_path):
-                self.logger.debug(f"📂 [Persistence] Файл состояния не найден: {file_path}")
-                return None
-            with open(file_path, 'r', encoding='utf-8') as f:
-                state_dict = json.load(f)
-            self.logger.debug(f"📂 [Persistence] Состояние загружено из {file_path}")
+            if file_path is None:
+                state_dict = self.store.load_context_state(self.dialog)
+                if state_dict is None:
+                    self.logger.debug("📂 [Persistence] Сохранённое состояние диалога %s не найдено", self.dialog.id)
+                    return None
+            else:
+                if not os.path.exists(file_path):
+                    self.logger.debug("📂 [Persistence] Файл состояния не найден: %s", file_path)
+                    return None
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    state_dict = json.load(f)
+                self.logger.debug("📂 [Persistence] Состояние загружено из %s", file_path)
             return DialogContextState.model_validate(state_dict)
         except Exception as e:
-            self.logger.error(f"❌ [Persistence] Ошибка загрузки состояния контекста: {e}", exc_info=True)
-            return None
\ No newline at end of file
+            self.logger.error("❌ [Persistence] Ошибка загрузки состояния контекста: %s", e, exc_info=True)
+            return None
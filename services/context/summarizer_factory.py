@@ -6,12 +6,13 @@ import threading
 import time
 import os
 import asyncio
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 
 import mlx.core as mx
 from mlx_lm import load
 
-from services.context.summarizers import L1Summarizer, L2Summarizer, BaseSummarizer
+from services.context.summarizers import L1Summarizer, L2Summarizer, L3Summarizer, BaseSummarizer
+from services.disk_cache import DiskLRUCache
 from container import container
 
 
@@ -22,14 +23,15 @@ class SummarizerFactory:
     _shared_model = None
     _shared_tokenizer = None
     _shared_lock = None
+    _summary_cache: Optional[DiskLRUCache] = None
     _preloaded = False
     _lock = threading.RLock()
 
     @classmethod
     def get_all_summarizers(cls, config: Dict[str, Any]) -> Dict[str, BaseSummarizer]:
-        """Возвращает экземпляры L1 и L2 суммаризаторов, использующих ОДНУ модель."""
+        """Возвращает экземпляры L1, L2 и L3 суммаризаторов, использующих ОДНУ модель."""
         with cls._lock:
-            if "l1" in cls._instances and "l2" in cls._instances:
+            if all(key in cls._instances for key in ("l1", "l2", "l3")):
                 return cls._instances.copy()
 
             logger = container.get_logger()
@@ -41,21 +43,51 @@ class SummarizerFactory:
             if cls._shared_model is None or cls._shared_tokenizer is None:
                 cls._load_shared_model(model_config)
 
+            summary_cache = cls._get_summary_cache(config)
+
             cls._instances["l1"] = L1Summarizer(
                 model_config, config,
                 model=cls._shared_model,
                 tokenizer=cls._shared_tokenizer,
-                model_lock=cls._shared_lock
+                model_lock=cls._shared_lock,
+                summary_cache=summary_cache
             )
             cls._instances["l2"] = L2Summarizer(
                 model_config, config,
                 model=cls._shared_model,
                 tokenizer=cls._shared_tokenizer,
-                model_lock=cls._shared_lock
+                model_lock=cls._shared_lock,
+                summary_cache=summary_cache
+            )
+            cls._instances["l3"] = L3Summarizer(
+                model_config, config,
+                model=cls._shared_model,
+                tokenizer=cls._shared_tokenizer,
+                model_lock=cls._shared_lock,
+                summary_cache=summary_cache
             )
 
             return cls._instances.copy()
 
+    @classmethod
+    def _get_summary_cache(cls, config: Dict[str, Any]) -> Optional[DiskLRUCache]:
+        """Создаёт (один раз) персистентный кэш суммаризаций."""
+        cache_config = config.get("summary_cache", {})
+        if not cache_config.get("enabled", True):
+            return None
+        if cls._summary_cache is None:
+            try:
+                cls._summary_cache = DiskLRUCache(
+                    cache_config.get("path", "cache/summaries.sqlite"),
+                    max_entries=cache_config.get("max_entries", 5000),
+                    max_bytes=cache_config.get("max_mb", 50) * 1024 * 1024,
+                    name="SummaryCache"
+                )
+            except Exception as e:
+                container.get_logger().warning("⚠️ Кэш суммаризаций недоступен: %s", e)
+                return None
+        return cls._summary_cache
+
     @classmethod
     def _load_shared_model(cls, model_config: Dict[str, Any]):
         logger = container.get_logger()
@@ -114,7 +146,8 @@ class SummarizerFactory:
         summarizers = cls.get_all_summarizers(config)  # используем переданный конфиг
         l1 = summarizers["l1"]
         try:
-            await l1.summarize(warmup_text[:100], max_tokens=10, temperature=0.1)
+            # Прогрев должен реально выполнить генерацию, поэтому кэш не используем
+            await l1.summarize(warmup_text[:100], max_tokens=10, temperature=0.1, use_cache=False)
             logger.info("   ✅ Прогрев модели суммаризации завершён успешно")
         except Exception as e:
             logger.warning("⚠️ Ошибка прогрева: %s", e)
@@ -143,6 +176,7 @@ class SummarizerFactory:
             stats = {
                 'shared_model_loaded': cls._shared_model is not None,
                 'preloaded': cls._preloaded,
+                'summary_cache': cls._summary_cache.get_stats() if cls._summary_cache else None,
                 'summarizers': {}
             }
             for name, summarizer in cls._instances.items():
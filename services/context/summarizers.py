@@ -3,6 +3,8 @@ import re
 import time
 import os
 import asyncio
+import hashlib
+import json
 import threading
 from typing import Dict, Any, Optional
 from dataclasses import dataclass
@@ -11,6 +13,7 @@ import mlx.core as mx
 from mlx_lm import generate
 from mlx_lm.sample_utils import make_sampler, make_logits_processors
 from container import container, gpu_lock  # импортируем блокировку
+from services.disk_cache import DiskLRUCache
 
 
 @dataclass
@@ -28,13 +31,17 @@ class SummaryResult:
 class BaseSummarizer:
     """Базовый класс для суммаризаторов."""
 
+    # Ключ секции generation_params с параметрами генерации
+    level_key = "l1"
+
     def __init__(
         self,
         model_config: Dict[str, Any],
         config: Dict[str, Any],
         model: Optional[Any] = None,
         tokenizer: Optional[Any] = None,
-        model_lock: Optional[threading.RLock] = None
+        model_lock: Optional[threading.RLock] = None,
+        summary_cache: Optional[DiskLRUCache] = None
     ):
         self.model_name = model_config.get("name", "unknown")
         self.local_path = model_config.get("local_path")
@@ -56,8 +63,7 @@ class BaseSummarizer:
         self._load_error = None
 
         summarization_params = config.get("generation_params", {})
-        model_type = "l1" if "L1" in self.__class__.__name__ else "l2"
-        params = summarization_params.get(model_type, {})
+        params = summarization_params.get(self.level_key, {})
 
         self.max_tokens = params.get("max_tokens", 200)
         self.temperature = params.get("temperature", 0.3)
@@ -70,6 +76,9 @@ class BaseSummarizer:
         self._total_processing_time = 0.0
         self._last_used: Optional[float] = None
 
+        self._summary_cache = summary_cache
+        self._cache_hits = 0
+
     @property
     def logger(self):
         if self._logger is None:
@@ -98,8 +107,9 @@ class BaseSummarizer:
             'successful_requests': self._successful_requests,
             'failed_requests': self._total_requests - self._successful_requests,
             'success_rate': self._successful_requests / max(self._total_requests, 1),
-            'avg_processing_time': self._total_processing_time / max(self._successful_requests, 1),
+            'avg_processing_time': self._total_processing_time / max(self._successful_requests - self._cache_hits, 1),
             'last_used': last_used_iso,
+            'cache_hits': self._cache_hits,
             'generation_params': {
                 'max_tokens': self.max_tokens,
                 'temperature': self.temperature,
@@ -164,7 +174,8 @@ class BaseSummarizer:
                         user_prompt: Optional[str] = None, **kwargs) -> SummaryResult:
         start_time = time.time()
         self._total_requests += 1
-        self.logger.debug(f"📝 [Summarizer] Начало суммаризации, длина текста {len(text)} символов")
+        use_cache = kwargs.pop("use_cache", True) and self._summary_cache is not None
+        self.logger.debug("📝 [Summarizer] Начало суммаризации, длина текста %d символов", len(text))
 
         try:
             if not await self.ensure_loaded():
@@ -186,11 +197,38 @@ class BaseSummarizer:
             repetition_penalty = kwargs.get("repetition_penalty", self.repetition_penalty)
             enable_thinking = False
 
-            self.logger.debug(f"⚙️ [Summarizer] Параметры: max_tokens={max_tokens}, temperature={temperature}, top_p={top_p}")
+            self.logger.debug(
+                "⚙️ [Summarizer] Параметры: max_tokens=%s, temperature=%s, top_p=%s", max_tokens, temperature, top_p
+            )
 
             system = system_prompt if system_prompt is not None else self._get_system_prompt(**kwargs)
             user = user_prompt if user_prompt is not None else self._get_user_prompt(text, **kwargs)
 
+            cache_key = None
+            if use_cache:
+                cache_key = self._make_cache_key(system, user, {
+                    'max_tokens': max_tokens,
+                    'temperature': temperature,
+                    'top_p': top_p,
+                    'top_k': top_k,
+                    'repetition_penalty': repetition_penalty,
+                })
+                cached_summary = self._summary_cache.get(cache_key)
+                if cached_summary is not None:
+                    processing_time = time.time() - start_time
+                    self._successful_requests += 1
+                    self._cache_hits += 1
+                    self._last_used = time.time()
+                    self.logger.debug("♻️ [Summarizer] Суммаризация взята из кэша за %.4f сек", processing_time)
+                    return SummaryResult(
+                        summary=cached_summary,
+                        original_length=len(text),
+                        summary_length=len(cached_summary),
+                        compression_ratio=len(text) / max(len(cached_summary), 1),
+                        processing_time=processing_time,
+                        success=True
+                    )
+
             messages = [
                 {"role": "system", "content": system},
                 {"role": "user", "content": user}
@@ -203,7 +241,7 @@ class BaseSummarizer:
                     add_generation_prompt=True,
                     enable_thinking=enable_thinking
                 )
-                self.logger.debug(f"📜 [Summarizer] Промпт сформирован, длина {len(prompt)} символов")
+                self.logger.debug("📜 [Summarizer] Промпт сформирован, длина %d символов", len(prompt))
             except Exception as e:
                 self.logger.error("🔍 [Summarizer] Ошибка apply_chat_template: %s", e)
                 prompt = f"<|im_start|>system\n{system}<|im_end|>\n"
@@ -233,7 +271,13 @@ class BaseSummarizer:
             self._total_processing_time += processing_time
             self._last_used = time.time()
 
-            self.logger.debug(f"✅ [Summarizer] Суммаризация завершена за {processing_time:.3f} сек, длина суммаризации {len(summary_text)} символов, сжатие {compression_ratio:.2f}")
+            if cache_key and summary_text:
+                self._summary_cache.put(cache_key, summary_text)
+
+            self.logger.debug(
+                "✅ [Summarizer] Суммаризация завершена за %.3f сек, длина суммаризации %d символов, сжатие %.2f",
+                processing_time, len(summary_text), compression_ratio
+            )
 
             return SummaryResult(
                 summary=summary_text,
@@ -258,6 +302,14 @@ class BaseSummarizer:
                 error=error_msg
             )
 
+    def _make_cache_key(self, system: str, user: str, params: Dict[str, Any]) -> str:
+        """Ключ кэша: хэш модели, промптов и параметров генерации."""
+        payload = json.dumps(
+            [self.model_name, self.__class__.__name__, system, user, params],
+            ensure_ascii=False, sort_keys=True
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
     def _clean_response(self, response: str, prompt: str) -> str:
         if response.startswith(prompt):
             response = response[len(prompt):]
@@ -282,6 +334,8 @@ class BaseSummarizer:
 
 
 class L1Summarizer(BaseSummarizer):
+    level_key = "l1"
+
     def _get_system_prompt(self, **kwargs) -> str:
         return """Ты создаёшь детализированные конспекты диалогов для кратковременной памяти системы.
 Твоя задача — сохранить максимум важных деталей, фактов, решений и контекста.
@@ -313,6 +367,8 @@ class L1Summarizer(BaseSummarizer):
 
 
 class L2Summarizer(BaseSummarizer):
+    level_key = "l2"
+
     def _get_system_prompt(self, **kwargs) -> str:
         return """Ты — аналитик истории обсуждений. Твоя задача — создавать сжатые сводные записи на основе нескольких конспектов.
 
@@ -341,4 +397,37 @@ class L2Summarizer(BaseSummarizer):
             cleaned = cleaned.replace("[L1 Summary]", "[L2 Summary]")
         elif cleaned and not cleaned.startswith("[L2 Summary]"):
             cleaned = f"[L2 Summary] {cleaned}"
-        return cleaned.strip()
\ No newline at end of file
+        return cleaned.strip()
+
+
+class L3Summarizer(BaseSummarizer):
+    """Сливает старейшие блоки кумулятивной строки в один блок более высокого уровня."""
+    level_key = "l3"
+
+    def _get_system_prompt(self, **kwargs) -> str:
+        return """Ты — архивариус долгой истории обсуждения. Тебе дают несколько сводных записей о последовательных частях диалога.
+Твоя задача — объединить их в одну общую запись, которая заменит их в долговременной памяти.
+
+Требования к объединённой записи:
+0. Не используй заголовки, форматирование и Markdown, не общайся и не пиши вводных слов - только запись
+1. Сохрани хронологию и основные темы всех записей
+2. Оставь только то, что может понадобиться в дальнейшем: решения, договорённости, ключевые факты и имена
+3. Опускай второстепенные детали и повторы
+4. Запись должна быть не длиннее самой длинной из исходных записей
+5. Запись должна быть на языке исходных записей
+
+Формат: краткий связный текст, 2-4 предложения."""
+
+    def _get_user_prompt(self, text: str, **kwargs) -> str:
+        return f"""Сводные записи частей диалога (в хронологическом порядке):
+
+{text}
+
+Объедини их в одну запись, следуя требованиям выше:"""
+
+    def _clean_response(self, response: str, prompt: str) -> str:
+        cleaned = super()._clean_response(response, prompt)
+        cleaned = re.sub(r'^\[L[12] Summary\]\s*', '', cleaned)
+        if cleaned and not cleaned.startswith("[L3 Summary]"):
+            cleaned = f"[L3 Summary] {cleaned}"
+        return cleaned.strip()
@@ -0,0 +1,106 @@
+# services/context/tokens.py
+"""
+Подсчёт токенов для бюджетирования контекста.
+
+Счётчик использует токенизатор уже загруженной модели (суммаризатора или
+основной) и кэширует результат для каждого сегмента текста: взаимодействия,
+чанка L1, блока кумулятивной строки. Повторный подсчёт одного и того же
+сегмента сводится к поиску в словаре.
+"""
+import threading
+from collections import OrderedDict
+from typing import Any, Optional
+
+from container import container
+
+
+# Грубая оценка, пока ни один токенизатор не загружен
+CHARS_PER_TOKEN_ESTIMATE = 4
+
+
+class TokenCounter:
+    """Кэширующий счётчик токенов с LRU-вытеснением."""
+
+    def __init__(self, cache_size: int = 4096):
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, int]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._tokenizer_id: Optional[int] = None
+        self._hits = 0
+        self._misses = 0
+        self._logger = None
+
+    @property
+    def logger(self):
+        if self._logger is None:
+            self._logger = container.get_logger()
+        return self._logger
+
+    def configure(self, config: dict):
+        """Применяет настройки из секции context.accounting."""
+        self.cache_size = config.get("token_cache_size", self.cache_size)
+
+    def _resolve_tokenizer(self) -> Optional[Any]:
+        """Возвращает токенизатор, не инициируя загрузку моделей."""
+        from services.context.summarizer_factory import SummarizerFactory
+        if SummarizerFactory._shared_tokenizer is not None:
+            return SummarizerFactory._shared_tokenizer
+
+        from services.model.lifecycle import model_lifecycle_manager
+        if model_lifecycle_manager.is_initialized():
+            _, tokenizer = model_lifecycle_manager.get_model_and_tokenizer()
+            return tokenizer
+        return None
+
+    @staticmethod
+    def estimate(text: str) -> int:
+        """Оценка числа токенов без токенизатора."""
+        return (len(text) + CHARS_PER_TOKEN_ESTIMATE - 1) // CHARS_PER_TOKEN_ESTIMATE
+
+    def count(self, text: str) -> int:
+        """Возвращает число токенов в тексте (с кэшированием)."""
+        if not text:
+            return 0
+
+        tokenizer = self._resolve_tokenizer()
+        if tokenizer is None:
+            # Оценки не кэшируем: после загрузки токенизатора нужны точные значения
+            return self.estimate(text)
+
+        with self._lock:
+            if self._tokenizer_id != id(tokenizer):
+                self._cache.clear()
+                self._tokenizer_id = id(tokenizer)
+
+            cached = self._cache.get(text)
+            if cached is not None:
+                self._cache.move_to_end(text)
+                self._hits += 1
+                return cached
+
+        try:
+            tokens = len(tokenizer.encode(text, add_special_tokens=False))
+        except Exception as e:
+            self.logger.warning("⚠️ Ошибка подсчёта токенов, используется оценка: %s", e)
+            return self.estimate(text)
+
+        with self._lock:
+            self._misses += 1
+            self._cache[text] = tokens
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return tokens
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                "cached_segments": len(self._cache),
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_ratio": self._hits / total if total else 0.0,
+            }
+
+
+# Глобальный экземпляр
+token_counter = TokenCounter()
@@ -4,6 +4,7 @@
 """
 from typing import Optional
 from container import container
+from models.context import DialogContextState
 
 
 class SummarizationTrigger:
@@ -14,26 +15,49 @@ class SummarizationTrigger:
         raw_tail_config = structure.get("raw_tail", {})
         thresholds = structure.get("thresholds", {})
 
+        self.accounting_mode = config.get("accounting", {}).get("mode", "chars")
         self.raw_tail_char_limit = raw_tail_config.get("char_limit", 2000)
+        self.raw_tail_token_limit = raw_tail_config.get("token_limit", 1000)
         self.l1_summary_threshold = thresholds.get("l2_trigger_count", 4)
+        self.cumulative_char_limit = thresholds.get("cumulative_char_limit", 6000)
+        self.cumulative_token_limit = thresholds.get("cumulative_token_limit", 2000)
         self._logger = container.get_logger()
 
-    def should_trigger_l1(self, raw_tail: str) -> bool:
+    @property
+    def uses_tokens(self) -> bool:
+        return self.accounting_mode == "tokens"
+
+    def should_trigger_l1(self, state: DialogContextState) -> bool:
         """Проверяет, нужно ли запустить L1 суммаризацию из-за переполнения."""
-        current_len = len(raw_tail)
-        limit = self.raw_tail_char_limit
+        if self.uses_tokens:
+            current_len, limit, unit = state.raw_tail_token_count, self.raw_tail_token_limit, "ток."
+        else:
+            current_len, limit, unit = len(state.raw_tail), self.raw_tail_char_limit, "симв."
         triggered = current_len > limit
         if triggered:
-            self._logger.debug(f"🚨 [Trigger] L1 триггер: {current_len} > {limit}")
+            self._logger.debug("🚨 [Trigger] L1 триггер: %d > %d %s", current_len, limit, unit)
         else:
-            self._logger.debug(f"📏 [Trigger] L1 не требуется: {current_len} <= {limit}")
+            self._logger.debug("📏 [Trigger] L1 не требуется: %d <= %d %s", current_len, limit, unit)
         return triggered
 
     def should_trigger_l2(self, l1_chunks_count: int) -> bool:
         """Проверяет, нужно ли запустить L2 суммаризацию."""
         triggered = l1_chunks_count >= self.l1_summary_threshold
         if triggered:
-            self._logger.debug(f"🚨 [Trigger] L2 триггер: {l1_chunks_count} >= {self.l1_summary_threshold}")
+            self._logger.debug("🚨 [Trigger] L2 триггер: %d >= %d", l1_chunks_count, self.l1_summary_threshold)
         else:
-            self._logger.debug(f"📏 [Trigger] L2 не требуется: {l1_chunks_count} < {self.l1_summary_threshold}")
-        return triggered
\ No newline at end of file
+            self._logger.debug("📏 [Trigger] L2 не требуется: %d < %d", l1_chunks_count, self.l1_summary_threshold)
+        return triggered
+
+    def should_trigger_l3(self, state: DialogContextState) -> bool:
+        """Проверяет, нужно ли уплотнить кумулятивную строку слиянием старейших блоков."""
+        content = state.cumulative_context.content
+        if self.uses_tokens:
+            from services.context.tokens import token_counter
+            current_len, limit, unit = token_counter.count(content), self.cumulative_token_limit, "ток."
+        else:
+            current_len, limit, unit = len(content), self.cumulative_char_limit, "симв."
+        triggered = limit > 0 and current_len > limit
+        if triggered:
+            self._logger.debug("🚨 [Trigger] L3 триггер: %d > %d %s", current_len, limit, unit)
+        return triggered
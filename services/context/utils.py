@@ -3,7 +3,7 @@
 Утилиты для работы с контекстом
 """
 import re
-from typing import List
+from typing import Callable, List, Optional
 
 # Вместо импорта MessageInteraction, создаем простую структуру
 from .interaction import SimpleInteraction
@@ -84,21 +84,24 @@ def parse_text_to_interactions(text: str) -> List[SimpleInteraction]:
 def group_interactions_into_chunks(
     interactions: List[SimpleInteraction], 
     target_chars: int,
-    allow_overflow: bool = True  # Новый параметр
+    allow_overflow: bool = True,  # Новый параметр
+    size_fn: Optional[Callable[[SimpleInteraction], int]] = None
 ) -> List[List[SimpleInteraction]]:
     """
     Группирует взаимодействия в чанки с учетом разрешения переполнения.
     
     Args:
+        target_chars: Целевой размер чанка в единицах size_fn
         allow_overflow: Если True, разрешает переполнение чанка,
                        если он состоит из одного большого взаимодействия
+        size_fn: Функция размера взаимодействия (по умолчанию — число символов)
     """
     chunks = []
     current_chunk = []
     current_size = 0
     
     for interaction in interactions:
-        interaction_size = interaction.char_count
+        interaction_size = size_fn(interaction) if size_fn else interaction.char_count
         
         # ПРАВИЛО 1: Разрешить переполнение одним большим взаимодействием
         if allow_overflow and interaction_size > target_chars:
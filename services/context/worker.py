@@ -74,27 +74,27 @@ class SummaryWorker:
                 if task is None:
                     continue
 
-                self.logger.debug(f"📥 [Worker] Получена задача {task.task_id} типа {task.task_type}")
+                self.logger.debug("📥 [Worker] Получена задача %s типа %s", task.task_id, task.task_type)
 
                 if time.time() - task.created_at < self.delay:
                     wait = self.delay - (time.time() - task.created_at)
-                    self.logger.debug(f"⏳ [Worker] Задача {task.task_id} ожидает {wait:.3f} сек (задержка {self.delay} сек)")
+                    self.logger.debug("⏳ [Worker] Задача %s ожидает %.3f сек (задержка %s сек)", task.task_id, wait, self.delay)
                     time.sleep(self.delay)
 
                 try:
                     summarizers = self._get_summarizers()
                     if task.task_type == "l1":
                         summarizer = summarizers["l1"]
-                        self.logger.debug(f"▶️ [Worker] Запуск L1 суммаризации для задачи {task.task_id}")
+                        self.logger.debug("▶️ [Worker] Запуск L1 суммаризации для задачи %s", task.task_id)
                         result = self._loop.run_until_complete(
                             summarizer.summarize(task.data["text"], **task.extra_params)
                         )
                         if task.callback and result.success:
                             task.callback(result.summary, task.data)
-                        self.logger.debug(f"✅ [Worker] Задача {task.task_id} выполнена успешно, время обработки {result.processing_time:.3f} сек")
+                        self.logger.debug("✅ [Worker] Задача %s выполнена успешно, время обработки %.3f сек", task.task_id, result.processing_time)
                     elif task.task_type == "l2":
                         summarizer = summarizers["l2"]
-                        self.logger.debug(f"▶️ [Worker] Запуск L2 суммаризации для задачи {task.task_id}")
+                        self.logger.debug("▶️ [Worker] Запуск L2 суммаризации для задачи %s", task.task_id)
                         result = self._loop.run_until_complete(
                             summarizer.summarize(task.data["text"], **task.extra_params)
                         )
@@ -105,13 +105,13 @@ class SummaryWorker:
                                 task.data["l1_chunk_ids"],
                                 task.data["original_char_count"]
                             )
-                        self.logger.debug(f"✅ [Worker] Задача {task.task_id} выполнена успешно, время обработки {result.processing_time:.3f} сек")
+                        self.logger.debug("✅ [Worker] Задача %s выполнена успешно, время обработки %.3f сек", task.task_id, result.processing_time)
                     else:
                         raise ValueError(f"Unknown task type: {task.task_type}")
 
                     self.scheduler.task_done()
                 except Exception as e:
-                    self.logger.error(f"❌ [Worker] Ошибка при выполнении задачи {task.task_id}: {e}")
+                    self.logger.error("❌ [Worker] Ошибка при выполнении задачи %s: %s", task.task_id, e)
                     self.scheduler.task_done()
         finally:
             if self._loop is not None:
@@ -1,11 +1,24 @@
 # services/context/worker_async.py
 import asyncio
 import threading
+import time
 from typing import Dict, Any, Optional, Callable
 
 from services.context.summarizer_factory import SummarizerFactory
+from services.metrics import metrics
+from services.watchdog import loop_watchdog
 from container import container
 
+SUMMARY_QUEUE_DEPTH = metrics.gauge(
+    "chat_summary_queue_depth", "Задачи суммаризации, ожидающие в очереди воркера"
+)
+SUMMARY_QUEUE_WAIT = metrics.histogram(
+    "chat_summary_queue_wait_seconds", "Ожидание задачи суммаризации в очереди (с учётом задержки)", ("type",)
+)
+SUMMARY_TASK_SECONDS = metrics.histogram(
+    "chat_summary_task_seconds", "Выполнение задачи суммаризации", ("type", "status")
+)
+
 
 class AsyncSummaryWorker:
     """
@@ -22,6 +35,7 @@ class AsyncSummaryWorker:
         self._task_queue: Optional[asyncio.Queue] = None
         self._logger = container.get_logger()
         self._queue_ready = threading.Event()
+        SUMMARY_QUEUE_DEPTH.set_function(lambda: self._task_queue.qsize() if self._task_queue is not None else 0)
 
     def start(self):
         if self._thread is not None and self._thread.is_alive():
@@ -50,6 +64,7 @@ class AsyncSummaryWorker:
         self._loop = asyncio.get_running_loop()
         self._task_queue = asyncio.Queue()
         self._queue_ready.set()
+        loop_watchdog.watch_running_loop("summary_worker")
 
         summarizers = SummarizerFactory.get_all_summarizers(self.config)
 
@@ -79,6 +94,7 @@ class AsyncSummaryWorker:
             self._logger.debug("⏳ [AsyncWorker] Ожидание завершения оставшихся задач...")
             await self._task_queue.join()
 
+        loop_watchdog.unwatch("summary_worker")
         self._logger.debug("✅ [AsyncWorker] Завершение работы")
 
     async def _process_tasks(self, summarizers):
@@ -87,41 +103,54 @@ class AsyncSummaryWorker:
             # Ждём задачу из очереди (блокируется до появления задачи)
             task = await self._task_queue.get()
 
-            self._logger.debug(f"📥 [AsyncWorker] Получена задача {task['task_id']} типа {task['task_type']}")
+            self._logger.debug("📥 [AsyncWorker] Получена задача %s типа %s", task["task_id"], task["task_type"])
 
             # Задержка перед выполнением (если задана)
             delay = self.config.get("performance", {}).get("summary_delay_ms", 1000) / 1000.0
             if delay > 0:
                 await asyncio.sleep(delay)
 
+            started = time.perf_counter()
+            SUMMARY_QUEUE_WAIT.observe(started - task["submitted_at"], type=task["task_type"])
+            status = "error"
+            summary = None
             try:
-                if task["task_type"] == "l1":
-                    summarizer = summarizers["l1"]
-                    result = await summarizer.summarize(
-                        task["text"],
-                        **task.get("params", {})
-                    )
-                    if result.success and task.get("callback"):
-                        task["callback"](result.summary, task["data"])
-                elif task["task_type"] == "l2":
-                    summarizer = summarizers["l2"]
+                summarizer = summarizers.get(task["task_type"])
+                if summarizer is None:
+                    self._logger.error("❌ [AsyncWorker] Неизвестный тип задачи: %s", task["task_type"])
+                else:
                     result = await summarizer.summarize(
                         task["text"],
                         **task.get("params", {})
                     )
-                    if result.success and task.get("callback"):
-                        task["callback"](
-                            result.summary,
-                            task["data"]["text"],
-                            task["data"]["l1_chunk_ids"],
-                            task["data"]["original_char_count"]
-                        )
-                else:
-                    self._logger.error(f"❌ [AsyncWorker] Неизвестный тип задачи: {task['task_type']}")
+                    status = "ok" if result.success else "failed"
+                    if result.success:
+                        summary = result.summary
             except Exception as e:
-                self._logger.error(f"❌ [AsyncWorker] Ошибка при обработке задачи: {e}", exc_info=True)
+                self._logger.error("❌ [AsyncWorker] Ошибка при обработке задачи: %s", e, exc_info=True)
             finally:
-                self._task_queue.task_done()
+                SUMMARY_TASK_SECONDS.observe(time.perf_counter() - started, type=task["task_type"], status=status)
+                try:
+                    # Колбэк вызывается и при ошибке (summary=None), чтобы владелец снял флаг задачи
+                    self._run_callback(task, summary)
+                finally:
+                    self._task_queue.task_done()
+
+    def _run_callback(self, task: Dict[str, Any], summary: Optional[str]):
+        """Передаёт результат задачи в колбэк (None — суммаризация не удалась)."""
+        callback = task.get("callback")
+        if callback is None:
+            return
+        data = task["data"]
+        try:
+            if task["task_type"] == "l1":
+                callback(summary, data)
+            elif task["task_type"] == "l2":
+                callback(summary, data["text"], data["l1_chunk_ids"], data["original_char_count"])
+            elif task["task_type"] == "l3":
+                callback(summary, data["block_ids"])
+        except Exception as e:
+            self._logger.error("❌ [AsyncWorker] Ошибка в колбэке задачи %s: %s", task["task_id"], e, exc_info=True)
 
     def submit_task(self, task_type: str, text: str, callback: Optional[Callable] = None,
                     data: Optional[Dict] = None, params: Optional[Dict] = None) -> str:
@@ -136,8 +165,9 @@ class AsyncSummaryWorker:
             "text": text,
             "callback": callback,
             "data": data or {},
-            "params": params or {}
+            "params": params or {},
+            "submitted_at": time.perf_counter(),
         }
         self._loop.call_soon_threadsafe(self._task_queue.put_nowait, task)
-        self._logger.debug(f"📤 [AsyncWorker] Задача {task_id} добавлена в очередь")
+        self._logger.debug("📤 [AsyncWorker] Задача %s добавлена в очередь", task_id)
         return task_id
\ No newline at end of file
@@ -0,0 +1,179 @@
+# services/dialogs/dialog_index.py
+"""
+Упорядоченный индекс видимых диалогов для боковой панели.
+
+Индекс держит видимые диалоги уже отсортированными: закреплённые — по
+позиции, остальные — по времени обновления (новые первыми). Диалог сам
+сообщает индексу об изменении полей, влияющих на список (имя, время
+обновления, закрепление, видимость), и индекс переставляет только его
+запись, находя место бинарным поиском. Строки списка кэшируются по
+диалогам и пересоздаются только для изменившихся. Каждое изменение
+увеличивает версию индекса — по ней кэшируется готовый список, а журнал
+изменений позволяет отдать браузеру только разницу между версиями.
+"""
+import threading
+from bisect import bisect_left, bisect_right, insort
+from operator import itemgetter
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from models.dialog import Dialog
+
+# Позиция закреплённого диалога, если она не задана (как в прежней сортировке)
+_NO_POSITION = 999
+
+# Сколько последних изменений помнит журнал; для более старых версий
+# разница не строится и отправляется полный список
+_CHANGE_LOG_LIMIT = 4096
+
+
+class DialogIndex:
+    """Видимые диалоги, упорядоченные для отображения в списке."""
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.version = 0
+        self._dialogs: Dict[str, Dialog] = {}
+        # Ключи сортировки: (позиция, id) для закреплённых, (-время обновления, id) для остальных
+        self._pinned: List[Tuple[int, str]] = []
+        self._recent: List[Tuple[float, str]] = []
+        # dialog_id -> (закреплён, ключ) для диалогов, попавших в список
+        self._keys: Dict[str, Tuple[bool, tuple]] = {}
+        self._rows: Dict[str, Dict[str, Any]] = {}
+        # Журнал (версия, dialog_id); изменения до _log_floor неизвестны
+        self._change_log: List[Tuple[int, str]] = []
+        self._log_floor = 0
+
+    # ========== Изменение индекса ==========
+
+    def rebuild(self, dialogs: Dict[str, Dialog]):
+        """Строит индекс заново (при загрузке диалогов)."""
+        with self.lock:
+            for dialog in self._dialogs.values():
+                dialog.set_change_listener(None)
+            self._dialogs = {}
+            self._pinned = []
+            self._recent = []
+            self._keys = {}
+            self._rows = {}
+            for dialog in dialogs.values():
+                self._dialogs[dialog.id] = dialog
+                dialog.set_change_listener(self._on_dialog_changed)
+                key = self._sort_key(dialog)
+                if key is not None:
+                    self._keys[dialog.id] = key
+                    (self._pinned if key[0] else self._recent).append(key[1])
+            self._pinned.sort()
+            self._recent.sort()
+            self.version += 1
+            self._change_log = []
+            self._log_floor = self.version
+
+    def add(self, dialog: Dialog):
+        """Добавляет диалог и подписывается на его изменения."""
+        with self.lock:
+            self._dialogs[dialog.id] = dialog
+            dialog.set_change_listener(self._on_dialog_changed)
+            self._reposition(dialog)
+
+    def remove(self, dialog_id: str):
+        """Убирает диалог из индекса (после удаления)."""
+        with self.lock:
+            dialog = self._dialogs.pop(dialog_id, None)
+            if dialog is None:
+                return
+            dialog.set_change_listener(None)
+            self._unplace(dialog_id)
+            self._rows.pop(dialog_id, None)
+            self._log_change(dialog_id)
+
+    def _on_dialog_changed(self, dialog: Dialog):
+        with self.lock:
+            if self._dialogs.get(dialog.id) is dialog:
+                self._reposition(dialog)
+
+    def _reposition(self, dialog: Dialog):
+        self._unplace(dialog.id)
+        self._rows.pop(dialog.id, None)
+        key = self._sort_key(dialog)
+        if key is not None:
+            self._keys[dialog.id] = key
+            insort(self._pinned if key[0] else self._recent, key[1])
+        self._log_change(dialog.id)
+
+    def _log_change(self, dialog_id: str):
+        self.version += 1
+        self._change_log.append((self.version, dialog_id))
+        if len(self._change_log) > _CHANGE_LOG_LIMIT:
+            dropped = len(self._change_log) // 2
+            self._log_floor = self._change_log[dropped - 1][0]
+            del self._change_log[:dropped]
+
+    def _unplace(self, dialog_id: str):
+        entry = self._keys.pop(dialog_id, None)
+        if entry is None:
+            return
+        pinned, key = entry
+        keys = self._pinned if pinned else self._recent
+        i = bisect_left(keys, key)
+        if i < len(keys) and keys[i] == key:
+            del keys[i]
+
+    @staticmethod
+    def _sort_key(dialog: Dialog) -> Optional[Tuple[bool, tuple]]:
+        if not dialog.visible:
+            return None
+        if dialog.pinned:
+            position = dialog.pinned_position if dialog.pinned_position is not None else _NO_POSITION
+            return True, (position, dialog.id)
+        return False, (-dialog.updated.timestamp(), dialog.id)
+
+    # ========== Чтение (под self.lock) ==========
+
+    @property
+    def pinned_ids(self) -> List[str]:
+        """ID закреплённых диалогов по возрастанию позиции."""
+        return [dialog_id for _, dialog_id in self._pinned]
+
+    @property
+    def recent_keys(self) -> List[Tuple[float, str]]:
+        """Ключи (-время обновления, id) незакреплённых диалогов, новые первыми."""
+        return self._recent
+
+    def changes_since(self, version: int) -> Optional[Set[str]]:
+        """ID диалогов, изменённых после версии (None — журнал столько не помнит)."""
+        if version < self._log_floor or version > self.version:
+            return None
+        start = bisect_right(self._change_log, version, key=itemgetter(0))
+        return {dialog_id for _, dialog_id in self._change_log[start:]}
+
+    def placement(self, dialog_id: str) -> Optional[Tuple[bool, tuple, Optional[tuple]]]:
+        """(закреплён, ключ, ключ следующего диалога того же списка) или None, если диалог не в списке."""
+        entry = self._keys.get(dialog_id)
+        if entry is None:
+            return None
+        pinned, key = entry
+        keys = self._pinned if pinned else self._recent
+        i = bisect_left(keys, key)
+        return pinned, key, keys[i + 1] if i + 1 < len(keys) else None
+
+    def __contains__(self, dialog_id: str) -> bool:
+        return dialog_id in self._keys
+
+    def row(self, dialog_id: str) -> Dict[str, Any]:
+        """Строка списка для диалога (без признака текущего)."""
+        row = self._rows.get(dialog_id)
+        if row is None:
+            dialog = self._dialogs[dialog_id]
+            row = self._rows[dialog_id] = {
+                "id": dialog_id,
+                "name": dialog.name,
+                "history_length": dialog.message_count,
+                "created": dialog.created.isoformat(),
+                "updated": dialog.updated.isoformat(),
+                "pinned": dialog.pinned,
+                "pinned_position": dialog.pinned_position,
+            }
+        return row
+
+    def __len__(self) -> int:
+        return len(self._keys)
@@ -1,103 +1,131 @@
 """
 Группировка диалогов по датам
 """
-from datetime import datetime, timedelta, date
-from typing import Dict, List, Any
-from models.dialog import Dialog
+from bisect import bisect_right
+from datetime import datetime, timedelta, date, time
+from operator import itemgetter
+from typing import Dict, List, Any, Optional, Tuple
+from .dialog_index import DialogIndex
 
 
 class DialogGrouper:
-    """Группировка диалогов для отображения"""
-    
-    @staticmethod
-    def get_dialog_list(dialogs: Dict[str, Dialog], 
-                       current_dialog_id: str) -> List[Dict[str, Any]]:
-        """Получает список всех видимых диалогов."""
-        dialogs_list = []
-        for dialog_id, dialog in dialogs.items():
-            if not dialog.visible:   # <-- пропускаем невидимые
-                continue
-            dialog_info = {
-                "id": dialog_id,
-                "name": dialog.name,
-                "history_length": len(dialog.history),
-                "created": dialog.created.isoformat(),
-                "updated": dialog.updated.isoformat(),
-                "is_current": (dialog_id == current_dialog_id),
-                "pinned": dialog.pinned,
-                "pinned_position": dialog.pinned_position
-            }
-            dialogs_list.append(dialog_info)
-        
-        # Сортировка: закрепленные → обычные
-        dialogs_list.sort(key=lambda x: (
-            -1 if x["pinned"] else 0,
-            x["pinned_position"] if x["pinned"] and x["pinned_position"] is not None else 999,
-            x["updated"]
-        ), reverse=True)
-        
-        return dialogs_list
-    
-    @staticmethod
-    def get_dialog_list_with_groups(dialogs: Dict[str, Dialog],
-                                   current_dialog_id: str) -> Dict[str, List[Dict[str, Any]]]:
+    """Группировка диалогов для отображения (поверх упорядоченного индекса)"""
+
+    GROUP_LABELS = {
+        "pinned": "Закрепленные",
+        "today": "Сегодня",
+        "yesterday": "Вчера",
+        "week": "7 дней",
+        "month": "Месяц",
+        "older": "Более месяца"
+    }
+
+    def __init__(self, index: DialogIndex):
+        self.index = index
+        # Результаты кэшируются по версии индекса (и дате для групп)
+        self._list_key = None
+        self._list: List[Dict[str, Any]] = []
+        self._groups_key = None
+        self._groups: Dict[str, List[Dict[str, Any]]] = {}
+        self._day_starts_date = None
+        self._day_starts: List[float] = []
+
+    def _with_current(self, dialog_id: str, current_dialog_id: Optional[str]) -> Dict[str, Any]:
+        row = dict(self.index.row(dialog_id))
+        row["is_current"] = (dialog_id == current_dialog_id)
+        return row
+
+    def get_dialog_list(self, current_dialog_id: Optional[str]) -> List[Dict[str, Any]]:
+        """Получает список всех видимых диалогов: обычные (новые первыми) → закрепленные."""
+        with self.index.lock:
+            key = (self.index.version, current_dialog_id)
+            if key != self._list_key:
+                dialogs_list = [
+                    self._with_current(dialog_id, current_dialog_id)
+                    for _, dialog_id in self.index.recent_keys
+                ]
+                dialogs_list.extend(
+                    self._with_current(dialog_id, current_dialog_id)
+                    for dialog_id in reversed(self.index.pinned_ids)
+                )
+                self._list, self._list_key = dialogs_list, key
+            return self._list
+
+    def get_dialog_list_with_groups(self, current_dialog_id: Optional[str]) -> Dict[str, List[Dict[str, Any]]]:
         """Группирует диалоги по категориям"""
-        dialogs_list = DialogGrouper.get_dialog_list(dialogs, current_dialog_id)
-        
         today_date = date.today()
-        yesterday_date = today_date - timedelta(days=1)
-        week_ago_date = today_date - timedelta(days=7)
-        month_ago_date = today_date - timedelta(days=30)
-        
-        groups = {
-            "pinned": [],
-            "today": [],
-            "yesterday": [],
-            "week": [],
-            "month": [],
-            "older": []
+        with self.index.lock:
+            key = (self.index.version, today_date, current_dialog_id)
+            if key != self._groups_key:
+                self._groups = self._build_groups(today_date, current_dialog_id)
+                self._groups_key = key
+            return self._groups
+
+    def _build_groups(self, today_date: date, current_dialog_id: Optional[str]) -> Dict[str, List[Dict[str, Any]]]:
+        # Незакреплённые диалоги уже упорядочены по убыванию времени обновления,
+        # поэтому границы групп находятся бинарным поиском по началу суток
+        recent = self.index.recent_keys
+        bounds = [self._count_newer(recent, day_start) for day_start in self._get_day_starts(today_date)]
+
+        slices = {
+            "today": recent[:bounds[0]],
+            "yesterday": recent[bounds[0]:bounds[1]],
+            "week": recent[bounds[1]:bounds[2]],
+            "month": recent[bounds[2]:bounds[3]],
+            "older": recent[bounds[3]:],
         }
-        
-        for dialog_info in dialogs_list:
-            if dialog_info.get("pinned", False):
-                groups["pinned"].append(dialog_info)
-                continue
-            
-            try:
-                last_update = datetime.fromisoformat(dialog_info["updated"].replace('Z', '+00:00'))
-                last_update_date = last_update.date()
-                
-                if last_update_date == today_date:
-                    groups["today"].append(dialog_info)
-                elif last_update_date == yesterday_date:
-                    groups["yesterday"].append(dialog_info)
-                elif week_ago_date <= last_update_date < yesterday_date:
-                    groups["week"].append(dialog_info)
-                elif month_ago_date <= last_update_date < week_ago_date:
-                    groups["month"].append(dialog_info)
-                else:
-                    groups["older"].append(dialog_info)
-                    
-            except Exception:
-                groups["older"].append(dialog_info)
-        
-        # Сортировка закрепленных
-        if groups["pinned"]:
-            groups["pinned"].sort(key=lambda x: x.get("pinned_position", 999))
-        
-        # Формируем результат
+
         result = {}
-        group_mapping = {
-            "pinned": "Закрепленные",
-            "today": "Сегодня", 
-            "yesterday": "Вчера",
-            "week": "7 дней",
-            "month": "Месяц",
-            "older": "Более месяца"
-        }
-        
-        for group_key, group_data in groups.items():
-            if group_data:
-                result[group_mapping[group_key]] = group_data
-        
-        return result
\ No newline at end of file
+        pinned_ids = self.index.pinned_ids
+        if pinned_ids:
+            result[self.GROUP_LABELS["pinned"]] = [
+                self._with_current(dialog_id, current_dialog_id) for dialog_id in pinned_ids
+            ]
+        for group_key, keys in slices.items():
+            if keys:
+                result[self.GROUP_LABELS[group_key]] = [
+                    self._with_current(dialog_id, current_dialog_id) for _, dialog_id in keys
+                ]
+        return result
+
+    def locate(self, dialog_id: str, today_date: date) -> Optional[Tuple[str, Optional[str], tuple]]:
+        """
+        Место диалога в сгруппированном списке (под index.lock):
+        (группа, ID следующего диалога той же группы или None, ключ порядка).
+        None — диалога в списке нет.
+        """
+        placement = self.index.placement(dialog_id)
+        if placement is None:
+            return None
+        pinned, key, next_key = placement
+        if pinned:
+            return self.GROUP_LABELS["pinned"], next_key[1] if next_key else None, (0,) + key
+
+        day_starts = self._get_day_starts(today_date)
+        group = self._recent_group(key, day_starts)
+        before = None
+        if next_key is not None and self._recent_group(next_key, day_starts) == group:
+            before = next_key[1]
+        return group, before, (1,) + key
+
+    def _get_day_starts(self, today_date: date) -> List[float]:
+        """Начала суток для границ групп: сегодня, вчера, 7 и 30 дней назад."""
+        if self._day_starts_date != today_date:
+            self._day_starts = [
+                datetime.combine(today_date - timedelta(days=days), time.min).timestamp()
+                for days in (0, 1, 7, 30)
+            ]
+            self._day_starts_date = today_date
+        return self._day_starts
+
+    def _recent_group(self, key: tuple, day_starts: List[float]) -> str:
+        updated = -key[0]
+        for group_key, day_start in zip(("today", "yesterday", "week", "month"), day_starts):
+            if updated >= day_start:
+                return self.GROUP_LABELS[group_key]
+        return self.GROUP_LABELS["older"]
+
+    @staticmethod
+    def _count_newer(recent_keys, timestamp: float) -> int:
+        """Число диалогов, обновлённых не раньше timestamp."""
+        return bisect_right(recent_keys, -timestamp, key=itemgetter(0))
@@ -5,10 +5,12 @@
 from typing import Dict, Optional, List, Any
 from models.dialog import Dialog
 from models.enums import MessageRole
-from .storage import DialogStorage
+from services.storage import get_storage_backend, get_search_index
 from .operations import DialogOperations
 from .pinning import DialogPinning
 from .grouper import DialogGrouper
+from .dialog_index import DialogIndex
+from .residency import HistoryResidency
 
 
 class DialogManager:
@@ -21,10 +23,15 @@ class DialogManager:
             config = container.get_config()
         
         self.config = config.get("dialogs", {})
-        self.storage = DialogStorage(config)
+        self.storage = get_storage_backend(self.config)
+        self.search_index = get_search_index(self.config)
         self.operations = DialogOperations()
         self.pinning = DialogPinning()
-        self.grouper = DialogGrouper()
+        self.index = DialogIndex()
+        self.grouper = DialogGrouper(self.index)
+        self.residency = HistoryResidency(
+            self.config.get("resident_history", {}), on_evict=self._on_history_evicted
+        )
         
         self.dialogs: Dict[str, Dialog] = {}
         self.current_dialog_id: Optional[str] = None
@@ -36,6 +43,10 @@ class DialogManager:
     def _init_dialogs(self):
         """Инициализация диалогов из хранилища"""
         self.dialogs = self.storage.load_dialogs()
+        self.index.rebuild(self.dialogs)
+        if self.search_index is not None:
+            # Истории, записанные до появления поискового индекса, индексируются в фоне
+            self.search_index.start_backfill(list(self.dialogs.values()), self.storage)
         
         if self.dialogs:
             # Обновляем счетчик ID
@@ -59,7 +70,9 @@ class DialogManager:
         if dialog_id:
             self.next_dialog_id += 1
             self.current_dialog_id = dialog_id
+            self.index.add(self.dialogs[dialog_id])
             self.storage.save_dialog(self.dialogs[dialog_id])
+            self.residency.touch(self.dialogs[dialog_id], protected_id=dialog_id)
         
         return dialog_id
     
@@ -71,6 +84,7 @@ class DialogManager:
     
     def switch_dialog(self, dialog_id: str) -> bool:
         if dialog_id in self.dialogs:
+            self._ensure_history_loaded(self.dialogs[dialog_id])
             self.current_dialog_id = dialog_id
             return True
         return False
@@ -84,6 +98,10 @@ class DialogManager:
             storage=self.storage
         )
         
+        if result:
+            self.index.remove(dialog_id)
+            self.residency.forget(dialog_id)
+
         if result and self.current_dialog_id == dialog_id:
             # Если удалили текущий, выбираем самый недавно обновлённый диалог
             if self.dialogs:
@@ -119,30 +137,51 @@ class DialogManager:
         return result
     
     def get_current_dialog(self) -> Optional[Dialog]:
-        return self.operations.get_current_dialog(
+        dialog = self.operations.get_current_dialog(
             dialogs=self.dialogs,
             current_dialog_id=self.current_dialog_id
         )
+        if dialog is not None:
+            self._ensure_history_loaded(dialog)
+        return dialog
     
     def get_dialog(self, dialog_id: str) -> Optional[Dialog]:
-        return self.dialogs.get(dialog_id)
+        dialog = self.dialogs.get(dialog_id)
+        if dialog is not None:
+            self._ensure_history_loaded(dialog)
+        return dialog
+    
+    async def get_dialog_async(self, dialog_id: str) -> Optional[Dialog]:
+        """get_dialog для event loop: история подгружается без блокировки цикла"""
+        dialog = self.dialogs.get(dialog_id)
+        if dialog is not None:
+            if not dialog.is_history_loaded:
+                await self.storage.load_history_async(dialog)
+            self.residency.touch(dialog, protected_id=self.current_dialog_id)
+        return dialog
+    
+    def _ensure_history_loaded(self, dialog: Dialog):
+        """Подгружает историю диалога при обращении и обновляет набор резидентных историй"""
+        if not dialog.is_history_loaded:
+            self.storage.load_history(dialog)
+        self.residency.touch(dialog, protected_id=self.current_dialog_id)
+
+    @staticmethod
+    def _on_history_evicted(dialog: Dialog):
+        """Вместе с историей выгружаем и менеджер контекста, если он не занят"""
+        from services.context.factory import ContextManagerFactory
+        ContextManagerFactory.release_if_idle(dialog.id)
     
     def get_dialog_list(self) -> List[Dict[str, Any]]:
-        return self.grouper.get_dialog_list(
-            dialogs=self.dialogs,
-            current_dialog_id=self.current_dialog_id
-        )
+        return self.grouper.get_dialog_list(current_dialog_id=self.current_dialog_id)
     
     def get_dialog_list_with_groups(self) -> Dict[str, List[Dict[str, Any]]]:
-        return self.grouper.get_dialog_list_with_groups(
-            dialogs=self.dialogs,
-            current_dialog_id=self.current_dialog_id
-        )
+        return self.grouper.get_dialog_list_with_groups(current_dialog_id=self.current_dialog_id)
     
     def add_message(self, dialog_id: str, role: MessageRole, content: str) -> bool:
         """Добавляет сообщение в диалог с инкрементальным сохранением и делает диалог видимым."""
         if dialog_id in self.dialogs:
-            dialog = self.dialogs[dialog_id]
+            dialog = self.get_dialog(dialog_id)
             message = dialog.add_message(role, content)
             # Если диалог был невидимым и это первое сообщение (любое), делаем видимым
             if not dialog.visible:
@@ -151,4 +190,16 @@ class DialogManager:
                 self.storage.save_dialog(dialog)
             # Сохраняем сообщение (append)
             return self.storage.append_message(dialog, message)
-        return False
\ No newline at end of file
+        return False
+
+    def search_dialogs(self, query: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Полнотекстовый поиск по названиям и сообщениям видимых диалогов."""
+        if self.search_index is None:
+            return []
+        results = []
+        for hit in self.search_index.search(query, limit):
+            dialog = self.dialogs.get(hit["dialog_id"])
+            if dialog is None or not dialog.visible:
+                continue
+            results.append(dict(hit, name=dialog.name))
+        return results
@@ -0,0 +1,135 @@
+# services/dialogs/metadata_writer.py
+"""
+Отложенная (write-behind) запись метаданных диалогов.
+
+Изменения метаданных копятся в памяти как «грязные» диалоги и сбрасываются
+на диск одной пачкой по короткому таймеру, при завершении приложения или
+в явных точках синхронизации. Несколько изменений одного диалога между
+сбросами превращаются в одну запись meta-файла, а индекс dialogs_index.json
+переписывается один раз на пачку.
+"""
+import threading
+from typing import Callable, Dict
+
+from models.dialog import Dialog
+from container import container
+
+
+class MetadataWriteBehind:
+    """Копит изменения метаданных и записывает их пачками."""
+
+    def __init__(
+        self,
+        write_meta: Callable[[Dialog], None],
+        write_index: Callable[[], None],
+        flush_interval: float = 1.0
+    ):
+        self._write_meta = write_meta
+        self._write_index = write_index
+        self.flush_interval = flush_interval
+
+        self._dirty: Dict[str, Dialog] = {}
+        self._index_dirty = False
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._timer: threading.Timer = None
+        self._logger = None
+
+        self._requested = 0
+        self._meta_writes = 0
+        self._index_requested = 0
+        self._index_writes = 0
+        self._flushes = 0
+
+    @property
+    def logger(self):
+        if self._logger is None:
+            self._logger = container.get_logger()
+        return self._logger
+
+    def mark_dirty(self, dialog: Dialog, meta: bool = True):
+        """Помечает метаданные диалога (и индекс) как требующие записи."""
+        with self._lock:
+            if meta:
+                self._dirty[dialog.id] = dialog
+                self._requested += 1
+            self._index_dirty = True
+            self._index_requested += 1
+
+            if self.flush_interval <= 0:
+                schedule = False
+            elif self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, self._on_timer)
+                self._timer.daemon = True
+                schedule = True
+            else:
+                return
+
+        if schedule:
+            self._timer.start()
+        else:
+            # Отложенная запись выключена — пишем сразу
+            self.flush()
+
+    def mark_index_dirty(self):
+        """Помечает только индекс (например, после удаления диалога)."""
+        with self._lock:
+            self._index_dirty = True
+            self._index_requested += 1
+
+    def discard(self, dialog_id: str):
+        """Отменяет отложенную запись метаданных удалённого диалога."""
+        with self._lock:
+            self._dirty.pop(dialog_id, None)
+
+    def _on_timer(self):
+        with self._lock:
+            self._timer = None
+        self.flush()
+
+    def flush(self):
+        """Записывает все накопленные изменения."""
+        with self._flush_lock:
+            with self._lock:
+                dirty = self._dirty
+                self._dirty = {}
+                index_dirty = self._index_dirty
+                self._index_dirty = False
+
+            if not dirty and not index_dirty:
+                return
+
+            for dialog in dirty.values():
+                try:
+                    self._write_meta(dialog)
+                    self._meta_writes += 1
+                except Exception as e:
+                    self.logger.error("Ошибка записи метаданных диалога %s: %s", dialog.id, e)
+
+            if index_dirty:
+                self._write_index()
+                self._index_writes += 1
+
+            self._flushes += 1
+
+    def shutdown(self):
+        """Останавливает таймер и сбрасывает накопленное."""
+        with self._lock:
+            timer = self._timer
+            self._timer = None
+        if timer is not None:
+            timer.cancel()
+        self.flush()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                "meta_writes_requested": self._requested,
+                "meta_writes_performed": self._meta_writes,
+                "meta_writes_avoided": self._requested - self._meta_writes - len(self._dirty),
+                "index_writes_requested": self._index_requested,
+                "index_writes_performed": self._index_writes,
+                "index_writes_avoided": self._index_requested - self._index_writes - int(self._index_dirty),
+                "flushes": self._flushes,
+                "pending": len(self._dirty),
+            }
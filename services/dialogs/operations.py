@@ -6,7 +6,7 @@ from typing import Dict, Optional, List, Any
 from datetime import datetime
 from models.dialog import Dialog
 from models.enums import MessageRole
-from .storage import DialogStorage
+from services.storage import DialogStorageBackend
 from services.context.factory import ContextManagerFactory
 
 class DialogOperations:
@@ -37,7 +37,7 @@ class DialogOperations:
     @staticmethod
     def delete_dialog(dialog_id: str, dialogs: Dict[str, Dialog], 
                      current_dialog_id: str, keep_current: bool,
-                     storage: DialogStorage) -> bool:
+                     storage: DialogStorageBackend) -> bool:
         """Удаляет диалог с логикой переключения"""
         if dialog_id not in dialogs:
             return False
@@ -58,7 +58,7 @@ class DialogOperations:
     
     @staticmethod
     def rename_dialog(dialog_id: str, new_name: str,
-                     dialogs: Dict[str, Dialog], storage: DialogStorage) -> bool:
+                     dialogs: Dict[str, Dialog], storage: DialogStorageBackend) -> bool:
         """Переименовывает диалог с валидацией"""
         if dialog_id not in dialogs:
             return False
@@ -105,7 +105,7 @@ class DialogOperations:
     
     @staticmethod
     def add_message(dialog_id: str, role: MessageRole, content: str,
-                   dialogs: Dict[str, Dialog], storage: DialogStorage) -> bool:
+                   dialogs: Dict[str, Dialog], storage: DialogStorageBackend) -> bool:
         """Добавляет сообщение в диалог"""
         if dialog_id in dialogs:
             dialogs[dialog_id].add_message(role, content)
@@ -4,7 +4,7 @@
 """
 from typing import Dict
 from models.dialog import Dialog
-from .storage import DialogStorage
+from services.storage import DialogStorageBackend
 
 
 class DialogPinning:
@@ -12,7 +12,7 @@ class DialogPinning:
 
     @staticmethod
     def pin_dialog(dialog_id: str, dialogs: Dict[str, Dialog],
-                   storage: DialogStorage) -> bool:
+                   storage: DialogStorageBackend) -> bool:
         """
         Закрепляет диалог.
         Все закреплённые диалоги сдвигаются вниз (их pinned_position увеличивается),
@@ -46,7 +46,7 @@ class DialogPinning:
 
     @staticmethod
     def unpin_dialog(dialog_id: str, dialogs: Dict[str, Dialog],
-                     storage: DialogStorage) -> bool:
+                     storage: DialogStorageBackend) -> bool:
         """
         Открепляет диалог.
         Все закреплённые диалоги с большей позицией сдвигаются вверх.
@@ -0,0 +1,130 @@
+# services/dialogs/residency.py
+"""
+Ограничение числа диалогов, чья история держится в памяти.
+
+Метаданные всех диалогов остаются в DialogManager.dialogs, а полная история
+(вместе с кэшами форматов и менеджером контекста) хранится только для
+текущего и недавно использованных диалогов в пределах бюджета по числу
+диалогов, сообщений и байтов. Вытесненная история прозрачно подгружается
+из хранилища при следующем обращении.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+from models.dialog import Dialog
+from container import container
+
+
+class HistoryResidency:
+    """LRU-набор диалогов с загруженной историей."""
+
+    def __init__(self, config: Optional[dict] = None, on_evict: Optional[Callable[[Dialog], None]] = None):
+        config = config or {}
+        self.max_dialogs = config.get("max_dialogs", 20)
+        self.max_messages = config.get("max_messages", 5000)
+        self.max_bytes = int(config.get("max_mb", 64) * 1024 * 1024)
+        self.min_idle_seconds = config.get("min_idle_seconds", 300)
+        self.on_evict = on_evict
+
+        # dialog_id -> (диалог, число сообщений, байты, время последнего обращения)
+        self._resident: "OrderedDict[str, Tuple[Dialog, int, int, float]]" = OrderedDict()
+        self._messages = 0
+        self._bytes = 0
+        self._evictions = 0
+        self._reloads = 0
+        self._evicted_ids = set()
+        self._lock = threading.RLock()
+        self._logger = None
+
+    @property
+    def logger(self):
+        if self._logger is None:
+            self._logger = container.get_logger()
+        return self._logger
+
+    @staticmethod
+    def _history_size(dialog: Dialog) -> int:
+        # Компактные массивы истории плюс строки в кэше UI (оценка — тот же объём)
+        return dialog.history.nbytes * 2
+
+    def touch(self, dialog: Dialog, protected_id: Optional[str] = None):
+        """Отмечает обращение к диалогу с загруженной историей и соблюдает бюджет."""
+        if not dialog.is_history_loaded:
+            return
+        with self._lock:
+            if dialog.id in self._evicted_ids:
+                # История была вытеснена и только что подгружена снова
+                self._evicted_ids.discard(dialog.id)
+                self._reloads += 1
+            self._touch_locked(dialog, protected_id)
+
+    def _touch_locked(self, dialog: Dialog, protected_id: Optional[str]):
+        entry = self._resident.pop(dialog.id, None)
+        count = dialog.message_count
+        if entry is not None and entry[1] == count:
+            size = entry[2]
+        else:
+            size = self._history_size(dialog)
+        if entry is not None:
+            self._messages -= entry[1]
+            self._bytes -= entry[2]
+
+        self._resident[dialog.id] = (dialog, count, size, time.monotonic())
+        self._messages += count
+        self._bytes += size
+
+        self._evict_if_needed(protected={dialog.id, protected_id})
+
+    def forget(self, dialog_id: str):
+        """Убирает диалог из учёта (например, после удаления)."""
+        with self._lock:
+            self._evicted_ids.discard(dialog_id)
+            self._drop(dialog_id)
+
+    def _drop(self, dialog_id: str):
+        entry = self._resident.pop(dialog_id, None)
+        if entry is not None:
+            self._messages -= entry[1]
+            self._bytes -= entry[2]
+
+    def _over_budget(self) -> bool:
+        return (
+            len(self._resident) > self.max_dialogs
+            or self._messages > self.max_messages
+            or self._bytes > self.max_bytes
+        )
+
+    def _evict_if_needed(self, protected: set):
+        if not self._over_budget():
+            return
+
+        now = time.monotonic()
+        # От давно неиспользуемых к недавним; защищённые и «свежие» диалоги не трогаем
+        for dialog_id in list(self._resident.keys()):
+            if not self._over_budget():
+                break
+            dialog, _, _, last_access = self._resident[dialog_id]
+            if dialog_id in protected or now - last_access < self.min_idle_seconds:
+                continue
+
+            self._drop(dialog_id)
+            # Число сообщений берётся сейчас: после touch могли добавиться новые
+            count = dialog.message_count
+            dialog.mark_history_unloaded(count)
+            self._evicted_ids.add(dialog_id)
+            if self.on_evict is not None:
+                self.on_evict(dialog)
+            self._evictions += 1
+            self.logger.debug("🧹 История диалога %s выгружена из памяти (%d сообщений)", dialog_id, count)
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "resident_dialogs": len(self._resident),
+                "resident_messages": self._messages,
+                "resident_bytes": self._bytes,
+                "evictions": self._evictions,
+                "reloads": self._reloads,
+            }
@@ -5,26 +5,68 @@
   - meta_YYYYMMDDTHHMMSS-fff.json          # метаданные (без истории)
   - history_YYYYMMDDTHHMMSS-fff.jsonl      # история в формате JSON lines
   - (опционально) context_YYYYMMDDTHHMMSS-fff.chat   # состояние контекста
+
+В корне save_dir лежит индекс метаданных dialogs_index.json (по записи на диалог).
+Meta-файлы и индекс пишутся отложенно и пачками (MetadataWriteBehind). При старте читается только он,
+история диалога подгружается при первом обращении.
 """
 import os
 import json
 import shutil
+import threading
+import time
 from datetime import datetime
-from typing import Dict, Optional
+from typing import Any, Dict, Optional, Set, Tuple
 
+from models.compact_history import CompactHistory
 from models.dialog import Dialog
-from models.enums import MessageRole
 from models.message import Message
+from services.storage.base import DialogStorageBackend, ContextStateStore
+from services.storage.search_index import get_search_index
+from services.metrics import metrics
+from .metadata_writer import MetadataWriteBehind
 from container import container
 
+STORAGE_WRITE_SECONDS = metrics.histogram(
+    "chat_storage_write_seconds", "Запись файлов диалогов по операции", ("op",)
+)
+STORAGE_WRITTEN_BYTES = metrics.counter(
+    "chat_storage_written_bytes_total", "Записанные байты файлов диалогов по операции", ("op",)
+)
+
+
+INDEX_FILE_NAME = "dialogs_index.json"
+INDEX_FORMAT_VERSION = 1
 
-class DialogStorage:
+# Журнал перезаписи последней строки истории
+PENDING_SUFFIX = ".pending"
+SCAN_BLOCK_SIZE = 4096
+FSYNC_POLICIES = ("none", "rewrite", "always")
+
+
+class DialogStorage(DialogStorageBackend, ContextStateStore):
     """Управление сохранением и загрузкой диалогов с новой структурой файлов"""
 
+    engine_name = "files"
+
     def __init__(self, config: dict):
         self.save_dir = config.get("save_dir", "saved_dialogs")
         os.makedirs(self.save_dir, exist_ok=True)
         self._logger = None
+        self.index_path = os.path.join(self.save_dir, INDEX_FILE_NAME)
+        self._index: Dict[str, Dict[str, Any]] = {}
+        self._index_lock = threading.RLock()
+        # dialog_id -> (смещение начала, конец) последней записи истории
+        self._last_records: Dict[str, Tuple[int, int]] = {}
+        # Диалоги, перезапись которых прервалась ошибкой (журнал *.pending остался)
+        self._pending_rewrites: Set[str] = set()
+        self.metadata_writer = MetadataWriteBehind(
+            self._write_meta, self._write_index, config.get("metadata_flush_interval", 1.0)
+        )
+        self.fsync_policy = config.get("fsync_policy", "rewrite")
+        if self.fsync_policy not in FSYNC_POLICIES:
+            self.fsync_policy = "rewrite"
+        self.search_index = get_search_index(config)
 
     @property
     def logger(self):
@@ -51,37 +93,75 @@ class DialogStorage:
         folder = self._get_chat_folder_path(dialog)
         return os.path.join(folder, f"history_{self._get_timestamp_suffix(dialog)}.jsonl")
 
+    def _get_context_file_path(self, dialog: Dialog) -> str:
+        folder = self._get_chat_folder_path(dialog)
+        return os.path.join(folder, f"context_{self._get_timestamp_suffix(dialog)}.chat")
+
     # ========== Сохранение метаданных ==========
 
     def save_dialog(self, dialog: Dialog) -> bool:
+        """
+        Сохраняет метаданные диалога.
+
+        Папка и файл истории создаются сразу, meta-файл и индекс пишутся
+        отложенно через MetadataWriteBehind (для нового диалога — сразу).
+        """
         try:
             folder_path = self._get_chat_folder_path(dialog)
             os.makedirs(folder_path, exist_ok=True)
 
-            meta_file = self._get_meta_file_path(dialog)
-            meta_data = {
-                "id": dialog.id,
-                "name": dialog.name,
-                "created": dialog.created.isoformat(),
-                "updated": dialog.updated.isoformat(),
-                "status": dialog.status,
-                "pinned": dialog.pinned,
-                "pinned_position": dialog.pinned_position,
-                "visible": dialog.visible,   # <-- добавить
-            }
-
-            with open(meta_file, 'w', encoding='utf-8') as f:
-                json.dump(meta_data, f, ensure_ascii=False, indent=2)
-
             history_file = self._get_history_file_path(dialog)
             if not os.path.exists(history_file):
                 open(history_file, 'w', encoding='utf-8').close()
 
+            self._update_index(dialog)
+            if self.search_index is not None:
+                self.search_index.update_name(dialog)
             return True
         except Exception as e:
             self.logger.error("Ошибка сохранения метаданных диалога %s: %s", dialog.id, e)
             return False
 
+    @staticmethod
+    def _record_write(op: str, started: float, size: int):
+        STORAGE_WRITE_SECONDS.observe(time.perf_counter() - started, op=op)
+        STORAGE_WRITTEN_BYTES.inc(size, op=op)
+
+    @staticmethod
+    def _meta_dict(dialog: Dialog) -> Dict[str, Any]:
+        return {
+            "id": dialog.id,
+            "name": dialog.name,
+            "created": dialog.created.isoformat(),
+            "updated": dialog.updated.isoformat(),
+            "status": dialog.status,
+            "pinned": dialog.pinned,
+            "pinned_position": dialog.pinned_position,
+            "visible": dialog.visible,
+        }
+
+    def _write_meta(self, dialog: Dialog):
+        """Атомарно записывает meta-файл (вызывается MetadataWriteBehind)."""
+        folder_path = self._get_chat_folder_path(dialog)
+        if not os.path.isdir(folder_path):
+            # Диалог удалён, пока запись ждала сброса
+            return
+        started = time.perf_counter()
+        meta_file = self._get_meta_file_path(dialog)
+        tmp_file = meta_file + ".tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(self._meta_dict(dialog), f, ensure_ascii=False, indent=2)
+            size = f.tell()
+        os.replace(tmp_file, meta_file)
+        self._record_write("meta", started, size)
+
+    def flush(self):
+        """Точка синхронизации: сбрасывает отложенные записи метаданных."""
+        self.metadata_writer.flush()
+
+    def close(self):
+        self.metadata_writer.shutdown()
+
     # ========== Добавление сообщения (append) ==========
 
     def append_message(self, dialog: Dialog, message: Message) -> bool:
@@ -89,22 +169,24 @@ class DialogStorage:
             history_file = self._get_history_file_path(dialog)
             if not os.path.exists(history_file):
                 self.save_dialog(dialog)
+            if not self._finish_pending_rewrite(dialog, history_file):
+                return False
 
-            with open(history_file, 'a', encoding='utf-8') as f:
-                f.write(json.dumps(message.to_dict(), ensure_ascii=False) + '\n')
-
-            meta_file = self._get_meta_file_path(dialog)
-            if os.path.exists(meta_file):
-                with open(meta_file, 'r+', encoding='utf-8') as f:
-                    meta = json.load(f)
-                    meta['updated'] = dialog.updated.isoformat()
-                    meta['visible'] = dialog.visible   # <-- добавить
-                    f.seek(0)
-                    json.dump(meta, f, ensure_ascii=False, indent=2)
-                    f.truncate()
-            else:
-                self.save_dialog(dialog)
-
+            started = time.perf_counter()
+            line = (json.dumps(message.to_dict(), ensure_ascii=False) + '\n').encode('utf-8')
+            with open(history_file, 'ab') as f:
+                offset = f.tell()
+                f.write(line)
+                if self.fsync_policy == "always":
+                    f.flush()
+                    os.fsync(f.fileno())
+            self._record_write("append", started, len(line))
+            self._last_records[dialog.id] = (offset, offset + len(line))
+
+            # updated/visible/число сообщений — через отложенную запись
+            self._update_index(dialog)
+            if self.search_index is not None:
+                self.search_index.add_message(dialog, message)
             return True
         except Exception as e:
             self.logger.error("Ошибка добавления сообщения в диалог %s: %s", dialog.id, e)
@@ -112,136 +194,412 @@ class DialogStorage:
 
     # ========== Перезапись последнего сообщения ==========
 
-    def rewrite_last_message(self, dialog: Dialog) -> bool:
+    def rewrite_last_message(self, dialog: Dialog, message: Optional[Message] = None) -> bool:
         """
         Перезаписывает последнюю строку history_*.jsonl актуальным содержимым
-        последнего сообщения из dialog.history.
+        последнего сообщения (message или dialog.history[-1]).
 
         Используется когда контент последнего сообщения изменён в памяти
         (например, нормализация блока размышлений) и нужно сохранить изменения.
+
+        Файл обрезается по смещению последней записи и новая запись
+        дописывается в конец — стоимость не зависит от размера истории.
+        Перед обрезкой новая запись фиксируется в журнале *.pending, поэтому
+        сбой между обрезкой и записью восстанавливается при следующей загрузке.
         """
-        if not dialog.history:
-            return False
+        if message is None:
+            if not dialog.history:
+                return False
+            message = dialog.history[-1]
 
         try:
             history_file = self._get_history_file_path(dialog)
             if not os.path.exists(history_file):
                 return False
 
-            with open(history_file, 'rb') as f:
-                # Ищем начало последней непустой строки
-                f.seek(0, 2)
-                file_size = f.tell()
-                if file_size == 0:
-                    return False
-
-                # Шагаем назад побайтово, пропуская завершающий \n
-                pos = file_size - 1
-                f.seek(pos)
-                if f.read(1) == b'\n':
-                    pos -= 1
-
-                # Находим начало последней строки
-                while pos > 0:
-                    f.seek(pos - 1)
-                    if f.read(1) == b'\n':
-                        break
-                    pos -= 1
-                last_line_start = pos
-
-            # Перезаписываем файл: всё до последней строки + новая последняя строка
-            with open(history_file, 'r', encoding='utf-8') as f:
-                content = f.read()
-
-            lines = [l for l in content.splitlines() if l.strip()]
-            if not lines:
+            if not self._finish_pending_rewrite(dialog, history_file):
+                return False
+            file_size = os.path.getsize(history_file)
+            if file_size == 0:
                 return False
 
-            new_last = json.dumps(dialog.history[-1].to_dict(), ensure_ascii=False)
-            lines[-1] = new_last
+            started = time.perf_counter()
+            new_line = (json.dumps(message.to_dict(), ensure_ascii=False) + '\n').encode('utf-8')
 
-            with open(history_file, 'w', encoding='utf-8') as f:
-                f.write('\n'.join(lines) + '\n')
+            offset = self._find_last_record_offset(dialog.id, history_file, file_size)
+            if offset is None:
+                # Хвост файла не похож на корректную запись — полная атомарная перезапись
+                if not self._rewrite_history_atomically(dialog, history_file, new_line):
+                    return False
+                self._record_write("rewrite_full", started, os.path.getsize(history_file))
+                if self.search_index is not None:
+                    self.search_index.replace_message(dialog, message)
+                return True
 
+            journal_file = history_file + PENDING_SUFFIX
+            with open(journal_file, 'wb') as f:
+                f.write(f"{offset}\n".encode('ascii') + new_line)
+                self._sync(f)
+
+            try:
+                self._apply_pending_rewrite(history_file, offset, new_line)
+            except Exception:
+                # История могла остаться обрезанной: журнал сохраняется, и дозапись
+                # откладывается, пока он не будет применён (_finish_pending_rewrite)
+                self._pending_rewrites.add(dialog.id)
+                self._last_records.pop(dialog.id, None)
+                raise
+            os.remove(journal_file)
+            # Новая запись пишется дважды: в журнал и в историю
+            self._record_write("rewrite", started, 2 * len(new_line))
+
+            self._last_records[dialog.id] = (offset, offset + len(new_line))
+            if self.search_index is not None:
+                self.search_index.replace_message(dialog, message)
             return True
 
         except Exception as e:
             self.logger.error("Ошибка перезаписи последнего сообщения диалога %s: %s", dialog.id, e)
             return False
 
+    def _sync(self, f):
+        if self.fsync_policy != "none":
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _find_last_record_offset(self, dialog_id: str, history_file: str, file_size: int) -> Optional[int]:
+        """
+        Возвращает смещение начала последней записи.
+
+        Берётся из кэша, если файл не менялся с последней дозаписи, иначе
+        ищется блочным чтением с конца. Найденная запись проверяется разбором.
+        """
+        with open(history_file, 'rb') as f:
+            cached = self._last_records.get(dialog_id)
+            if cached is not None and cached[1] == file_size:
+                offset = cached[0]
+            else:
+                offset = self._scan_last_line_start(f, file_size)
+
+            f.seek(offset)
+            tail = f.read()
+
+        if not tail.endswith(b'\n') or b'\n' in tail[:-1]:
+            return None
+        try:
+            json.loads(tail)
+        except ValueError:
+            return None
+        return offset
+
+    @staticmethod
+    def _scan_last_line_start(f, file_size: int) -> int:
+        """Ищет начало последней строки, читая файл блоками с конца."""
+        # Пропускаем завершающие переводы строк
+        end = file_size
+        while end > 0:
+            f.seek(end - 1)
+            if f.read(1) != b'\n':
+                break
+            end -= 1
+
+        pos = end
+        while pos > 0:
+            start = max(0, pos - SCAN_BLOCK_SIZE)
+            f.seek(start)
+            block = f.read(pos - start)
+            newline = block.rfind(b'\n')
+            if newline != -1:
+                return start + newline + 1
+            pos = start
+        return 0
+
+    def _apply_pending_rewrite(self, history_file: str, offset: int, new_line: bytes):
+        with open(history_file, 'r+b') as f:
+            f.seek(offset)
+            f.truncate()
+            f.write(new_line)
+            self._sync(f)
+
+    def _finish_pending_rewrite(self, dialog: Dialog, history_file: str) -> bool:
+        """
+        Применяет журнал перезаписи, оставшийся после ошибки в этом процессе.
+        False — журнал применить не удалось, писать в историю нельзя: повтор
+        журнала после новых записей обрезал бы их.
+        """
+        if dialog.id not in self._pending_rewrites:
+            return True
+        if not self._recover_pending_rewrite(history_file):
+            self.logger.error("❌ История диалога %s ждёт незавершённой перезаписи, запись отклонена", dialog.id)
+            return False
+        self._pending_rewrites.discard(dialog.id)
+        return True
+
+    @staticmethod
+    def _is_last_record_start(history_file: str, offset: int) -> bool:
+        """
+        Смещение — начало последней (возможно, недописанной или обрезанной)
+        записи: после него нет полных строк, кроме одной.
+        """
+        if offset > os.path.getsize(history_file):
+            return False
+        with open(history_file, 'rb') as f:
+            if offset > 0:
+                f.seek(offset - 1)
+                if f.read(1) != b'\n':
+                    return False
+            f.seek(offset)
+            tail = f.read()
+        return b'\n' not in tail[:-1]
+
+    def _recover_pending_rewrite(self, history_file: str) -> bool:
+        """
+        Доводит до конца перезапись, прерванную сбоем (журнал *.pending).
+        False — применить журнал не удалось, он оставлен для следующей попытки.
+        """
+        journal_file = history_file + PENDING_SUFFIX
+        if not os.path.exists(journal_file):
+            return True
+        try:
+            with open(journal_file, 'rb') as f:
+                header, _, new_line = f.read().partition(b'\n')
+            offset = int(header)
+            json.loads(new_line)
+            if not new_line.endswith(b'\n'):
+                raise ValueError("запись журнала не завершена")
+        except Exception as e:
+            # Журнал записан не полностью — значит, сама история ещё не тронута
+            self.logger.warning("⚠️ Пропуск неполного журнала перезаписи %s: %s", journal_file, e)
+            os.remove(journal_file)
+            return True
+
+        try:
+            if self._is_last_record_start(history_file, offset):
+                self._apply_pending_rewrite(history_file, offset, new_line)
+                self.logger.warning("⚠️ Восстановлена прерванная перезапись сообщения: %s", history_file)
+            else:
+                # После смещения уже есть другие записи — повтор обрезал бы их
+                self.logger.warning("⚠️ Пропуск устаревшего журнала перезаписи %s", journal_file)
+        except OSError as e:
+            self.logger.error("❌ Не удалось применить журнал перезаписи %s: %s", journal_file, e)
+            return False
+        os.remove(journal_file)
+        return True
+
+    def _rewrite_history_atomically(self, dialog: Dialog, history_file: str, new_line: bytes) -> bool:
+        """Запасной путь: переписывает историю целиком через временный файл."""
+        with open(history_file, 'rb') as f:
+            lines = [l for l in f.read().splitlines() if l.strip()]
+        if not lines:
+            return False
+
+        lines[-1] = new_line.rstrip(b'\n')
+        content = b'\n'.join(lines) + b'\n'
+        tmp_file = history_file + ".tmp"
+        with open(tmp_file, 'wb') as f:
+            f.write(content)
+            self._sync(f)
+        os.replace(tmp_file, history_file)
+
+        self._last_records[dialog.id] = (len(content) - len(new_line), len(content))
+        self.logger.warning("⚠️ История диалога %s перезаписана целиком (хвост файла повреждён)", dialog.id)
+        return True
+
+    # ========== Индекс метаданных ==========
+
+    def _index_entry(self, dialog: Dialog) -> Dict[str, Any]:
+        return {
+            "id": dialog.id,
+            "name": dialog.name,
+            "created": dialog.created.isoformat(),
+            "updated": dialog.updated.isoformat(),
+            "status": dialog.status,
+            "pinned": dialog.pinned,
+            "pinned_position": dialog.pinned_position,
+            "visible": dialog.visible,
+            "message_count": dialog.message_count,
+            "folder": self._get_chat_folder_name(dialog),
+        }
+
+    def _update_index(self, dialog: Dialog):
+        with self._index_lock:
+            created = dialog.id not in self._index
+            self._index[dialog.id] = self._index_entry(dialog)
+        self.metadata_writer.mark_dirty(dialog)
+        if created:
+            # Создание — точка синхронизации, как и удаление: без meta-файла и записи
+            # в индексе папка нового диалога после сбоя не попадёт в список
+            self.metadata_writer.flush()
+
+    def _remove_from_index(self, dialog_id: str):
+        self.metadata_writer.discard(dialog_id)
+        with self._index_lock:
+            removed = self._index.pop(dialog_id, None) is not None
+        if removed:
+            # Удаление — точка синхронизации: индекс не должен ссылаться на удалённую папку
+            self.metadata_writer.mark_index_dirty()
+            self.metadata_writer.flush()
+
+    def _write_index(self):
+        """Атомарно перезаписывает индекс (временный файл + rename)."""
+        tmp_path = self.index_path + ".tmp"
+        try:
+            started = time.perf_counter()
+            with self._index_lock:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump({"version": INDEX_FORMAT_VERSION, "dialogs": self._index}, f, ensure_ascii=False)
+                    size = f.tell()
+            os.replace(tmp_path, self.index_path)
+            self._record_write("index", started, size)
+        except Exception as e:
+            self.logger.error("Ошибка записи индекса диалогов: %s", e)
+
+    def _read_index(self) -> Optional[Dict[str, Dict[str, Any]]]:
+        if not os.path.exists(self.index_path):
+            return None
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get("version") != INDEX_FORMAT_VERSION:
+                return None
+            return data.get("dialogs", {})
+        except Exception as e:
+            self.logger.warning("⚠️ Индекс диалогов повреждён, будет перестроен: %s", e)
+            return None
+
+    @staticmethod
+    def _dialog_from_index_entry(entry: Dict[str, Any]) -> Dialog:
+        dialog = Dialog(
+            id=entry["id"],
+            name=entry["name"],
+            created=datetime.fromisoformat(entry["created"]),
+            updated=datetime.fromisoformat(entry["updated"]),
+            status=entry.get("status", "active"),
+            pinned=entry.get("pinned", False),
+            pinned_position=entry.get("pinned_position"),
+            visible=entry.get("visible", False)
+        )
+        dialog.mark_history_unloaded(entry.get("message_count", 0))
+        return dialog
+
     # ========== Загрузка всех диалогов ==========
 
     def load_dialogs(self) -> Dict[str, Dialog]:
-        """Загружает все диалоги из папок chat_*"""
-        dialogs = {}
+        """
+        Загружает метаданные всех диалогов без истории.
+
+        Читается только индекс; если его нет или он повреждён — однократно
+        перестраивается обходом папок chat_*.
+        """
+        with self._index_lock:
+            index = self._read_index()
+            if index is None:
+                index = self._rebuild_index()
+
+            self._index = index
+            dialogs = {}
+            for dialog_id, entry in index.items():
+                try:
+                    dialogs[dialog_id] = self._dialog_from_index_entry(entry)
+                except Exception as e:
+                    self.logger.error("Ошибка чтения записи индекса %s: %s", dialog_id, e)
+            return dialogs
+
+    def _rebuild_index(self) -> Dict[str, Dict[str, Any]]:
+        """Строит индекс обходом папок chat_* (миграция со старого формата)."""
+        index: Dict[str, Dict[str, Any]] = {}
 
         try:
             if not os.path.exists(self.save_dir):
                 self.logger.info("Директория сохранённых диалогов не существует: %s", self.save_dir)
-                return dialogs
+                return index
 
             for folder_name in os.listdir(self.save_dir):
                 folder_path = os.path.join(self.save_dir, folder_name)
                 if not os.path.isdir(folder_path) or not folder_name.startswith('chat_'):
                     continue
 
-                meta_files = [f for f in os.listdir(folder_path)
-                              if f.startswith('meta_') and f.endswith('.json')]
-                if not meta_files:
+                suffix = folder_name[len('chat_'):]
+                meta_file = os.path.join(folder_path, f"meta_{suffix}.json")
+                if not os.path.exists(meta_file):
                     self.logger.warning("Пропуск папки %s: нет meta_*.json", folder_name)
                     continue
 
-                meta_file = os.path.join(folder_path, meta_files[0])
-
                 try:
                     with open(meta_file, 'r', encoding='utf-8') as f:
                         meta = json.load(f)
                 except Exception as e:
-                    self.logger.error("Ошибка чтения %s в %s: %s", meta_files[0], folder_name, e)
+                    self.logger.error("Ошибка чтения meta в %s: %s", folder_name, e)
                     continue
 
-                dialog = Dialog(
-                    id=meta["id"],
-                    name=meta["name"],
-                    created=datetime.fromisoformat(meta["created"]),
-                    updated=datetime.fromisoformat(meta["updated"]),
-                    status=meta.get("status", "active"),
-                    pinned=meta.get("pinned", False),
-                    pinned_position=meta.get("pinned_position"),
-                    visible=meta.get("visible", False)   # <-- загружаем, по умолчанию False
-                )
-
-                # загрузка истории (без изменений)...
-                history_files = [f for f in os.listdir(folder_path)
-                                 if f.startswith('history_') and f.endswith('.jsonl')]
-                if history_files:
-                    history_file = os.path.join(folder_path, history_files[0])
-                    if os.path.exists(history_file):
-                        with open(history_file, 'r', encoding='utf-8') as f:
-                            for line in f:
-                                line = line.strip()
-                                if not line:
-                                    continue
-                                try:
-                                    msg_data = json.loads(line)
-                                    msg_data["role"] = MessageRole(msg_data["role"])
-                                    msg_data["timestamp"] = datetime.fromisoformat(msg_data["timestamp"])
-                                    dialog.history.append(Message(**msg_data))
-                                except Exception as e:
-                                    self.logger.error("Ошибка парсинга сообщения в %s: %s",
-                                                      history_file, e)
-
-                dialogs[dialog.id] = dialog
+                # Сообщения не разбираем — достаточно числа непустых строк
+                message_count = 0
+                history_file = os.path.join(folder_path, f"history_{suffix}.jsonl")
+                if os.path.exists(history_file):
+                    with open(history_file, 'rb') as f:
+                        message_count = sum(1 for line in f if line.strip())
+
+                index[meta["id"]] = {
+                    "id": meta["id"],
+                    "name": meta["name"],
+                    "created": meta["created"],
+                    "updated": meta["updated"],
+                    "status": meta.get("status", "active"),
+                    "pinned": meta.get("pinned", False),
+                    "pinned_position": meta.get("pinned_position"),
+                    "visible": meta.get("visible", False),
+                    "message_count": message_count,
+                    "folder": folder_name,
+                }
+
+            self._index = index
+            self._write_index()
+            self.logger.info("📇 Индекс диалогов перестроен: %d записей", len(index))
 
         except Exception as e:
             self.logger.error("Критическая ошибка при загрузке диалогов: %s", e)
 
-        return dialogs
+        return index
+
+    def load_history(self, dialog: Dialog) -> bool:
+        """Загружает историю диалога с диска (ленивая гидратация)."""
+        messages = CompactHistory()
+        history_file = self._get_history_file_path(dialog)
+        try:
+            if os.path.exists(history_file):
+                if self._recover_pending_rewrite(history_file):
+                    self._pending_rewrites.discard(dialog.id)
+                with open(history_file, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        line = line.strip()
+                        if not line:
+                            continue
+                        try:
+                            # Сразу в компактные массивы, без промежуточных Message
+                            msg_data = json.loads(line)
+                            messages.append_raw(
+                                msg_data["role"],
+                                msg_data["content"],
+                                datetime.fromisoformat(msg_data["timestamp"])
+                            )
+                        except Exception as e:
+                            self.logger.error("Ошибка парсинга сообщения в %s: %s",
+                                              history_file, e)
+            dialog.set_loaded_history(messages)
+            return True
+        except Exception as e:
+            self.logger.error("Ошибка загрузки истории диалога %s: %s", dialog.id, e)
+            dialog.set_loaded_history(messages)
+            return False
 
     # ========== Удаление папки диалога ==========
 
     def delete_dialog_folder(self, dialog: Dialog) -> bool:
         try:
+            self._remove_from_index(dialog.id)
+            self._last_records.pop(dialog.id, None)
+            if self.search_index is not None:
+                self.search_index.remove_dialog(dialog.id)
             folder_path = self._get_chat_folder_path(dialog)
             if os.path.exists(folder_path):
                 shutil.rmtree(folder_path)
@@ -249,4 +607,30 @@ class DialogStorage:
             return False
         except Exception as e:
             self.logger.error("Ошибка удаления папки диалога %s: %s", dialog.id, e)
-            return False
\ No newline at end of file
+            return False
+
+    # ========== Состояние контекста ==========
+
+    def save_context_state(self, dialog: Dialog, state_dict: Dict[str, Any]) -> bool:
+        try:
+            started = time.perf_counter()
+            os.makedirs(self._get_chat_folder_path(dialog), exist_ok=True)
+            with open(self._get_context_file_path(dialog), 'w', encoding='utf-8') as f:
+                json.dump(state_dict, f, ensure_ascii=False, indent=2)
+                size = f.tell()
+            self._record_write("context", started, size)
+            return True
+        except Exception as e:
+            self.logger.error("Ошибка сохранения состояния контекста диалога %s: %s", dialog.id, e)
+            return False
+
+    def load_context_state(self, dialog: Dialog) -> Optional[Dict[str, Any]]:
+        context_file = self._get_context_file_path(dialog)
+        if not os.path.exists(context_file):
+            return None
+        try:
+            with open(context_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            self.logger.error("Ошибка загрузки состояния контекста диалога %s: %s", dialog.id, e)
+            return None
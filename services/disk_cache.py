@@ -0,0 +1,158 @@
+# services/disk_cache.py
+"""
+Персистентный кэш «ключ → строка» на SQLite с LRU-вытеснением.
+
+Ограничивается числом записей и суммарным размером значений; при переполнении
+удаляются записи, к которым дольше всего не обращались. Опционально у записи
+может быть срок жизни (TTL).
+"""
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from container import container
+
+
+class DiskLRUCache:
+    """Дисковый LRU-кэш со статистикой попаданий."""
+
+    def __init__(self, path: str, max_entries: int = 5000, max_bytes: int = 50 * 1024 * 1024,
+                 name: str = "cache"):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.name = name
+        self._lock = threading.Lock()
+        self._logger = None
+
+        self._hits = 0
+        self._misses = 0
+        self._expired = 0
+        self._evictions = 0
+        self._writes = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " last_access REAL NOT NULL,"
+            " expires_at REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_access ON entries(last_access)")
+        count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        self._count = count
+        self._bytes = total
+
+    @property
+    def logger(self):
+        if self._logger is None:
+            self._logger = container.get_logger()
+        return self._logger
+
+    def get(self, key: str) -> Optional[str]:
+        """Возвращает значение или None (с учётом TTL)."""
+        now = time.time()
+        with self._lock:
+            try:
+                row = self._conn.execute(
+                    "SELECT value, size, expires_at FROM entries WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    self._misses += 1
+                    return None
+
+                value, size, expires_at = row
+                if expires_at is not None and expires_at <= now:
+                    self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                    self._count -= 1
+                    self._bytes -= size
+                    self._expired += 1
+                    self._misses += 1
+                    return None
+
+                self._conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (now, key))
+                self._hits += 1
+                return value
+            except sqlite3.Error as e:
+                self.logger.warning("⚠️ [%s] Ошибка чтения кэша: %s", self.name, e)
+                self._misses += 1
+                return None
+
+    def put(self, key: str, value: str, ttl: Optional[float] = None):
+        """Сохраняет значение; ttl — срок жизни в секундах (None — бессрочно)."""
+        now = time.time()
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        expires_at = now + ttl if ttl else None
+        with self._lock:
+            try:
+                old = self._conn.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO entries (key, value, size, created_at, last_access, expires_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, value, size, now, now, expires_at)
+                )
+                if old is not None:
+                    self._bytes -= old[0]
+                else:
+                    self._count += 1
+                self._bytes += size
+                self._writes += 1
+                self._evict_if_needed()
+            except sqlite3.Error as e:
+                self.logger.warning("⚠️ [%s] Ошибка записи в кэш: %s", self.name, e)
+
+    def _evict_if_needed(self):
+        """Удаляет наименее востребованные записи, пока кэш не уложится в лимиты."""
+        while self._count > self.max_entries or self._bytes > self.max_bytes:
+            batch = max(1, self._count - self.max_entries, self._count // 20)
+            rows = self._conn.execute(
+                "SELECT key, size FROM entries ORDER BY last_access LIMIT ?", (batch,)
+            ).fetchall()
+            if not rows:
+                break
+            self._conn.executemany("DELETE FROM entries WHERE key = ?", [(k,) for k, _ in rows])
+            self._count -= len(rows)
+            self._bytes -= sum(size for _, size in rows)
+            self._evictions += len(rows)
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+            self._count = 0
+            self._bytes = 0
+
+    def close(self):
+        with self._lock:
+            try:
+                self._conn.close()
+            except sqlite3.Error:
+                pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "path": self.path,
+                "entries": self._count,
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_ratio": self._hits / lookups if lookups else 0.0,
+                "expired": self._expired,
+                "evictions": self._evictions,
+                "writes": self._writes,
+            }
@@ -1,32 +1,103 @@
 # services/logger.py
+"""
+Логгер приложения поверх loguru.
+
+Уровни задаются строкой из букв (e, w, i, s, d). Выключенные уровни
+отсекаются до форматирования: %-аргументы не подставляются, а аргументы
+lazy(...) не вычисляются. Для дорогих подготовительных вычислений —
+проверка is_enabled("DEBUG"). Запись в sink-и идёт через очередь
+фонового потока loguru (enqueue), поэтому вызов логгера не ждёт вывода
+в консоль или файл. Опционально пишется структурированный лог JSON
+Lines с request_id трассы текущего сообщения (services/tracing.py).
+"""
+import json
+import os
 import sys
 from loguru import logger
-from typing import Optional, Any
+from typing import Any, Callable, Optional
+
+from services.tracing import tracer
+
+LEVEL_MAP = {
+    'e': 'ERROR',
+    'w': 'WARNING',
+    'i': 'INFO',
+    's': 'STATS',
+    'd': 'DEBUG'
+}
+
+
+class lazy:
+    """Аргумент сообщения, вычисляемый только если сообщение будет записано: lazy(len, text)."""
+
+    __slots__ = ("fn", "args")
+
+    def __init__(self, fn: Callable[..., Any], *args):
+        self.fn = fn
+        self.args = args
+
+    def __call__(self):
+        return self.fn(*self.args)
+
+
+def _add_request_id(record):
+    record["extra"]["request_id"] = tracer.current_request_id()
+
+
+def _json_format(record) -> str:
+    """Строка JSON Lines для структурированного sink-а."""
+    entry = {
+        "time": record["time"].isoformat(),
+        "level": record["level"].name,
+        "message": record["message"],
+        "request_id": record["extra"].get("request_id"),
+        "module": record["name"],
+        "function": record["function"],
+        "line": record["line"],
+        "thread": record["thread"].name,
+    }
+    if record["exception"] is not None:
+        entry["exception"] = repr(record["exception"].value)
+    record["extra"]["json"] = json.dumps(entry, ensure_ascii=False)
+    return "{extra[json]}\n"
 
 
 class LoggerWrapper:
     """Обёртка для loguru с поддержкой %-форматирования и kwargs."""
 
     def __init__(self, logger_instance):
-        self._logger = logger_instance
+        # request_id добавляется в потоке, который пишет сообщение (до очереди)
+        self._logger = logger_instance.patch(_add_request_id)
+        self._enabled = frozenset(LEVEL_MAP.values())
+
+    def is_enabled(self, level: str) -> bool:
+        """Будет ли записано сообщение уровня level ("DEBUG", "INFO", ...)."""
+        return level in self._enabled
 
     def _log(self, level: str, msg: str, *args, **kwargs):
         """Общий метод логирования с поддержкой exc_info."""
+        if level not in self._enabled:
+            return
         if args:
-            formatted = msg % args
+            formatted = msg % tuple(arg() if isinstance(arg, lazy) else arg for arg in args)
         else:
             formatted = msg
 
-        # Извлекаем exc_info из kwargs, если есть
+        # Извлекаем exc_info из kwargs, если есть; depth=2 — место вызова, а не обёртка
         exc_info = kwargs.pop('exc_info', None)
         if exc_info:
-            self._logger.opt(exception=exc_info).log(level, formatted)
+            self._logger.opt(depth=2, exception=exc_info).log(level, formatted)
         else:
-            self._logger.log(level, formatted)
+            self._logger.opt(depth=2).log(level, formatted)
 
     def error(self, msg: str, *args, **kwargs):
         self._log("ERROR", msg, *args, **kwargs)
 
+    def exception(self, msg: str, *args, **kwargs):
+        """Ошибка с трассировкой текущего исключения (внутри except)."""
+        kwargs.setdefault('exc_info', True)
+        self._log("ERROR", msg, *args, **kwargs)
+
     def warning(self, msg: str, *args, **kwargs):
         self._log("WARNING", msg, *args, **kwargs)
 
@@ -39,8 +110,11 @@ class LoggerWrapper:
     def debug(self, msg: str, *args, **kwargs):
         self._log("DEBUG", msg, *args, **kwargs)
 
-    def configure(self, level_string: str):
-        """Перенастраивает логгер под новый уровень (регистронезависимо)."""
+    def configure(self, level_string: str, enqueue: bool = True, json_path: Optional[str] = None):
+        """
+        Перенастраивает логгер под новый уровень (регистронезависимо).
+        enqueue — запись через фоновый поток; json_path — файл структурированного лога.
+        """
         self._logger.remove()
         # Регистрируем кастомный уровень STATS, если ещё не зарегистрирован
         try:
@@ -50,14 +124,8 @@ class LoggerWrapper:
 
         # Приводим к нижнему регистру для сопоставления
         allowed = set(level_string.lower().strip())
-        level_map = {
-            'e': 'ERROR',
-            'w': 'WARNING',
-            'i': 'INFO',
-            's': 'STATS',
-            'd': 'DEBUG'
-        }
-        allowed_names = {level_map[ch] for ch in allowed if ch in level_map}
+        allowed_names = {LEVEL_MAP[ch] for ch in allowed if ch in LEVEL_MAP}
+        self._enabled = frozenset(allowed_names)
 
         def stdout_filter(record):
             return record["level"].name in allowed_names and record["level"].name != "ERROR"
@@ -66,14 +134,27 @@ class LoggerWrapper:
             return record["level"].name == "ERROR" and "ERROR" in allowed_names
 
         fmt = "{time:YYYY-MM-DD HH:mm:ss.SSS} [{level}] {message}"
-        self._logger.add(sys.stdout, format=fmt, filter=stdout_filter, level=0)
-        self._logger.add(sys.stderr, format=fmt, filter=stderr_filter, level=0)
+        self._logger.add(sys.stdout, format=fmt, filter=stdout_filter, level=0, enqueue=enqueue)
+        self._logger.add(sys.stderr, format=fmt, filter=stderr_filter, level=0, enqueue=enqueue)
+
+        if json_path:
+            directory = os.path.dirname(json_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._logger.add(
+                json_path, format=_json_format, level=0, enqueue=enqueue, encoding="utf-8",
+                filter=lambda record: record["level"].name in allowed_names,
+            )
+
+    def complete(self):
+        """Дожидается записи сообщений, стоящих в очереди (перед завершением)."""
+        self._logger.complete()
 
 
-def setup_logger(level_string: str = "ewi") -> LoggerWrapper:
+def setup_logger(level_string: str = "ewi", enqueue: bool = True, json_path: Optional[str] = None) -> LoggerWrapper:
     """Создаёт и настраивает логгер с указанным уровнем."""
     wrapper = LoggerWrapper(logger)
-    wrapper.configure(level_string)
+    wrapper.configure(level_string, enqueue=enqueue, json_path=json_path)
     return wrapper
 
 
@@ -81,4 +162,4 @@ def create_logger_from_config(config_service):
     """Создаёт логгер на основе конфигурации приложения."""
     app_config = config_service.get_config().get('app', {})
     level = app_config.get('logging_level', 'ewis')
-    return setup_logger(level)
\ No newline at end of file
+    return setup_logger(level, app_config.get('logging_async', True), app_config.get('logging_json_path'))
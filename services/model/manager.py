@@ -9,6 +9,7 @@ from .parameters import GenerationParameters
 from .memory_manager import MLXMemoryManager
 from .lifecycle import model_lifecycle_manager
 from .streamer import stream_manager
+from .prefill import PromptPrefill
 
 
 class ModelService:
@@ -97,7 +98,8 @@ class ModelService:
         max_tokens: Optional[int] = None,
         temperature: Optional[float] = None,
         enable_thinking: Optional[bool] = None,
-        stop_event: Optional[threading.Event] = None
+        stop_event: Optional[threading.Event] = None,
+        prefill: Optional[PromptPrefill] = None
     ) -> AsyncGenerator[str, None]:
         """Асинхронно стримит ответ модели с умным батчингом (только чанки)"""
 
@@ -120,10 +122,31 @@ class ModelService:
             model=model,
             tokenizer=tokenizer,
             params=params,
-            stop_event=stop_event
+            stop_event=stop_event,
+            prefill=prefill
         ):
             yield batch
 
+    def start_prefill(
+        self,
+        variants: List[List[Dict[str, str]]],
+        enable_thinking: Optional[bool] = None,
+        step_size: int = 512,
+        min_tokens: int = 128
+    ) -> Optional[PromptPrefill]:
+        """
+        Запускает prefill общего префикса возможных промптов основной модели.
+        Возвращает None, если модель не загружена или префикс слишком короткий.
+        """
+        model, tokenizer = self.lifecycle_manager.get_model_and_tokenizer()
+        if not model or not tokenizer:
+            return None
+        params = self.parameters.get_generation_parameters(enable_thinking=enable_thinking)
+        return self.stream_manager.start_prefill(
+            variants, model, tokenizer, params["enable_thinking"],
+            step_size=step_size, min_tokens=min_tokens
+        )
+
     def is_initialized(self) -> bool:
         """Проверяет, инициализирована ли модель"""
         return self.lifecycle_manager.is_initialized()
\ No newline at end of file
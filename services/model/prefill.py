@@ -0,0 +1,117 @@
+# services/model/prefill.py
+"""
+Предварительный prefill префикса промпта в KV-кэш.
+
+Пока идут решение о поиске и HTTP-запрос, основная модель уже прогоняет
+контекст диалога (системное сообщение), который в итоговом промпте стоит
+перед блоком результатов поиска. Затем StreamManager досчитывает только
+хвост: результаты поиска и реплику пользователя.
+
+Prefill выполняется в потоке цикла событий порциями по step_size токенов:
+между порциями цикл обрабатывает сетевые ответы, а gpu_lock берётся только
+на время порции и без ожидания — если GPU занят (например, суммаризатором),
+порция откладывается.
+"""
+import asyncio
+import time
+from typing import Any, List, Optional, Tuple
+
+import mlx.core as mx
+from mlx_lm.models.cache import can_trim_prompt_cache, make_prompt_cache, trim_prompt_cache
+
+from container import container, gpu_lock
+from services.tracing import tracer
+
+# Пауза перед повторной попыткой взять занятый gpu_lock
+_LOCK_RETRY_DELAY = 0.005
+
+
+def encode_prompt(tokenizer, prompt: str) -> List[int]:
+    """Токенизирует промпт так же, как stream_generate."""
+    bos_token = getattr(tokenizer, "bos_token", None)
+    add_special_tokens = bos_token is None or not prompt.startswith(bos_token)
+    return list(tokenizer.encode(prompt, add_special_tokens=add_special_tokens))
+
+
+class PromptPrefill:
+    """Фоновый prefill префикса; результат забирает StreamManager."""
+
+    def __init__(self, model, tokenizer, prefix_text: str, step_size: int = 512):
+        self.model = model
+        self.tokenizer = tokenizer
+        # Последний токен префикса мог бы слиться со следующим текстом — не прогоняем его
+        self.tokens = encode_prompt(tokenizer, prefix_text)[:-1]
+        self.step_size = max(1, step_size)
+        self.cache = None
+        self.processed = 0
+        self.elapsed = 0.0
+        self._cancelled = False
+        self._task: Optional[asyncio.Task] = None
+        self._logger = None
+
+    @property
+    def logger(self):
+        if self._logger is None:
+            self._logger = container.get_logger()
+        return self._logger
+
+    def start(self) -> "PromptPrefill":
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        return self
+
+    def cancel(self):
+        """Отменяет prefill (кэш больше не нужен)."""
+        self._cancelled = True
+        self.cache = None
+
+    async def _run(self):
+        started = time.perf_counter()
+        try:
+            self.cache = make_prompt_cache(self.model)
+            while self.processed < len(self.tokens) and not self._cancelled:
+                if not gpu_lock.acquire(blocking=False):
+                    await asyncio.sleep(_LOCK_RETRY_DELAY)
+                    continue
+                try:
+                    chunk = self.tokens[self.processed:self.processed + self.step_size]
+                    # Prefill идёт параллельно поиску — на своей дорожке трассы
+                    with tracer.span("prefill.chunk", track="prefill", tokens=len(chunk)):
+                        self.model(mx.array(chunk)[None], cache=self.cache)
+                        mx.eval([c.state for c in self.cache])
+                finally:
+                    gpu_lock.release()
+                self.processed += len(chunk)
+                await asyncio.sleep(0)
+        except Exception as e:
+            self.logger.warning("⚠️ Ошибка предварительного prefill: %s", e)
+            self.cache = None
+        finally:
+            self.elapsed = time.perf_counter() - started
+
+    async def take(self, prompt_tokens: List[int]) -> Tuple[Optional[Any], List[int]]:
+        """
+        Дожидается prefill и возвращает (кэш, токены, которые ещё нужно прогнать).
+        Если итоговый промпт разошёлся с префиксом, а кэш нельзя обрезать,
+        возвращает (None, prompt_tokens) — генерация пойдёт с нуля.
+        """
+        if self._task is not None:
+            await self._task
+        cache, self.cache = self.cache, None
+        if cache is None or self._cancelled or self.processed < len(self.tokens):
+            return None, prompt_tokens
+
+        common = 0
+        limit = min(len(self.tokens), len(prompt_tokens) - 1)  # хотя бы один токен досчитывается
+        while common < limit and self.tokens[common] == prompt_tokens[common]:
+            common += 1
+        if common < len(self.tokens):
+            if common == 0 or not can_trim_prompt_cache(cache):
+                self.logger.info("🔁 Префикс промпта изменился, prefill не используется")
+                return None, prompt_tokens
+            trim_prompt_cache(cache, len(self.tokens) - common)
+
+        self.logger.info(
+            "⚡ Prefill заранее: %d токенов за %.2f сек, досчитывается %d",
+            common, self.elapsed, len(prompt_tokens) - common
+        )
+        return cache, prompt_tokens[common:]
@@ -45,11 +45,24 @@ class IStreamManager(Protocol):
         model,
         tokenizer,
         params: Dict[str, Any],
-        stop_event: Opt[threading.Event] = None
+        stop_event: Opt[threading.Event] = None,
+        prefill: Any = None
     ) -> AsyncGenerator[str, None]:
         """Асинхронно стримит ответ модели"""
         ...
 
+    def start_prefill(
+        self,
+        variants: List[List[Dict[str, str]]],
+        model,
+        tokenizer,
+        enable_thinking: bool,
+        step_size: int = 512,
+        min_tokens: int = 128
+    ) -> Any:
+        """Запускает prefill общего префикса возможных промптов"""
+        ...
+
 class IModelLifecycleManager(Protocol):
     """Протокол для управления жизненным циклом модели"""
     
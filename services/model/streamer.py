@@ -1,4 +1,5 @@
 # services/model/streamer.py
+import os
 import threading
 import asyncio
 import time
@@ -9,7 +10,29 @@ from mlx_lm.sample_utils import make_sampler, make_logits_processors
 
 from .protocol import IStreamManager
 from .fast_batcher import FastBatcher, BatchConfig
+from .prefill import PromptPrefill, encode_prompt
 from container import container, gpu_lock  # импортируем блокировку
+from services.metrics import metrics, TOKENS_PER_SECOND_BUCKETS
+from services.tracing import tracer
+
+GENERATION_QUEUE_WAIT = metrics.histogram(
+    "chat_generation_queue_wait_seconds", "Время от запроса генерации до захвата блокировки GPU"
+)
+GENERATION_TTFT = metrics.histogram(
+    "chat_generation_ttft_seconds", "Время до первого фрагмента ответа"
+)
+PREFILL_TPS = metrics.histogram(
+    "chat_generation_prefill_tokens_per_second", "Скорость обработки промпта", buckets=TOKENS_PER_SECOND_BUCKETS
+)
+DECODE_TPS = metrics.histogram(
+    "chat_generation_decode_tokens_per_second", "Скорость генерации токенов", buckets=TOKENS_PER_SECOND_BUCKETS
+)
+GENERATION_TOKENS = metrics.counter(
+    "chat_generation_tokens_total", "Обработанные токены: prompt — промпт, completion — ответ", ("kind",)
+)
+GENERATIONS = metrics.counter(
+    "chat_generations_total", "Генерации по исходу: completed, stopped, cancelled, error", ("status",)
+)
 
 
 class StreamManager(IStreamManager):
@@ -73,9 +96,14 @@ class StreamManager(IStreamManager):
         model,
         tokenizer,
         params: Dict[str, Any],
-        stop_event: Optional[threading.Event] = None
+        stop_event: Optional[threading.Event] = None,
+        prefill: Optional[PromptPrefill] = None
     ) -> AsyncGenerator[str, None]:
-        """Асинхронно стримит ответ модели с умным батчингом и кэшированными sampler/logits_processors."""
+        """
+        Асинхронно стримит ответ модели с умным батчингом и кэшированными sampler/logits_processors.
+        prefill — заранее запущенный prefill префикса промпта: его KV-кэш
+        переиспользуется, и модель досчитывает только оставшиеся токены.
+        """
 
         if not self._stream_lock.acquire(blocking=False):
             raise RuntimeError("Генерация уже выполняется. Дождитесь завершения.")
@@ -88,11 +116,16 @@ class StreamManager(IStreamManager):
 
         batcher = FastBatcher(self._batch_config)
         batcher.start()
+        requested_at = time.perf_counter()
+        first_chunk_seen = False
+        last_response = None
+        status = "cancelled"  # если потребитель закрыл генератор раньше
 
         try:
-            prompt = self._format_prompt_for_streaming(
-                messages, tokenizer, params["enable_thinking"]
-            )
+            with tracer.span("prompt_template"):
+                prompt = self._format_prompt_for_streaming(
+                    messages, tokenizer, params["enable_thinking"]
+                )
 
             # Получаем кэшированные или создаём новые sampler и logits_processors
             sampler = self._get_sampler(
@@ -104,18 +137,32 @@ class StreamManager(IStreamManager):
                 repetition_penalty=params["repetition_penalty"]
             )
 
+            generation_input = prompt
+            extra_kwargs = {}
+            if prefill is not None:
+                with tracer.span("prefill.take"):
+                    prompt_cache, rest_tokens = await prefill.take(encode_prompt(tokenizer, prompt))
+                if prompt_cache is not None:
+                    generation_input = rest_tokens
+                    extra_kwargs["prompt_cache"] = prompt_cache
+
             def _sync_generator() -> Iterator[str]:
                 """Синхронный генератор токенов с захватом глобальной блокировки на всё время генерации."""
+                nonlocal last_response
                 with gpu_lock:  # блокировка удерживается на протяжении всей генерации
+                    GENERATION_QUEUE_WAIT.observe(time.perf_counter() - requested_at)
+                    tracer.record("gpu_lock.wait", int(requested_at * 1e9))
                     try:
                         for response in stream_generate(
                             model=model,
                             tokenizer=tokenizer,
-                            prompt=prompt,
+                            prompt=generation_input,
                             max_tokens=params["max_tokens"],
                             sampler=sampler,
-                            logits_processors=logits_processors
+                            logits_processors=logits_processors,
+                            **extra_kwargs
                         ):
+                            last_response = response
                             if stop_event.is_set():
                                 break
                             chunk = response.text if hasattr(response, 'text') else str(response)
@@ -126,6 +173,7 @@ class StreamManager(IStreamManager):
 
             sync_gen = _sync_generator()
             last_yield_time = time.time()
+            batch_started_ns = time.perf_counter_ns()
 
             try:
                 while not stop_event.is_set():
@@ -133,6 +181,9 @@ class StreamManager(IStreamManager):
                         chunk = next(sync_gen)
 
                         if chunk:
+                            if not first_chunk_seen:
+                                first_chunk_seen = True
+                                GENERATION_TTFT.observe(time.perf_counter() - requested_at)
                             should_yield = batcher.put(chunk)
 
                             current_time = time.time()
@@ -144,8 +195,10 @@ class StreamManager(IStreamManager):
 
                                 batch = batcher.take_batch()
                                 if batch:
+                                    tracer.record("decode_batch", batch_started_ns, chars=len(batch))
                                     yield batch
                                     last_yield_time = current_time
+                                    batch_started_ns = time.perf_counter_ns()
 
                         await asyncio.sleep(0)
 
@@ -158,6 +211,7 @@ class StreamManager(IStreamManager):
                 final_batch = batcher.take_batch()
                 if final_batch:
                     yield final_batch
+                status = "stopped" if stop_event.is_set() else "completed"
 
             finally:
                 try:
@@ -166,15 +220,53 @@ class StreamManager(IStreamManager):
                     pass
 
         except Exception as e:
+            status = "error"
             self.logger.exception("Критическая ошибка в stream_response: %s", e)
             raise
 
         finally:
             batcher.stop()
+            self._record_generation(last_response, status)
             self._streaming_active = False
             self._active_stop_event = None
             self._stream_lock.release()
 
+    @staticmethod
+    def _record_generation(response, status: str):
+        """Метрики генерации по последнему ответу stream_generate (в нём итоговые скорости)."""
+        GENERATIONS.inc(status=status)
+        if response is None:
+            return
+        prompt_tps = getattr(response, "prompt_tps", 0.0)
+        generation_tps = getattr(response, "generation_tps", 0.0)
+        if prompt_tps:
+            PREFILL_TPS.observe(prompt_tps)
+        if generation_tps:
+            DECODE_TPS.observe(generation_tps)
+        GENERATION_TOKENS.inc(getattr(response, "prompt_tokens", 0), kind="prompt")
+        GENERATION_TOKENS.inc(getattr(response, "generation_tokens", 0), kind="completion")
+
+    def start_prefill(
+        self,
+        variants: List[List[Dict[str, str]]],
+        model,
+        tokenizer,
+        enable_thinking: bool,
+        step_size: int = 512,
+        min_tokens: int = 128
+    ) -> Optional[PromptPrefill]:
+        """
+        Запускает prefill общего префикса нескольких возможных промптов
+        (например, с блоком результатов поиска и без него).
+        Возвращает None, если общий префикс слишком короткий.
+        """
+        prompts = [self._format_prompt_for_streaming(messages, tokenizer, enable_thinking) for messages in variants]
+        prefix_text = os.path.commonprefix(prompts)
+        prefill = PromptPrefill(model, tokenizer, prefix_text, step_size=step_size)
+        if len(prefill.tokens) < min_tokens:
+            return None
+        return prefill.start()
+
     def _format_prompt_for_streaming(
         self,
         messages: List[Dict[str, str]],
@@ -175,6 +175,13 @@ class ThinkingHandler:
 
         return raw
 
+    @staticmethod
+    def strip_thinking(text: str) -> str:
+        """Хранимый текст без блоков размышлений (для поискового индекса)."""
+        if not text or '<think' not in text:
+            return text
+        return _STORED_RE.sub('', text).strip()
+
     # ──────────────────────────────────────────────
     # UI (при загрузке из хранилища)
     # ──────────────────────────────────────────────
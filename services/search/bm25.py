@@ -0,0 +1,79 @@
+# services/search/bm25.py
+"""
+BM25-ранжирование для локального поиска и отбора фрагментов.
+
+Токенизация грубая, но дешёвая: слова в нижнем регистре, «ё» → «е», у
+длинных слов отбрасывается окончание (берутся первые STEM_LENGTH символов),
+чтобы формы одного слова совпадали. Индекс хранит обратные списки
+«термин → (документ, частота)», поэтому запрос затрагивает только документы
+с его терминами.
+"""
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Tuple
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+# Длина «основы» слова; более длинные слова обрезаются
+STEM_LENGTH = 6
+
+
+def tokenize(text: str) -> List[str]:
+    """Термины текста для BM25."""
+    return [
+        word[:STEM_LENGTH]
+        for word in _WORD_RE.findall(text.lower().replace("ё", "е"))
+        if len(word) > 1 or word.isdigit()
+    ]
+
+
+class BM25Index:
+    """Обратный индекс с ранжированием Okapi BM25."""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        self._lengths: List[int] = []
+        self._total_length = 0
+
+    def add(self, tokens: Iterable[str]) -> int:
+        """Добавляет документ и возвращает его номер."""
+        doc = len(self._lengths)
+        counts = Counter(tokens)
+        for term, tf in counts.items():
+            self._postings[term].append((doc, tf))
+        length = sum(counts.values())
+        self._lengths.append(length)
+        self._total_length += length
+        return doc
+
+    def __len__(self) -> int:
+        return len(self._lengths)
+
+    def idf(self, term: str) -> float:
+        df = len(self._postings.get(term, ()))
+        n = len(self._lengths)
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def scores(self, query_tokens: Iterable[str]) -> Dict[int, float]:
+        """Оценки BM25 документов, содержащих хотя бы один термин запроса."""
+        if not self._lengths:
+            return {}
+        avg_length = self._total_length / len(self._lengths) or 1.0
+        result: Dict[int, float] = defaultdict(float)
+        for term in set(query_tokens):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = self.idf(term)
+            for doc, tf in postings:
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[doc] / avg_length)
+                result[doc] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return result
+
+    def top(self, query_tokens: Iterable[str], limit: int) -> List[Tuple[int, float]]:
+        """Лучшие документы: [(номер, оценка)] по убыванию оценки."""
+        ranked = sorted(self.scores(query_tokens).items(), key=lambda item: item[1], reverse=True)
+        return ranked[:limit]
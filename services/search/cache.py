@@ -0,0 +1,194 @@
+# services/search/cache.py
+"""
+Кэш результатов веб-поиска с ограниченным сроком жизни.
+
+Ключ — нормализованный запрос (регистр, пробелы, пунктуация и порядок слов
+не важны) вместе с max_results и search_depth. Первый уровень — LRU в
+памяти, второй — DiskLRUCache на SQLite, переживающий перезапуск. Срок
+жизни зависит от свежести: результаты со свежими датами публикации и
+запросы о текущих событиях живут недолго, остальные — дольше. Пустые
+ответы кэшируются ненадолго, чтобы не повторять заведомо пустой поиск.
+"""
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from container import container
+from services.disk_cache import DiskLRUCache
+from .client import SearchResult
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# Слова, по которым запрос считается вопросом о текущих событиях
+_FRESH_WORDS = frozenset({
+    "сегодня", "сейчас", "вчера", "завтра", "новости", "новость", "последние",
+    "последний", "текущий", "текущая", "курс", "погода", "счет", "матч",
+    "today", "now", "news", "latest", "current", "weather", "price", "score",
+})
+
+
+def normalize_query(query: str) -> str:
+    """Нормализованный запрос: слова в нижнем регистре без пунктуации, по алфавиту."""
+    tokens = _TOKEN_RE.findall(query.lower().replace("ё", "е"))
+    return " ".join(sorted(set(tokens)))
+
+
+class SearchResultCache:
+    """Двухуровневый (память + диск) TTL-кэш результатов поиска."""
+
+    def __init__(self, config: dict, namespace: str = ""):
+        # Набор поставщиков: при его смене старые записи не используются
+        self.namespace = namespace
+        ttl_cfg = config.get("ttl", {})
+        self.fresh_ttl = ttl_cfg.get("fresh", 900)
+        self.default_ttl = ttl_cfg.get("default", 6 * 3600)
+        self.empty_ttl = ttl_cfg.get("empty", 300)
+        self.fresh_days = ttl_cfg.get("fresh_days", 3)
+        self.memory_entries = config.get("memory_entries", 256)
+
+        # key -> (время истечения, результаты)
+        self._memory: "OrderedDict[str, Tuple[float, List[SearchResult]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._memory_hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+        self._logger = None
+
+        self._disk: Optional[DiskLRUCache] = None
+        if config.get("persistent", True):
+            try:
+                self._disk = DiskLRUCache(
+                    config.get("path", "cache/search_results.sqlite"),
+                    max_entries=config.get("max_entries", 2000),
+                    max_bytes=config.get("max_mb", 20) * 1024 * 1024,
+                    name="SearchCache"
+                )
+            except Exception as e:
+                self.logger.warning("⚠️ Дисковый кэш поиска недоступен: %s", e)
+
+    @property
+    def logger(self):
+        if self._logger is None:
+            self._logger = container.get_logger()
+        return self._logger
+
+    def make_key(self, query: str, max_results: int, search_depth: str) -> str:
+        return f"{self.namespace}|{search_depth}|{max_results}|{normalize_query(query)}"
+
+    def get(self, query: str, max_results: int, search_depth: str) -> Optional[List[SearchResult]]:
+        """Результаты из кэша или None."""
+        key = self.make_key(query, max_results, search_depth)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                expires_at, results = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self._memory_hits += 1
+                    return list(results)
+                del self._memory[key]
+
+        if self._disk is not None:
+            value = self._disk.get(key)
+            if value is not None:
+                try:
+                    data = json.loads(value)
+                    results = [SearchResult(**item) for item in data["results"]]
+                except (ValueError, KeyError, TypeError) as e:
+                    self.logger.warning("⚠️ Повреждённая запись кэша поиска: %s", e)
+                else:
+                    with self._lock:
+                        self._remember(key, data["expires_at"], results)
+                        self._disk_hits += 1
+                    return list(results)
+
+        with self._lock:
+            self._misses += 1
+        return None
+
+    def put(self, query: str, max_results: int, search_depth: str, results: List[SearchResult],
+            partial: bool = False):
+        """
+        Сохраняет результаты со сроком жизни по их свежести.
+        partial — ответили не все поставщики: срок не дольше, чем у пустого ответа.
+        """
+        key = self.make_key(query, max_results, search_depth)
+        ttl = self.ttl_for(query, results)
+        if partial:
+            ttl = min(ttl, self.empty_ttl)
+        expires_at = time.time() + ttl
+        with self._lock:
+            self._remember(key, expires_at, list(results))
+        if self._disk is not None:
+            value = json.dumps(
+                {"expires_at": expires_at, "results": [asdict(r) for r in results]},
+                ensure_ascii=False
+            )
+            self._disk.put(key, value, ttl=ttl)
+
+    def _remember(self, key: str, expires_at: float, results: List[SearchResult]):
+        self._memory[key] = (expires_at, results)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def ttl_for(self, query: str, results: List[SearchResult]) -> float:
+        """Срок жизни: короткий для пустых и свежих результатов, обычный для остальных."""
+        if not results:
+            return self.empty_ttl
+        if _FRESH_WORDS.intersection(normalize_query(query).split()):
+            return self.fresh_ttl
+        threshold = datetime.now(timezone.utc) - timedelta(days=self.fresh_days)
+        for result in results:
+            published = self._parse_date(result.published_date)
+            if published is not None and published >= threshold:
+                return self.fresh_ttl
+        return self.default_ttl
+
+    @staticmethod
+    def _parse_date(value: Optional[str]) -> Optional[datetime]:
+        if not value:
+            return None
+        try:
+            parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            # Tavily для новостей отдаёт даты в формате RFC 2822
+            try:
+                parsed = parsedate_to_datetime(value)
+            except (TypeError, ValueError):
+                return None
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return parsed
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        if self._disk is not None:
+            self._disk.clear()
+
+    def close(self):
+        if self._disk is not None:
+            self._disk.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._memory_hits + self._disk_hits + self._misses
+            hits = self._memory_hits + self._disk_hits
+            stats = {
+                "memory_entries": len(self._memory),
+                "memory_hits": self._memory_hits,
+                "disk_hits": self._disk_hits,
+                "misses": self._misses,
+                "hit_ratio": hits / lookups if lookups else 0.0,
+            }
+        if self._disk is not None:
+            stats["disk"] = self._disk.get_stats()
+        return stats
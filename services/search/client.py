@@ -2,11 +2,42 @@
 """
 Клиент для Tavily Search API.
 Документация: https://docs.tavily.com/docs/python-sdk/tavily-search
+
+Клиент держит один долгоживущий httpx.AsyncClient с пулом соединений:
+после первого запроса DNS, TCP и TLS повторно не выполняются, пока
+соединение живо (keep-alive). HTTP/2 включается, если установлен пакет h2.
+Временные сбои (сетевые ошибки, 429, 5xx) повторяются с экспоненциальной
+задержкой со случайным разбросом. Статистика переиспользования соединений
+и задержек доступна через get_stats().
 """
+import asyncio
+import random
+import threading
+import time
+from collections import deque
 from dataclasses import dataclass
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 import httpx
 
+from services.metrics import metrics
+from services.tracing import tracer
+
+try:
+    import h2  # noqa: F401
+    _HTTP2_AVAILABLE = True
+except ImportError:
+    _HTTP2_AVAILABLE = False
+
+# Сколько последних замеров задержки хранится для перцентилей
+_LATENCY_WINDOW = 256
+
+# Коды ответа, при которых запрос имеет смысл повторить
+_RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+SEARCH_HTTP_SECONDS = metrics.histogram(
+    "chat_search_http_request_seconds", "HTTP-запросы к API поиска (каждая попытка) по коду ответа", ("status",)
+)
+
 
 @dataclass
 class SearchResult:
@@ -17,14 +48,213 @@ class SearchResult:
     published_date: Optional[str] = None
 
 
+class _ClientStats:
+    """Счётчики запросов, соединений и задержек клиента."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.retries = 0
+        self.errors = 0
+        self.new_connections = 0
+        self.reused_connections = 0
+        self.clients_created = 0
+        self.latencies: deque = deque(maxlen=_LATENCY_WINDOW)
+
+    def record(self, latency: float, new_connection: bool):
+        with self.lock:
+            self.requests += 1
+            self.latencies.append(latency)
+            if new_connection:
+                self.new_connections += 1
+            else:
+                self.reused_connections += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.lock:
+            latencies = sorted(self.latencies)
+            snapshot = {
+                "requests": self.requests,
+                "retries": self.retries,
+                "errors": self.errors,
+                "new_connections": self.new_connections,
+                "reused_connections": self.reused_connections,
+                "clients_created": self.clients_created,
+            }
+        total = snapshot["new_connections"] + snapshot["reused_connections"]
+        snapshot["reuse_ratio"] = snapshot["reused_connections"] / total if total else 0.0
+        if latencies:
+            snapshot["latency_ms"] = {
+                "avg": 1000 * sum(latencies) / len(latencies),
+                "p50": 1000 * latencies[len(latencies) // 2],
+                "p95": 1000 * latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+                "max": 1000 * latencies[-1],
+            }
+        else:
+            snapshot["latency_ms"] = {}
+        return snapshot
+
+
 class TavilyClient:
-    """Тонкая обёртка над Tavily REST API."""
+    """Тонкая обёртка над Tavily REST API с постоянным пулом соединений."""
 
     BASE_URL = "https://api.tavily.com/search"
 
-    def __init__(self, api_key: str, timeout: int = 10):
+    def __init__(
+        self,
+        api_key: str,
+        timeout: int = 10,
+        base_url: Optional[str] = None,
+        http2: bool = True,
+        max_connections: int = 10,
+        max_keepalive_connections: int = 5,
+        keepalive_expiry: float = 60.0,
+        max_retries: int = 2,
+        backoff_base: float = 0.25,
+        backoff_max: float = 2.0,
+    ):
         self.api_key = api_key
         self.timeout = timeout
+        self.base_url = base_url or self.BASE_URL
+        self.http2 = http2 and _HTTP2_AVAILABLE
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.max_retries = max(0, max_retries)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self.stats = _ClientStats()
+        # httpx.AsyncClient привязан к циклу событий, в котором открыты его соединения
+        self._client: Optional[httpx.AsyncClient] = None
+        self._client_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._client_lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, api_key: str, tavily_cfg: dict) -> "TavilyClient":
+        """Создаёт клиент по секции search.tavily конфигурации."""
+        pool_cfg = tavily_cfg.get("pool", {})
+        retry_cfg = tavily_cfg.get("retry", {})
+        return cls(
+            api_key=api_key,
+            timeout=tavily_cfg.get("timeout", 10),
+            base_url=tavily_cfg.get("base_url"),
+            http2=tavily_cfg.get("http2", True),
+            max_connections=pool_cfg.get("max_connections", 10),
+            max_keepalive_connections=pool_cfg.get("max_keepalive_connections", 5),
+            keepalive_expiry=pool_cfg.get("keepalive_expiry", 60.0),
+            max_retries=retry_cfg.get("max_retries", 2),
+            backoff_base=retry_cfg.get("backoff_base", 0.25),
+            backoff_max=retry_cfg.get("backoff_max", 2.0),
+        )
+
+    # ========== Пул соединений ==========
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """Возвращает общий клиент, пересоздавая его при смене цикла событий."""
+        loop = asyncio.get_running_loop()
+        with self._client_lock:
+            client = self._client
+            if client is not None and not client.is_closed and self._client_loop is loop:
+                return client
+            # Соединения прежнего клиента принадлежат другому циклу — закрыть их
+            # отсюда нельзя, ссылка просто отпускается
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=self.limits,
+                http2=self.http2,
+            )
+            self._client_loop = loop
+            with self.stats.lock:
+                self.stats.clients_created += 1
+            return self._client
+
+    async def aclose(self):
+        """Закрывает пул соединений (из цикла, в котором он создан)."""
+        with self._client_lock:
+            client, self._client, self._client_loop = self._client, None, None
+        if client is not None and not client.is_closed:
+            await client.aclose()
+
+    def close(self, timeout: float = 2.0):
+        """
+        Синхронное закрытие при завершении приложения.
+        Если цикл клиента ещё работает в другом потоке, закрытие выполняется в нём;
+        если цикл уже остановлен — в нём же синхронно; закрытый цикл просто отпускается.
+        """
+        with self._client_lock:
+            client, loop = self._client, self._client_loop
+            self._client, self._client_loop = None, None
+        if client is None or client.is_closed:
+            return
+        if loop is None or loop.is_closed():
+            return
+        if loop.is_running():
+            try:
+                if asyncio.get_running_loop() is loop:
+                    return  # вызов из самого цикла: ждать здесь нельзя
+            except RuntimeError:
+                pass
+            future = asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+            future.result(timeout=timeout)
+        else:
+            loop.run_until_complete(client.aclose())
+
+    # ========== Запросы ==========
+
+    def _backoff_delay(self, attempt: int, response: Optional[httpx.Response] = None) -> float:
+        """Экспоненциальная задержка с полным разбросом; Retry-After учитывается, если задан."""
+        if response is not None:
+            retry_after = response.headers.get("retry-after")
+            if retry_after:
+                try:
+                    return min(self.backoff_max, max(0.0, float(retry_after)))
+                except ValueError:
+                    pass
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    async def _post(self, payload: dict) -> httpx.Response:
+        """POST с повторами при временных сбоях; учитывает новые и переиспользованные соединения."""
+        attempt = 0
+        while True:
+            connected = False
+
+            async def trace(event_name, info):
+                nonlocal connected
+                if event_name == "connection.connect_tcp.complete":
+                    connected = True
+
+            client = self._get_client()
+            started = time.perf_counter()
+            span = tracer.span("search.http", track="search.http", attempt=attempt)
+            try:
+                with span:
+                    response = await client.post(self.base_url, json=payload, extensions={"trace": trace})
+                    span.set(status=response.status_code, new_connection=connected)
+            except httpx.TransportError:
+                SEARCH_HTTP_SECONDS.observe(time.perf_counter() - started, status="transport_error")
+                if attempt >= self.max_retries:
+                    with self.stats.lock:
+                        self.stats.errors += 1
+                    raise
+                delay = self._backoff_delay(attempt)
+            else:
+                elapsed = time.perf_counter() - started
+                self.stats.record(elapsed, connected)
+                SEARCH_HTTP_SECONDS.observe(elapsed, status=response.status_code)
+                if response.status_code not in _RETRY_STATUSES or attempt >= self.max_retries:
+                    if response.is_error:
+                        with self.stats.lock:
+                            self.stats.errors += 1
+                    return response
+                delay = self._backoff_delay(attempt, response)
+
+            attempt += 1
+            with self.stats.lock:
+                self.stats.retries += 1
+            await asyncio.sleep(delay)
 
     async def search(
         self,
@@ -45,10 +275,9 @@ class TavilyClient:
             "include_raw_content": False,
         }
 
-        async with httpx.AsyncClient(timeout=self.timeout) as client:
-            response = await client.post(self.BASE_URL, json=payload)
-            response.raise_for_status()
-            data = response.json()
+        response = await self._post(payload)
+        response.raise_for_status()
+        data = response.json()
 
         results = []
         for item in data.get("results", []):
@@ -61,3 +290,9 @@ class TavilyClient:
             ))
 
         return results
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика запросов: повторы, ошибки, переиспользование соединений, задержки."""
+        stats = self.stats.snapshot()
+        stats["http2"] = self.http2
+        return stats
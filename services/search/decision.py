@@ -4,14 +4,26 @@ Pass 1: модель решает, нужен ли веб-поиск для от
 
 Используем уже загруженную модель суммаризатора (Qwen3-4B) —
 она быстрая, не блокирует основную модель и поддерживает
-структурированный вывод.
+структурированный вывод. Перед моделью запрос проверяет предварительный
+классификатор (preclassifier.py): очевидные случаи решаются без Pass 1.
 """
 import json
 import re
+import time
 from dataclasses import dataclass
 from typing import Optional
 from datetime import datetime
 
+from services.metrics import metrics
+from .preclassifier import SearchPreclassifier
+
+SEARCH_DECISION_SECONDS = metrics.histogram(
+    "chat_search_decision_seconds", "Решение о поиске: preclassifier — без модели, llm — Pass 1", ("source",)
+)
+SEARCH_DECISIONS = metrics.counter(
+    "chat_search_decisions_total", "Решения о поиске по источнику и итогу", ("source", "search")
+)
+
 def _get_current_datetime_str():
     return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
@@ -51,6 +63,12 @@ class SearchDecisionService:
     def __init__(self, config: dict):
         self.config = config
         self.decision_config = config.get("decision", {})
+        preclassifier_config = config.get("preclassifier", {})
+        self.preclassifier = (
+            SearchPreclassifier(preclassifier_config)
+            if preclassifier_config.get("enabled", True) else None
+        )
+        self.query_max_chars = preclassifier_config.get("query_max_chars", 300)
         self._logger = None
         
     @property
@@ -66,14 +84,47 @@ class SearchDecisionService:
         needs_search=False (fail-safe: лучше ответить без поиска,
         чем упасть).
         """
+        started = time.perf_counter()
+        if self.preclassifier is not None:
+            pre = self.preclassifier.decide(user_prompt)
+            if pre is not None:
+                query = self._prompt_as_query(user_prompt) if pre.needs_search else ""
+                self.logger.info(
+                    "🔍 [Pre] %s: needs_search=%s (p=%s)", pre.source, pre.needs_search,
+                    f"{pre.probability:.3f}" if pre.probability is not None else "-"
+                )
+                result = DecisionResult(
+                    needs_search=pre.needs_search and bool(query),
+                    query=query,
+                    raw_response=f"preclassifier: {pre.source}",
+                )
+                self._record_metrics("preclassifier", result, started)
+                return result
+
         try:
-            return await self._run_decision(user_prompt)
+            result = await self._run_decision(user_prompt)
         except Exception:
-            return DecisionResult(
+            result = DecisionResult(
                 needs_search=False,
                 query="",
                 raw_response="error"
             )
+        self._record_metrics("llm", result, started)
+        if self.preclassifier is not None and not result.raw_response.startswith("error"):
+            self.preclassifier.log(user_prompt, result.needs_search, result.query, "llm")
+        return result
+
+    @staticmethod
+    def _record_metrics(source: str, result: DecisionResult, started: float):
+        SEARCH_DECISION_SECONDS.observe(time.perf_counter() - started, source=source)
+        SEARCH_DECISIONS.inc(
+            source=source,
+            search="error" if result.raw_response.startswith("error") else str(result.needs_search).lower(),
+        )
+
+    def _prompt_as_query(self, user_prompt: str) -> str:
+        """Поисковый запрос без Pass 1: сам вопрос, сжатый по пробелам и длине."""
+        return " ".join(user_prompt.split())[:self.query_max_chars]
 
     async def _run_decision(self, user_prompt: str) -> DecisionResult:
         from services.context.summarizer_factory import SummarizerFactory
@@ -96,14 +147,14 @@ class SearchDecisionService:
                 enable_thinking=False,
             )
 
-            self.logger.info(f"🔍 [Pass 1] summarize result: success={result.success}, error={result.error}")
+            self.logger.info("🔍 [Pass 1] summarize result: success=%s, error=%s", result.success, result.error)
 
             if result.success:
                 raw = result.summary.strip()
-                self.logger.info(f"🔍 [Pass 1] Raw after strip: {raw}")
+                self.logger.info("🔍 [Pass 1] Raw after strip: %s", raw)
                 return self._parse_response(raw)
             else:
-                self.logger.error(f"🔍 [Pass 1] Summarization failed: {result.error}")
+                self.logger.error("🔍 [Pass 1] Summarization failed: %s", result.error)
                 return DecisionResult(needs_search=False, query="", raw_response=f"error: {result.error}")
 
         except Exception as e:
@@ -127,14 +178,14 @@ class SearchDecisionService:
             if needs_search and not query:
                 needs_search = False
 
-            self.logger.info(f"🔍 [Pass 1] Parsed result: needs_search={needs_search}, query='{query}'")
+            self.logger.info("🔍 [Pass 1] Parsed result: needs_search=%s, query='%s'", needs_search, query)
             return DecisionResult(
                 needs_search=needs_search,
                 query=query,
                 raw_response=raw,
             )
         except (json.JSONDecodeError, KeyError) as e:
-            self.logger.info(f"🔍 [Pass 1] JSON parse error: {e}, returning needs_search=False")
+            self.logger.info("🔍 [Pass 1] JSON parse error: %s, returning needs_search=False", e)
             return DecisionResult(needs_search=False, query="", raw_response=raw)
 
     def _get_context_config(self) -> dict:
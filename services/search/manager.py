@@ -2,15 +2,35 @@
 """
 SearchManager — оркестратор поискового флоу.
 
-Знает про Pass 1 (решение), клиент Tavily и форматирование,
+Знает про Pass 1 (решение), поставщиков результатов и форматирование,
 но не знает про стриминг и UI — это задача stream_processor.
+Если поставщиков несколько, они опрашиваются параллельно с общим
+дедлайном, а результаты сливаются без дубликатов (ranking.py).
 """
+import asyncio
+import time
 from dataclasses import dataclass
-from typing import List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
-from .client import TavilyClient, SearchResult
+from services.metrics import metrics
+from services.tracing import tracer
+from .cache import SearchResultCache
+from .client import SearchResult
+from .providers import SearchProvider, create_provider
+from .ranking import merge_results
 from .decision import SearchDecisionService, DecisionResult
 from .formatter import format_results_for_model, build_augmented_messages
+from .packing import pack_results_for_model
+
+SEARCH_CACHE_REQUESTS = metrics.counter(
+    "chat_search_cache_requests_total", "Обращения к кэшу результатов поиска", ("result",)
+)
+SEARCH_SECONDS = metrics.histogram(
+    "chat_search_seconds", "Опрос поставщиков поиска (с дедлайном) без учёта кэша"
+)
+SEARCH_PROVIDER_FAILURES = metrics.counter(
+    "chat_search_provider_failures_total", "Поставщики, не ответившие вовремя или с ошибкой", ("provider", "reason")
+)
 
 
 @dataclass
@@ -36,16 +56,29 @@ class SearchManager:
         results_cfg = search_cfg.get("results", {})
 
         self.decision_service = SearchDecisionService(search_cfg)
-        self.client = TavilyClient(
-            api_key=search_cfg.get("api_key", ""),
-            timeout=tavily_cfg.get("timeout", 10),
-        )
+        self._logger = None
+
+        self.providers: List[SearchProvider] = []
+        for name in search_cfg.get("active_providers", ["tavily"]):
+            try:
+                self.providers.append(create_provider(name, search_cfg))
+            except Exception as e:
+                self.logger.error("❌ Поставщик поиска %s недоступен: %s", name, e)
+        fanout_cfg = search_cfg.get("fanout", {})
+        self.deadline = fanout_cfg.get("deadline", 5.0)
+        self.similarity_threshold = fanout_cfg.get("similarity_threshold", 0.8)
+        self.provider_weights = fanout_cfg.get("weights", {}) or {}
+        self._fanout_stats = {"searches": 0, "timeouts": 0, "errors": 0}
+
+        cache_cfg = search_cfg.get("cache", {})
+        self.cache = SearchResultCache(
+            cache_cfg, namespace="+".join(p.name for p in self.providers)
+        ) if cache_cfg.get("enabled", True) else None
         self.max_results = tavily_cfg.get("max_results", 3)
         self.search_depth = tavily_cfg.get("search_depth", "basic")
         self.max_content_chars = results_cfg.get("max_content_chars", 1500)
         self.max_total_chars = results_cfg.get("max_total_chars", 5000)
-
-        self._logger = None
+        self.packing_cfg = results_cfg.get("packing", {})
 
     @property
     def logger(self):
@@ -66,12 +99,14 @@ class SearchManager:
         searched=False и исходные messages — генерация продолжается
         без поиска (fail-safe).
         """
-        self.logger.info(f"📡 SearchManager.process started for prompt: {user_prompt[:50]}...")
+        self.logger.info("📡 SearchManager.process started for prompt: %s...", user_prompt[:50])
 
         # Pass 1: нужен ли поиск?
-        decision: DecisionResult = await self.decision_service.should_search(user_prompt)
-        self.logger.info(f"📡 Decision: needs_search={decision.needs_search}, query='{decision.query}'")
-        self.logger.info(f"📡 Raw decision response: {decision.raw_response}")
+        with tracer.span("search.decision") as span:
+            decision: DecisionResult = await self.decision_service.should_search(user_prompt)
+            span.set(needs_search=decision.needs_search)
+        self.logger.info("📡 Decision: needs_search=%s, query='%s'", decision.needs_search, decision.query)
+        self.logger.info("📡 Raw decision response: %s", decision.raw_response)
 
         if not decision.needs_search:
             return SearchOutcome(
@@ -81,26 +116,20 @@ class SearchManager:
                 augmented_messages=original_messages,
             )
 
-        self.logger.info("🔍 Выполняю Tavily запрос...")
-        try:
-            results = await self.client.search(
-                query=decision.query,
-                max_results=self.max_results,
-                search_depth=self.search_depth,
-            )
-            self.logger.info(f"🔍 Tavily вернул {len(results)} результатов")
-        except Exception as e:
-            self.logger.error(f"❌ Tavily API error: {e}")
+        with tracer.span("search.fetch") as span:
+            results, error = await self.search(decision.query)
+            span.set(results=len(results))
+        if error is not None:
             return SearchOutcome(
                 searched=False,
                 query=decision.query,
                 results=[],
                 augmented_messages=original_messages,
-                error=str(e),
+                error=error,
             )
 
         if not results:
-            self.logger.warning(f"Tavily вернул 0 результатов для: {decision.query}")
+            self.logger.warning("Поиск вернул 0 результатов для: %s", decision.query)
             return SearchOutcome(
                 searched=False,
                 query=decision.query,
@@ -111,12 +140,8 @@ class SearchManager:
         self.logger.info("  ✅ Получено результатов: %d", len(results))
 
         # Форматирование и инжекция в messages
-        search_context = format_results_for_model(
-            results=results,
-            query=decision.query,
-            max_content_chars=self.max_content_chars,
-            max_total_chars=self.max_total_chars,
-        )
+        with tracer.span("search.format"):
+            search_context = self.format_results(results, decision.query)
         augmented = build_augmented_messages(original_messages, search_context)
 
         return SearchOutcome(
@@ -124,4 +149,122 @@ class SearchManager:
             query=decision.query,
             results=results,
             augmented_messages=augmented,
-        )
\ No newline at end of file
+        )
+
+    def format_results(self, results: List[SearchResult], query: str) -> str:
+        """Контекст поиска для Pass 2: лучшие фрагменты по бюджету токенов или обрезка по символам."""
+        if self.packing_cfg.get("enabled", True):
+            try:
+                return pack_results_for_model(results, query, self.packing_cfg)
+            except Exception as e:
+                self.logger.warning("⚠️ Ошибка упаковки результатов поиска: %s", e)
+        return format_results_for_model(
+            results=results,
+            query=query,
+            max_content_chars=self.max_content_chars,
+            max_total_chars=self.max_total_chars,
+        )
+
+    async def search(self, query: str) -> Tuple[List[SearchResult], Optional[str]]:
+        """
+        Результаты поиска по запросу (из кэша или от поставщиков) и текст ошибки,
+        если ни один поставщик не ответил.
+        """
+        if self.cache is not None:
+            results = self.cache.get(query, self.max_results, self.search_depth)
+            SEARCH_CACHE_REQUESTS.inc(result="miss" if results is None else "hit")
+            if results is not None:
+                self.logger.info("🔍 Результаты поиска из кэша: %d", len(results))
+                return results, None
+
+        results, error, partial = await self._fan_out(query)
+        if error is None and self.cache is not None:
+            # Неполный ответ кэшируется ненадолго, чтобы не закрепить его после восстановления поставщика
+            self.cache.put(query, self.max_results, self.search_depth, results, partial=partial)
+        return results, error
+
+    async def _fan_out(self, query: str) -> Tuple[List[SearchResult], Optional[str], bool]:
+        """
+        Параллельный опрос поставщиков; опоздавшие к дедлайну отменяются.
+        Возвращает результаты, текст ошибки и признак неполного ответа.
+        """
+        if not self.providers:
+            return [], "нет доступных поставщиков поиска", False
+
+        started = time.perf_counter()
+        tasks = {
+            provider: asyncio.ensure_future(
+                provider.search(query=query, max_results=self.max_results, search_depth=self.search_depth)
+            )
+            for provider in self.providers
+        }
+        # Единственного поставщика не обрываем: его ограничивают собственные таймаут и повторы
+        deadline = self.deadline if len(self.providers) > 1 else None
+        done, pending = await asyncio.wait(tasks.values(), timeout=deadline)
+        for task in pending:
+            task.cancel()
+
+        collected = []
+        errors = []
+        for provider, task in tasks.items():
+            if task not in done:
+                errors.append(f"{provider.name}: дедлайн {self.deadline} сек")
+                self._fanout_stats["timeouts"] += 1
+                SEARCH_PROVIDER_FAILURES.inc(provider=provider.name, reason="timeout")
+            elif task.exception() is not None:
+                errors.append(f"{provider.name}: {task.exception()}")
+                self._fanout_stats["errors"] += 1
+                SEARCH_PROVIDER_FAILURES.inc(provider=provider.name, reason="error")
+            else:
+                collected.append((provider.name, task.result()))
+        self._fanout_stats["searches"] += 1
+        SEARCH_SECONDS.observe(time.perf_counter() - started)
+
+        for message in errors:
+            self.logger.warning("⚠️ Поставщик поиска не ответил — %s", message)
+        if not collected:
+            return [], "; ".join(errors), False
+
+        if len(self.providers) == 1:
+            results = collected[0][1]
+        else:
+            results = merge_results(
+                collected,
+                weights=self.provider_weights,
+                similarity_threshold=self.similarity_threshold,
+                max_results=self.max_results,
+            )
+        self.logger.info(
+            "🔍 Поиск: %d результатов от %s за %.0f мс",
+            len(results), ", ".join(name for name, _ in collected), 1000 * (time.perf_counter() - started)
+        )
+        return results, None, bool(errors)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика поставщиков (соединения, задержки), опроса, кэша и предклассификатора."""
+        stats = {
+            "providers": {provider.name: provider.get_stats() for provider in self.providers},
+            "fanout": dict(self._fanout_stats),
+        }
+        if self.cache is not None:
+            stats["cache"] = self.cache.get_stats()
+        if self.decision_service.preclassifier is not None:
+            stats["preclassifier"] = self.decision_service.preclassifier.get_stats()
+        return stats
+
+    def shutdown(self):
+        """Закрывает соединения поставщиков и кэш (при завершении приложения)."""
+        for provider in self.providers:
+            stats = provider.get_stats()
+            try:
+                provider.close()
+            except Exception as e:
+                self.logger.warning("⚠️ Ошибка закрытия поставщика поиска %s: %s", provider.name, e)
+            if stats.get("requests"):
+                self.logger.info(
+                    "🌐 Поиск (%s): запросов %d, новых соединений %d, переиспользовано %d, p50 %.0f мс",
+                    provider.name, stats["requests"], stats["new_connections"], stats["reused_connections"],
+                    stats["latency_ms"].get("p50", 0.0),
+                )
+        if self.cache is not None:
+            self.cache.close()
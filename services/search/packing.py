@@ -0,0 +1,174 @@
+# services/search/packing.py
+"""
+Упаковка результатов поиска в промпт по бюджету токенов.
+
+Вместо обрезки каждого результата по символам в порядке поставщика:
+1. содержимое результатов режется на фрагменты (предложения, собранные
+   примерно по passage_words слов);
+2. фрагменты оцениваются BM25 по запросу (индекс строится по фрагментам
+   этого же ответа), с небольшой добавкой за оценку самого результата;
+   фрагменты без терминов запроса отбрасываются, если совпадения вообще есть;
+3. почти одинаковые фрагменты (Жаккар по шинглам) отбрасываются;
+4. фрагменты набираются по максимальной предельной релевантности (MMR):
+   релевантность минус сходство с уже выбранными — пока не исчерпан
+   бюджет токенов.
+Выбранные фрагменты выводятся по источникам в исходном порядке текста.
+"""
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Set, Tuple
+
+from services.context.tokens import token_counter
+from .bm25 import BM25Index, tokenize
+from .client import SearchResult
+from .ranking import jaccard, shingles
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?…])\s+|\n+")
+
+
+@dataclass
+class Passage:
+    result_index: int
+    position: int
+    text: str
+    relevance: float = 0.0
+    shingles: Set[Tuple[str, ...]] = None
+
+
+def split_passages(text: str, passage_words: int) -> List[str]:
+    """Разбивает текст на фрагменты из целых предложений примерно по passage_words слов."""
+    passages = []
+    current: List[str] = []
+    words = 0
+    for sentence in _SENTENCE_RE.split(text.strip()):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        current.append(sentence)
+        words += len(sentence.split())
+        if words >= passage_words:
+            passages.append(" ".join(current))
+            current, words = [], 0
+    if current:
+        passages.append(" ".join(current))
+    return passages
+
+
+class ResultPacker:
+    """Отбор фрагментов результатов поиска под бюджет токенов."""
+
+    def __init__(self, config: dict):
+        self.token_budget = config.get("token_budget", 1200)
+        self.passage_words = config.get("passage_words", 60)
+        self.mmr_lambda = config.get("mmr_lambda", 0.7)
+        self.duplicate_threshold = config.get("duplicate_threshold", 0.6)
+        self.result_score_weight = config.get("result_score_weight", 0.2)
+        self.max_passages_per_result = config.get("max_passages_per_result", 3)
+
+    def _candidates(self, results: List[SearchResult], query: str) -> List[Passage]:
+        passages: List[Passage] = []
+        for i, result in enumerate(results):
+            for position, text in enumerate(split_passages(result.content, self.passage_words)):
+                passages.append(Passage(result_index=i, position=position, text=text))
+        if not passages:
+            return []
+
+        index = BM25Index()
+        for passage in passages:
+            index.add(tokenize(passage.text))
+        scores = index.scores(tokenize(query))
+        top = max(scores.values(), default=0.0) or 1.0
+        top_result = max((r.score for r in results), default=0.0) or 1.0
+        for doc, passage in enumerate(passages):
+            passage.relevance = (
+                (1 - self.result_score_weight) * scores.get(doc, 0.0) / top
+                + self.result_score_weight * results[passage.result_index].score / top_result
+            )
+            passage.shingles = shingles(passage.text)
+        if scores:
+            # Фрагменты без единого термина запроса (навигация, подписки, cookie) не берём
+            passages = [passage for doc, passage in enumerate(passages) if doc in scores]
+        return passages
+
+    def select(self, results: List[SearchResult], query: str, budget: int,
+               header_costs: Dict[int, int]) -> Dict[int, List[Passage]]:
+        """
+        Фрагменты, выбранные по MMR в пределах бюджета: {номер результата: [фрагменты]}.
+        header_costs — стоимость заголовка источника, учитывается с его первым фрагментом.
+        """
+        candidates = self._candidates(results, query)
+        # Почти одинаковые фрагменты: оставляем более релевантный
+        candidates.sort(key=lambda p: p.relevance, reverse=True)
+        unique: List[Passage] = []
+        for passage in candidates:
+            if all(jaccard(passage.shingles, kept.shingles) < self.duplicate_threshold for kept in unique):
+                unique.append(passage)
+
+        selected: Dict[int, List[Passage]] = {}
+        chosen: List[Passage] = []
+        used = 0
+        remaining = unique
+        while remaining:
+            best, best_score = None, None
+            for passage in remaining:
+                redundancy = max((jaccard(passage.shingles, c.shingles) for c in chosen), default=0.0)
+                score = self.mmr_lambda * passage.relevance - (1 - self.mmr_lambda) * redundancy
+                if best_score is None or score > best_score:
+                    best, best_score = passage, score
+            remaining = [p for p in remaining if p is not best]
+            if len(selected.get(best.result_index, ())) >= self.max_passages_per_result:
+                continue
+            cost = token_counter.count(best.text)
+            if best.result_index not in selected:
+                cost += header_costs.get(best.result_index, 0)
+            if used + cost > budget:
+                continue  # более короткий фрагмент ещё может поместиться
+            used += cost
+            chosen.append(best)
+            selected.setdefault(best.result_index, []).append(best)
+        return selected
+
+
+def pack_results_for_model(results: List[SearchResult], query: str, config: dict) -> str:
+    """
+    Строка контекста для Pass 2 (в том же формате, что format_results_for_model),
+    собранная из лучших фрагментов в пределах бюджета токенов.
+    """
+    if not results:
+        return ""
+
+    packer = ResultPacker(config)
+    source_headers = {
+        i: f"    URL: {r.url}" + (f"\n    Дата: {r.published_date}" if r.published_date else "")
+        for i, r in enumerate(results)
+    }
+    header_costs = {
+        i: token_counter.count(f"[{i + 1}] {r.title}\n{source_headers[i]}")
+        for i, r in enumerate(results)
+    }
+    preamble = [
+        f'[Результаты веб-поиска по запросу: "{query}"]',
+        f'[Найдено источников: {len(results)}. Используй эти данные при ответе.',
+        ' Ссылайся на источники по номеру, например: [1], [2].]',
+        "",
+    ]
+    budget = packer.token_budget - token_counter.count("\n".join(preamble))
+    selected = packer.select(results, query, budget, header_costs)
+
+    blocks = []
+    for i, result in enumerate(results):
+        passages = selected.get(i)
+        if not passages:
+            continue
+        passages.sort(key=lambda p: p.position)
+        blocks.append("\n".join([
+            f"[{len(blocks) + 1}] {result.title}",
+            source_headers[i],
+            *(f"    {p.text}" for p in passages),
+            "",
+        ]))
+
+    if not blocks:
+        return ""
+    preamble[1] = f'[Найдено источников: {len(blocks)}. Используй эти данные при ответе.'
+    return "\n".join(preamble + blocks)
@@ -0,0 +1,259 @@
+# services/search/preclassifier.py
+"""
+Быстрый предварительный классификатор «нужен ли поиск».
+
+Стоит перед Pass 1: очевидные случаи решаются без модели. Сначала
+проверяются правила (приветствия, код, перевод и редактура — поиск не
+нужен; погода, курсы, новости — нужен), затем логистическая регрессия по
+хэшированным символьным n-граммам. Модель обучается скриптом
+train_search_classifier.py на журнале решений Pass 1 и работает на CPU за
+микросекунды. Решение принимается, только если вероятность вне
+«неуверенной» полосы [skip_threshold, search_threshold]; иначе вызывается
+LLM. Журнал решений LLM пишется сюда же в JSONL — из него и обучается модель.
+Журнал ограничен по размеру: при превышении log_max_mb текущий файл
+становится *.1 (предыдущий *.1 удаляется).
+"""
+import json
+import math
+import os
+import re
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from container import container
+
+# Суффикс предыдущего файла журнала решений после ротации
+ROTATED_SUFFIX = ".1"
+
+# Размер пространства хэшированных признаков
+FEATURE_DIM = 1 << 18
+NGRAM_RANGE = (2, 4)
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+# Правила: (имя, шаблон, нужен ли поиск). Проверяются по порядку.
+_RULES: List[Tuple[str, "re.Pattern", bool]] = [
+    ("code", re.compile(r"```|^\s*(def |class |import |from \S+ import |#include|function |const |let )|[;{}]\s*$", re.M), False),
+    ("small_talk", re.compile(
+        r"^\W*(привет\w*|здравствуй\w*|добр\w+ (утро|день|вечер)|спасибо|благодарю|пока|ок|окей|хорошо|понятно|"
+        r"hi|hello|hey|thanks|thank you|ok|okay|bye)\W*$", re.I), False),
+    ("editing", re.compile(
+        r"^\W*(переведи|перепиши|исправь|сократи|перефразируй|отредактируй|проверь (орфографию|текст)|"
+        r"translate|rewrite|paraphrase|proofread)\b", re.I), False),
+    ("arithmetic", re.compile(r"^[\d\s.,+\-*/^()=%?]+$"), False),
+    ("weather", re.compile(r"\bпогод\w*|\bweather\b", re.I), True),
+    ("rates", re.compile(r"\bкурс\w* (доллар|евро|рубл|юан|биткоин|валют)\w*|\bexchange rate\b", re.I), True),
+    ("news", re.compile(r"\bновост\w*|\bпоследн\w+ (событи|новост)\w*|\bnews\b", re.I), True),
+]
+
+
+@dataclass
+class PreDecision:
+    needs_search: bool
+    source: str             # "rule:<имя>" или "model"
+    probability: Optional[float] = None
+
+
+def featurize(text: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Индексы и веса (L2-нормированные) хэшированных n-грамм текста."""
+    text = text.lower().replace("ё", "е")
+    words = _WORD_RE.findall(text)
+    counts: Dict[int, float] = {}
+    for word in words:
+        padded = f" {word} "
+        counts[zlib.crc32(b"w" + word.encode("utf-8")) % FEATURE_DIM] = 1.0
+        for n in range(NGRAM_RANGE[0], NGRAM_RANGE[1] + 1):
+            for i in range(len(padded) - n + 1):
+                counts[zlib.crc32(padded[i:i + n].encode("utf-8")) % FEATURE_DIM] = 1.0
+    if "?" in text:
+        counts[zlib.crc32(b"<question>") % FEATURE_DIM] = 1.0
+    if not counts:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+    indices = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+    values = np.full(len(counts), 1.0 / np.sqrt(len(counts)), dtype=np.float32)
+    return indices, values
+
+
+class LogisticModel:
+    """Логистическая регрессия над разреженными хэшированными признаками."""
+
+    def __init__(self, weights: Optional[np.ndarray] = None, bias: float = 0.0):
+        self.weights = weights if weights is not None else np.zeros(FEATURE_DIM, dtype=np.float32)
+        self.bias = float(bias)
+
+    def predict_proba(self, text: str) -> float:
+        indices, values = featurize(text)
+        z = float(self.weights[indices] @ values) + self.bias
+        return 1.0 / (1.0 + math.exp(-max(-30.0, min(30.0, z))))
+
+    def fit(self, texts: List[str], labels: List[int], epochs: int = 20, lr: float = 5.0,
+            l2: float = 1e-5, batch_size: int = 64, seed: int = 0):
+        """Мини-батчевый градиентный спуск с L2-регуляризацией и балансировкой классов."""
+        features = [featurize(text) for text in texts]
+        y = np.asarray(labels, dtype=np.float32)
+        positives = max(1.0, float(y.sum()))
+        negatives = max(1.0, float(len(y) - y.sum()))
+        class_weight = np.where(y > 0, len(y) / (2 * positives), len(y) / (2 * negatives)).astype(np.float32)
+        rng = np.random.default_rng(seed)
+
+        for _ in range(epochs):
+            order = rng.permutation(len(features))
+            for start in range(0, len(order), batch_size):
+                batch = order[start:start + batch_size]
+                indices = np.concatenate([features[i][0] for i in batch])
+                values = np.concatenate([features[i][1] for i in batch])
+                rows = np.repeat(np.arange(len(batch)), [len(features[i][0]) for i in batch])
+                z = np.bincount(rows, weights=self.weights[indices] * values, minlength=len(batch)) + self.bias
+                p = 1.0 / (1.0 + np.exp(-z))
+                error = (p - y[batch]) * class_weight[batch] / len(batch)
+                gradient = np.zeros_like(self.weights)
+                np.add.at(gradient, indices, (error[rows] * values).astype(np.float32))
+                touched = np.unique(indices)
+                gradient[touched] += l2 * self.weights[touched]
+                self.weights -= lr * gradient
+                self.bias -= lr * float(error.sum())
+
+    def save(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        nonzero = np.flatnonzero(self.weights)
+        np.savez_compressed(path, indices=nonzero, values=self.weights[nonzero],
+                            bias=np.array([self.bias]), dim=np.array([FEATURE_DIM]))
+
+    @classmethod
+    def load(cls, path: str) -> "LogisticModel":
+        data = np.load(path)
+        if int(data["dim"][0]) != FEATURE_DIM:
+            raise ValueError("размерность признаков модели не совпадает")
+        weights = np.zeros(FEATURE_DIM, dtype=np.float32)
+        weights[data["indices"]] = data["values"]
+        return cls(weights, float(data["bias"][0]))
+
+
+def match_rule(text: str) -> Optional[Tuple[str, bool]]:
+    """(имя правила, нужен ли поиск) для первого сработавшего правила."""
+    for name, pattern, needs_search in _RULES:
+        if pattern.search(text):
+            return name, needs_search
+    return None
+
+
+def read_decision_log(path: str, sources: Iterable[str] = ("llm",)) -> List[Dict[str, Any]]:
+    """Записи журнала решений с заданными источниками (по умолчанию только LLM)."""
+    sources = set(sources)
+    records = []
+    # Сначала ротированная часть — записи идут в хронологическом порядке
+    for file_path in (path + ROTATED_SUFFIX, path):
+        if not os.path.exists(file_path):
+            continue
+        with open(file_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record.get("source") in sources and record.get("prompt"):
+                    records.append(record)
+    return records
+
+
+class SearchPreclassifier:
+    """Правила + логистическая регрессия перед вызовом LLM в Pass 1."""
+
+    def __init__(self, config: dict):
+        self.use_rules = config.get("rules", True)
+        self.search_threshold = config.get("search_threshold", 0.9)
+        self.skip_threshold = config.get("skip_threshold", 0.1)
+        self.model_path = config.get("model_path", "cache/search_classifier.npz")
+        self.log_decisions = config.get("log_decisions", True)
+        self.log_path = config.get("log_path", "cache/search_decisions.jsonl")
+        self.log_max_bytes = int(config.get("log_max_mb", 5) * 1024 * 1024)
+        self.max_prompt_chars = config.get("max_prompt_chars", 500)
+
+        self._log_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {"rule": 0, "model": 0, "uncertain": 0}
+        self._logger = None
+        self.model: Optional[LogisticModel] = None
+        if os.path.exists(self.model_path):
+            try:
+                self.model = LogisticModel.load(self.model_path)
+                self.logger.info("🧮 Классификатор поиска загружен: %s", self.model_path)
+            except Exception as e:
+                self.logger.warning("⚠️ Не удалось загрузить классификатор поиска: %s", e)
+
+    @property
+    def logger(self):
+        if self._logger is None:
+            self._logger = container.get_logger()
+        return self._logger
+
+    def decide(self, prompt: str) -> Optional[PreDecision]:
+        """Уверенное решение или None, если нужен Pass 1."""
+        text = prompt[:self.max_prompt_chars]
+        if self.use_rules:
+            rule = match_rule(text)
+            if rule is not None:
+                self._count("rule")
+                return PreDecision(needs_search=rule[1], source=f"rule:{rule[0]}")
+
+        if self.model is not None:
+            probability = self.model.predict_proba(text)
+            if probability >= self.search_threshold or probability <= self.skip_threshold:
+                self._count("model")
+                return PreDecision(
+                    needs_search=probability >= self.search_threshold,
+                    source="model",
+                    probability=probability,
+                )
+
+        self._count("uncertain")
+        return None
+
+    def _count(self, key: str):
+        with self._stats_lock:
+            self._stats[key] += 1
+
+    def log(self, prompt: str, needs_search: bool, query: str, source: str,
+            probability: Optional[float] = None):
+        """
+        Дописывает решение в журнал. Вызывается только для решений LLM — они
+        служат разметкой для обучения; при превышении log_max_mb журнал ротируется.
+        """
+        if not self.log_decisions:
+            return
+        record = {
+            "ts": time.time(),
+            "prompt": prompt[:self.max_prompt_chars],
+            "search": needs_search,
+            "query": query,
+            "source": source,
+        }
+        if probability is not None:
+            record["probability"] = round(probability, 4)
+        try:
+            directory = os.path.dirname(self.log_path)
+            with self._log_lock:
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    size = f.tell()
+                if self.log_max_bytes > 0 and size >= self.log_max_bytes:
+                    os.replace(self.log_path, self.log_path + ROTATED_SUFFIX)
+        except OSError as e:
+            self.logger.warning("⚠️ Не удалось записать решение о поиске: %s", e)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        total = sum(stats.values())
+        stats["decided_ratio"] = (stats["rule"] + stats["model"]) / total if total else 0.0
+        stats["model_loaded"] = self.model is not None
+        return stats
@@ -0,0 +1,244 @@
+# services/search/providers.py
+"""
+Поставщики результатов веб-поиска.
+
+Все поставщики реализуют один интерфейс SearchProvider:
+- tavily — Tavily Search API (постоянный HTTP-клиент TavilyClient);
+- local  — офлайн-поиск BM25 по документам в каталоге на диске;
+- mock   — заготовленные ответы с заданной задержкой (тесты и бенчмарки).
+
+Какие поставщики используются, задаёт search.providers в search_config.yaml.
+"""
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from container import container
+from .bm25 import BM25Index, tokenize
+from .client import SearchResult, TavilyClient
+
+# Расширения текстовых документов локального корпуса
+_TEXT_EXTENSIONS = (".txt", ".md")
+
+
+class SearchProvider:
+    """Базовый класс поставщика результатов поиска."""
+
+    name = "base"
+
+    def __init__(self, search_cfg: dict, config: dict):
+        self._logger = None
+
+    @property
+    def logger(self):
+        if self._logger is None:
+            self._logger = container.get_logger()
+        return self._logger
+
+    async def search(self, query: str, max_results: int = 3, search_depth: str = "basic") -> List[SearchResult]:
+        raise NotImplementedError
+
+    def close(self):
+        """Освобождает ресурсы (соединения, файлы)."""
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {}
+
+
+class TavilyProvider(SearchProvider):
+    """Tavily Search API."""
+
+    name = "tavily"
+
+    def __init__(self, search_cfg: dict, config: dict):
+        super().__init__(search_cfg, config)
+        # Один клиент с пулом соединений на всё время работы приложения
+        self.client = TavilyClient.from_config(search_cfg.get("api_key", ""), search_cfg.get("tavily", {}))
+
+    async def search(self, query: str, max_results: int = 3, search_depth: str = "basic") -> List[SearchResult]:
+        return await self.client.search(query=query, max_results=max_results, search_depth=search_depth)
+
+    def close(self):
+        self.client.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return self.client.get_stats()
+
+
+class LocalCorpusProvider(SearchProvider):
+    """
+    Офлайн-поиск по каталогу документов.
+
+    Поддерживаются .txt/.md (заголовок — первая строка) и .jsonl, где каждая
+    строка — {"title", "url", "content", "published_date"}. Индекс BM25
+    строится при первом запросе и перестраивается, если файлы изменились.
+    Фрагментом результата служит абзац документа, лучше всего совпавший с запросом.
+    """
+
+    name = "local"
+
+    def __init__(self, search_cfg: dict, config: dict):
+        super().__init__(search_cfg, config)
+        self.corpus_dir = config.get("corpus_dir", "search_corpus")
+        self.max_snippet_chars = config.get("max_snippet_chars", 1500)
+        self._lock = threading.Lock()
+        self._signature = None
+        self._index = BM25Index()
+        self._documents: List[Dict[str, Any]] = []
+
+    def _corpus_signature(self):
+        if not os.path.isdir(self.corpus_dir):
+            return None
+        entries = []
+        for root, _, files in os.walk(self.corpus_dir):
+            for file_name in files:
+                path = os.path.join(root, file_name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((path, stat.st_mtime_ns, stat.st_size))
+        return tuple(sorted(entries))
+
+    def _ensure_index(self):
+        signature = self._corpus_signature()
+        with self._lock:
+            if signature == self._signature:
+                return
+            started = time.perf_counter()
+            index = BM25Index()
+            documents = []
+            for path, _, _ in signature or ():
+                for document in self._read_documents(path):
+                    index.add(tokenize(f"{document['title']} {document['content']}"))
+                    documents.append(document)
+            self._index, self._documents, self._signature = index, documents, signature
+            self.logger.info(
+                "📚 Локальный корпус поиска: %d документов за %.2f сек",
+                len(documents), time.perf_counter() - started
+            )
+
+    def _read_documents(self, path: str) -> List[Dict[str, Any]]:
+        try:
+            if path.endswith(".jsonl"):
+                documents = []
+                with open(path, "r", encoding="utf-8") as f:
+                    for line_no, line in enumerate(f):
+                        if not line.strip():
+                            continue
+                        item = json.loads(line)
+                        documents.append({
+                            "title": item.get("title", ""),
+                            "url": item.get("url") or f"file://{os.path.abspath(path)}#{line_no}",
+                            "content": item.get("content", ""),
+                            "published_date": item.get("published_date"),
+                        })
+                return documents
+            if path.endswith(_TEXT_EXTENSIONS):
+                with open(path, "r", encoding="utf-8") as f:
+                    text = f.read()
+                first_line, _, rest = text.strip().partition("\n")
+                return [{
+                    "title": first_line.strip("# ").strip() or os.path.basename(path),
+                    "url": f"file://{os.path.abspath(path)}",
+                    "content": rest.strip() or first_line,
+                    "published_date": None,
+                }]
+        except (OSError, ValueError) as e:
+            self.logger.warning("⚠️ Не удалось прочитать документ корпуса %s: %s", path, e)
+        return []
+
+    def _best_passage(self, content: str, query_terms: set) -> str:
+        paragraphs = [p.strip() for p in content.split("\n\n") if p.strip()] or [content]
+        best = max(paragraphs, key=lambda p: len(query_terms.intersection(tokenize(p))))
+        return best[:self.max_snippet_chars]
+
+    def search_sync(self, query: str, max_results: int = 3) -> List[SearchResult]:
+        self._ensure_index()
+        query_tokens = tokenize(query)
+        with self._lock:
+            ranked = self._index.top(query_tokens, max_results)
+            documents = self._documents
+        if not ranked:
+            return []
+        top_score = ranked[0][1] or 1.0
+        query_terms = set(query_tokens)
+        return [
+            SearchResult(
+                title=documents[doc]["title"],
+                url=documents[doc]["url"],
+                content=self._best_passage(documents[doc]["content"], query_terms),
+                score=score / top_score,
+                published_date=documents[doc]["published_date"],
+            )
+            for doc, score in ranked
+        ]
+
+    async def search(self, query: str, max_results: int = 3, search_depth: str = "basic") -> List[SearchResult]:
+        # Построение индекса читает файлы — не блокируем цикл событий
+        return await asyncio.to_thread(self.search_sync, query, max_results)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"documents": len(self._documents), "corpus_dir": self.corpus_dir}
+
+
+class MockProvider(SearchProvider):
+    """Заготовленные результаты с имитацией задержки и сбоев."""
+
+    name = "mock"
+
+    def __init__(self, search_cfg: dict, config: dict):
+        super().__init__(search_cfg, config)
+        self.latency = config.get("latency", 0.05)
+        self.jitter = config.get("jitter", 0.0)
+        self.failure_rate = config.get("failure_rate", 0.0)
+        self.results = config.get("results")
+        self.calls = 0
+
+    async def search(self, query: str, max_results: int = 3, search_depth: str = "basic") -> List[SearchResult]:
+        self.calls += 1
+        await asyncio.sleep(self.latency + random.uniform(0, self.jitter))
+        if self.failure_rate and random.random() < self.failure_rate:
+            raise ConnectionError("mock: имитация сбоя поставщика")
+        if self.results is not None:
+            items = self.results
+        else:
+            items = [
+                {
+                    "title": f"{query} — источник {i + 1}",
+                    "url": f"https://example.com/{i + 1}?q={'+'.join(query.split())}",
+                    "content": f"Фрагмент {i + 1} о запросе «{query}».",
+                    "score": 1.0 - i / max(1, max_results),
+                }
+                for i in range(max_results)
+            ]
+        return [SearchResult(**item) for item in items[:max_results]]
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"calls": self.calls}
+
+
+PROVIDER_TYPES = {
+    "tavily": TavilyProvider,
+    "local": LocalCorpusProvider,
+    "mock": MockProvider,
+}
+
+
+def create_provider(name: str, search_cfg: dict, provider_cfg: Optional[dict] = None) -> SearchProvider:
+    """
+    Создаёт поставщика по имени. Настройки берутся из search.providers.<name>;
+    поле type позволяет завести несколько поставщиков одного вида.
+    """
+    provider_cfg = provider_cfg if provider_cfg is not None else \
+        search_cfg.get("providers", {}).get(name, {}) or {}
+    provider_type = provider_cfg.get("type", name)
+    if provider_type not in PROVIDER_TYPES:
+        raise ValueError(f"Неизвестный поставщик поиска: {provider_type}")
+    provider = PROVIDER_TYPES[provider_type](search_cfg, provider_cfg)
+    provider.name = name
+    return provider
@@ -0,0 +1,90 @@
+# services/search/ranking.py
+"""
+Слияние результатов нескольких поставщиков поиска.
+
+Оценки каждого поставщика нормируются к его лучшему результату и
+умножаются на вес поставщика. Дубликаты убираются в два шага: по
+нормализованному URL (без схемы, www, якоря, utm-меток и завершающего
+слэша) и по сходству содержимого (коэффициент Жаккара по шинглам из
+трёх слов). Из группы дубликатов остаётся результат с лучшей оценкой.
+"""
+import re
+from dataclasses import replace
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+from .client import SearchResult
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+_TRACKING_PARAMS = ("utm_", "fbclid", "gclid", "yclid")
+SHINGLE_SIZE = 3
+
+
+def normalize_url(url: str) -> str:
+    """URL для сравнения: без схемы, www, якоря, меток отслеживания и завершающего слэша."""
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    query = urlencode(sorted(
+        (key, value) for key, value in parse_qsl(parts.query)
+        if not key.lower().startswith(_TRACKING_PARAMS)
+    ))
+    path = parts.path.rstrip("/")
+    return f"{host}{path}?{query}" if query else f"{host}{path}"
+
+
+def shingles(text: str) -> Set[Tuple[str, ...]]:
+    words = _WORD_RE.findall(text.lower().replace("ё", "е"))
+    if len(words) < SHINGLE_SIZE:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def jaccard(a: Set, b: Set) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def merge_results(
+    results_by_provider: Sequence[Tuple[str, List[SearchResult]]],
+    weights: Optional[Dict[str, float]] = None,
+    similarity_threshold: float = 0.8,
+    max_results: Optional[int] = None,
+) -> List[SearchResult]:
+    """
+    Объединяет списки результатов (в порядке поставщиков) в один,
+    упорядоченный по нормированной оценке, без дубликатов.
+    """
+    weights = weights or {}
+    scored: List[Tuple[float, int, SearchResult]] = []
+    order = 0
+    for provider, results in results_by_provider:
+        if not results:
+            continue
+        top = max((r.score for r in results), default=0.0) or 1.0
+        weight = weights.get(provider, 1.0)
+        for result in results:
+            scored.append((weight * result.score / top, order, result))
+            order += 1
+    # При равных оценках выигрывает поставщик, указанный раньше
+    scored.sort(key=lambda item: (-item[0], item[1]))
+
+    merged: List[SearchResult] = []
+    seen_urls: Set[str] = set()
+    kept_shingles: List[Set[Tuple[str, ...]]] = []
+    for score, _, result in scored:
+        url_key = normalize_url(result.url) if result.url else None
+        if url_key is not None and url_key in seen_urls:
+            continue
+        result_shingles = shingles(result.content)
+        if any(jaccard(result_shingles, other) >= similarity_threshold for other in kept_shingles):
+            continue
+        if url_key is not None:
+            seen_urls.add(url_key)
+        kept_shingles.append(result_shingles)
+        merged.append(replace(result, score=score))
+        if max_results is not None and len(merged) >= max_results:
+            break
+    return merged
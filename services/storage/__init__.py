@@ -0,0 +1,79 @@
+# services/storage/__init__.py
+"""
+Выбор движка хранения диалогов и состояния контекста.
+
+dialogs.storage_engine:
+    files  — папки chat_* с meta/history/context файлами (по умолчанию)
+    sqlite — одна база SQLite (dialogs.sqlite_path)
+"""
+import threading
+from typing import Dict, Tuple
+
+from .base import DialogStorageBackend, ContextStateStore
+from .sqlite_backend import SQLiteStorage
+from .async_io import AsyncStorageBackend, StorageIO, storage_io
+from .search_index import DialogSearchIndex, get_search_index
+
+STORAGE_ENGINES = ("files", "sqlite")
+
+_backends: Dict[Tuple[str, str], DialogStorageBackend] = {}
+_backends_lock = threading.Lock()
+
+
+def create_storage_backend(dialogs_config: dict, engine: str = None) -> DialogStorageBackend:
+    """Создаёт хранилище без кэширования (для миграции и бенчмарков)."""
+    engine = engine or dialogs_config.get("storage_engine", "files")
+    if engine == "sqlite":
+        return SQLiteStorage(dialogs_config)
+    if engine != "files":
+        raise ValueError(f"Неизвестный движок хранения: {engine}")
+    from services.dialogs.storage import DialogStorage
+    return DialogStorage(dialogs_config)
+
+
+def get_storage_backend(dialogs_config: dict) -> DialogStorageBackend:
+    """
+    Возвращает общее хранилище для секции dialogs.
+
+    DialogManager и ContextStatePersistence должны работать с одним и тем же
+    экземпляром: у файлового хранилища в памяти лежит индекс метаданных,
+    у SQLite — единственное соединение. При включённом dialogs.async_io
+    хранилище оборачивается фасадом с фоновой записью.
+    """
+    engine = dialogs_config.get("storage_engine", "files")
+    key = (engine, dialogs_config.get("save_dir", "saved_dialogs"))
+    with _backends_lock:
+        backend = _backends.get(key)
+        if backend is None:
+            backend = create_storage_backend(dialogs_config, engine)
+            io_config = dialogs_config.get("async_io", {})
+            if io_config.get("enabled", True):
+                storage_io.configure(io_config)
+                backend = AsyncStorageBackend(backend, storage_io)
+            _backends[key] = backend
+        return backend
+
+
+def flush_all():
+    """Сбрасывает отложенные записи всех открытых хранилищ (при завершении)."""
+    with _backends_lock:
+        backends = list(_backends.values())
+    for backend in backends:
+        backend.flush()
+    storage_io.shutdown()
+
+
+__all__ = [
+    'DialogStorageBackend',
+    'ContextStateStore',
+    'SQLiteStorage',
+    'AsyncStorageBackend',
+    'StorageIO',
+    'storage_io',
+    'DialogSearchIndex',
+    'get_search_index',
+    'STORAGE_ENGINES',
+    'create_storage_backend',
+    'get_storage_backend',
+    'flush_all',
+]
@@ -0,0 +1,265 @@
+# services/storage/async_io.py
+"""
+Фоновый ввод-вывод хранилища.
+
+StorageIO выполняет дисковые операции в отдельном пуле потоков. Операции с
+одним ключом (ID диалога) выполняются строго в порядке постановки, разные
+диалоги пишутся параллельно. Для каждой операции замеряется время ожидания
+в очереди и выполнения; медленные операции попадают в лог и статистику.
+
+AsyncStorageBackend — фасад над DialogStorageBackend: записи ставятся в
+очередь и возвращают управление сразу, чтения дожидаются записей того же
+диалога. Кому нужен результат записи, ждёт его явно через wait()/wait_async().
+Запись, которую хранилище не выполнило (вернуло False), завершает свой Future
+исключением StorageWriteError и учитывается в ошибках статистики StorageIO.
+Из event loop чтения вызываются через *_async-варианты, чтобы не блокировать
+цикл, пока в очереди диалога стоят записи.
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Optional
+
+from models.dialog import Dialog
+from models.message import Message
+from services.storage.base import DialogStorageBackend, ContextStateStore
+from services.tracing import tracer
+from container import container
+
+
+class StorageWriteError(RuntimeError):
+    """Хранилище не выполнило фоновую запись."""
+
+
+class StorageIO:
+    """Пул потоков для дисковых операций с упорядочиванием по ключу."""
+
+    def __init__(self, workers: int = 2, slow_op_ms: float = 250.0):
+        self.workers = workers
+        self.slow_op_ms = slow_op_ms
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._queues: Dict[str, Deque[tuple]] = {}
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._stats: Dict[str, Dict[str, float]] = {}
+        self._logger = None
+
+    @property
+    def logger(self):
+        if self._logger is None:
+            self._logger = container.get_logger()
+        return self._logger
+
+    def configure(self, config: dict):
+        """Применяет настройки из секции dialogs.async_io (до первой операции)."""
+        self.workers = config.get("workers", self.workers)
+        self.slow_op_ms = config.get("slow_op_ms", self.slow_op_ms)
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="storage-io")
+        return self._executor
+
+    def submit(self, key: str, op_name: str, fn: Callable, *args, **kwargs) -> Future:
+        """Ставит операцию в очередь ключа и возвращает Future с её результатом."""
+        future: Future = Future()
+        # Трасса сообщения, поставившего операцию: запись попадёт в неё из потока пула
+        item = (future, op_name, fn, args, kwargs, time.perf_counter(), tracer.current())
+        with self._lock:
+            queue = self._queues.get(key)
+            start_drain = queue is None
+            if start_drain:
+                queue = self._queues[key] = deque()
+            queue.append(item)
+            executor = self._get_executor()
+        if start_drain:
+            executor.submit(self._drain, key)
+        return future
+
+    async def run(self, key: str, op_name: str, fn: Callable, *args, **kwargs) -> Any:
+        """То же, что submit, но с ожиданием результата в event loop."""
+        return await asyncio.wrap_future(self.submit(key, op_name, fn, *args, **kwargs))
+
+    def _drain(self, key: str):
+        """Последовательно выполняет очередь одного ключа."""
+        while True:
+            with self._lock:
+                queue = self._queues[key]
+                if not queue:
+                    del self._queues[key]
+                    self._idle.notify_all()
+                    return
+                future, op_name, fn, args, kwargs, queued_at, trace = queue.popleft()
+
+            if not future.set_running_or_notify_cancel():
+                continue
+            started = time.perf_counter()
+            error = None
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                error = e
+                future.set_exception(e)
+            finished = time.perf_counter()
+            self._record(key, op_name, (started - queued_at) * 1000, (finished - started) * 1000, error)
+            if trace is not None:
+                tracer.record(
+                    f"storage.{op_name}", int(started * 1e9), int(finished * 1e9), track="storage-io",
+                    trace=trace, wait_ms=round((started - queued_at) * 1000, 2),
+                )
+
+    def _record(self, key: str, op_name: str, wait_ms: float, duration_ms: float, error: Optional[BaseException]):
+        with self._lock:
+            stats = self._stats.get(op_name)
+            if stats is None:
+                stats = self._stats[op_name] = {
+                    "count": 0, "errors": 0, "slow": 0,
+                    "total_ms": 0.0, "max_ms": 0.0, "max_wait_ms": 0.0,
+                }
+            stats["count"] += 1
+            stats["total_ms"] += duration_ms
+            stats["max_ms"] = max(stats["max_ms"], duration_ms)
+            stats["max_wait_ms"] = max(stats["max_wait_ms"], wait_ms)
+            if error is not None:
+                stats["errors"] += 1
+            slow = duration_ms >= self.slow_op_ms
+            if slow:
+                stats["slow"] += 1
+
+        if error is not None:
+            self.logger.error("❌ [StorageIO] %s (%s) завершилась ошибкой: %s", op_name, key, error)
+        elif slow:
+            self.logger.warning(
+                "🐢 [StorageIO] Медленная операция %s (%s): %.1f мс, ожидание в очереди %.1f мс",
+                op_name, key, duration_ms, wait_ms
+            )
+
+    def wait(self, key: Optional[str] = None, timeout: Optional[float] = None) -> bool:
+        """Ждёт завершения операций ключа (или всех операций, если key=None)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._idle:
+            while (key in self._queues) if key is not None else self._queues:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+        return True
+
+    async def wait_async(self, key: Optional[str] = None):
+        await asyncio.to_thread(self.wait, key)
+
+    def shutdown(self, timeout: Optional[float] = 10.0):
+        self.wait(timeout=timeout)
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            operations = {}
+            for op_name, stats in self._stats.items():
+                operations[op_name] = dict(
+                    stats, avg_ms=stats["total_ms"] / stats["count"] if stats["count"] else 0.0
+                )
+            return {
+                "pending_keys": len(self._queues),
+                "pending_ops": sum(len(q) for q in self._queues.values()),
+                "slow_op_ms": self.slow_op_ms,
+                "operations": operations,
+            }
+
+
+class AsyncStorageBackend(DialogStorageBackend, ContextStateStore):
+    """Фасад хранилища: записи уходят в StorageIO, чтения ждут записей диалога."""
+
+    def __init__(self, backend: DialogStorageBackend, io: StorageIO):
+        self.backend = backend
+        self.io = io
+        self.engine_name = backend.engine_name
+
+    def __getattr__(self, name):
+        # Остальные атрибуты (save_dir, metadata_writer, ...) — у реального хранилища
+        if name == "backend":
+            raise AttributeError(name)
+        return getattr(self.backend, name)
+
+    # ========== Записи (в фоне) ==========
+
+    def _write(self, dialog: Dialog, op_name: str, fn: Callable, *args) -> Future:
+        """Ставит запись в очередь диалога; отказ хранилища завершает Future ошибкой."""
+        return self.io.submit(dialog.id, op_name, self._checked, op_name, fn, dialog, *args)
+
+    @staticmethod
+    def _checked(op_name: str, fn: Callable, *args) -> bool:
+        # Хранилища сообщают об ошибке через False: превращаем его в исключение,
+        # чтобы StorageIO залогировал отказ и учёл его в статистике
+        if fn(*args) is False:
+            raise StorageWriteError(f"{op_name} не выполнена хранилищем")
+        return True
+
+    def save_dialog(self, dialog: Dialog) -> bool:
+        self._write(dialog, "save_dialog", self.backend.save_dialog)
+        return True
+
+    def append_message(self, dialog: Dialog, message: Message) -> bool:
+        self._write(dialog, "append_message", self.backend.append_message, message)
+        return True
+
+    def rewrite_last_message(self, dialog: Dialog, message: Optional[Message] = None) -> bool:
+        if message is None:
+            if not dialog.history:
+                return False
+            # Снимок сейчас: к моменту записи в истории может появиться новое сообщение
+            message = dialog.history[-1]
+        self._write(dialog, "rewrite_last_message", self.backend.rewrite_last_message, message)
+        return True
+
+    def delete_dialog_folder(self, dialog: Dialog) -> bool:
+        self._write(dialog, "delete_dialog", self.backend.delete_dialog_folder)
+        return True
+
+    def save_context_state(self, dialog: Dialog, state_dict: Dict[str, Any]) -> bool:
+        self._write(dialog, "save_context_state", self.backend.save_context_state, state_dict)
+        return True
+
+    # ========== Чтения (после записей того же диалога) ==========
+
+    def load_dialogs(self) -> Dict[str, Dialog]:
+        self.io.wait()
+        return self.backend.load_dialogs()
+
+    def load_history(self, dialog: Dialog) -> bool:
+        return self.io.submit(dialog.id, "load_history", self.backend.load_history, dialog).result()
+
+    async def load_history_async(self, dialog: Dialog) -> bool:
+        return await self.io.run(dialog.id, "load_history", self.backend.load_history, dialog)
+
+    def load_context_state(self, dialog: Dialog) -> Optional[Dict[str, Any]]:
+        return self.io.submit(dialog.id, "load_context_state", self.backend.load_context_state, dialog).result()
+
+    async def load_context_state_async(self, dialog: Dialog) -> Optional[Dict[str, Any]]:
+        return await self.io.run(dialog.id, "load_context_state", self.backend.load_context_state, dialog)
+
+    # ========== Синхронизация ==========
+
+    def wait(self, dialog_id: Optional[str] = None, timeout: Optional[float] = None) -> bool:
+        """Ждёт записи диалога (или все записи) — для мест, где нужен результат на диске."""
+        return self.io.wait(dialog_id, timeout)
+
+    async def wait_async(self, dialog_id: Optional[str] = None):
+        await self.io.wait_async(dialog_id)
+
+    def flush(self):
+        self.io.wait()
+        self.backend.flush()
+
+    def close(self):
+        self.io.wait()
+        self.backend.close()
+
+
+# Глобальный экземпляр
+storage_io = StorageIO()
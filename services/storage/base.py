@@ -0,0 +1,66 @@
+# services/storage/base.py
+"""
+Интерфейсы хранилищ диалогов и состояния контекста.
+
+DialogManager и ContextStatePersistence работают только через эти методы,
+поэтому движок хранения (папки с файлами или SQLite) выбирается конфигом
+dialogs.storage_engine без изменений в остальном коде.
+"""
+import asyncio
+from typing import Any, Dict, Optional
+
+from models.dialog import Dialog
+from models.message import Message
+
+
+class DialogStorageBackend:
+    """Хранилище метаданных и истории диалогов."""
+
+    engine_name = "base"
+
+    def load_dialogs(self) -> Dict[str, Dialog]:
+        """Загружает метаданные всех диалогов (история не загружается)."""
+        raise NotImplementedError
+
+    def load_history(self, dialog: Dialog) -> bool:
+        """Загружает историю диалога (ленивая гидратация)."""
+        raise NotImplementedError
+
+    async def load_history_async(self, dialog: Dialog) -> bool:
+        """load_history для event loop: чтение с диска выполняется в потоке."""
+        return await asyncio.to_thread(self.load_history, dialog)
+
+    def save_dialog(self, dialog: Dialog) -> bool:
+        """Сохраняет метаданные диалога."""
+        raise NotImplementedError
+
+    def append_message(self, dialog: Dialog, message: Message) -> bool:
+        """Дописывает сообщение в историю и обновляет метаданные."""
+        raise NotImplementedError
+
+    def rewrite_last_message(self, dialog: Dialog, message: Optional[Message] = None) -> bool:
+        """Перезаписывает последнее сохранённое сообщение (по умолчанию dialog.history[-1])."""
+        raise NotImplementedError
+
+    def delete_dialog_folder(self, dialog: Dialog) -> bool:
+        """Удаляет все данные диалога."""
+        raise NotImplementedError
+
+    def flush(self):
+        """Сбрасывает на диск отложенные записи (точка синхронизации)."""
+
+    def close(self):
+        """Освобождает ресурсы хранилища."""
+
+
+class ContextStateStore:
+    """Хранилище сериализованного состояния контекста диалога."""
+
+    def save_context_state(self, dialog: Dialog, state_dict: Dict[str, Any]) -> bool:
+        raise NotImplementedError
+
+    def load_context_state(self, dialog: Dialog) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    async def load_context_state_async(self, dialog: Dialog) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self.load_context_state, dialog)
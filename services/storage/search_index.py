@@ -0,0 +1,349 @@
+# services/storage/search_index.py
+"""
+Полнотекстовый поиск по сохранённым диалогам.
+
+Индекс — отдельная база SQLite с таблицами FTS5 по содержимому сообщений и
+названиям диалогов (токенизатор unicode61 без учёта регистра и латинской
+диакритики; «ё» на «е» заменяется до индексации и в запросе). Хранилища обновляют индекс инкрементально:
+дозапись и перезапись последнего сообщения, переименование, удаление.
+Сообщение в индексе определяется парой (роль, метка времени) внутри
+диалога, поэтому повторная индексация того же сообщения ничего не
+дублирует — на этом держится фоновая дозагрузка истории, записанной до
+появления индекса.
+
+Запрос разбивается на слова; каждое слово ищется по префиксу, а у русских
+слов предварительно отбрасывается окончание — грубая замена стемминга.
+Результаты ранжируются по bm25 и сворачиваются до лучшего фрагмента на диалог.
+"""
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+from models.dialog import Dialog
+from models.message import Message
+from services.model.thinking_handler import ThinkingHandler
+from container import container
+
+
+SCHEMA_VERSION = 1
+
+# Маркеры подсветки во фрагментах: управляющие символы не встречаются в тексте,
+# клиент экранирует фрагмент и только потом заменяет их на <mark>
+MARK_START = "\x02"
+MARK_END = "\x03"
+
+_TOKENIZER = "unicode61 remove_diacritics 2"
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS docs ("
+    " rowid INTEGER PRIMARY KEY,"
+    " dialog_id TEXT NOT NULL,"
+    " role TEXT NOT NULL,"
+    " timestamp TEXT NOT NULL,"
+    " UNIQUE (dialog_id, timestamp, role))",
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(content, tokenize='{_TOKENIZER}', prefix='2 3')",
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS names_fts USING fts5(name, dialog_id UNINDEXED, tokenize='{_TOKENIZER}')",
+    "CREATE TABLE IF NOT EXISTS indexed_dialogs (dialog_id TEXT PRIMARY KEY, indexed_at TEXT NOT NULL)",
+)
+
+_SELECT_DOC = "SELECT rowid FROM docs WHERE dialog_id = ? AND timestamp = ? AND role = ?"
+_INSERT_DOC = "INSERT INTO docs (dialog_id, role, timestamp) VALUES (?, ?, ?)"
+# Сначала лучшие rowid по bm25, и только для них — фрагменты (snippet дорогой)
+_SEARCH_MESSAGES = (
+    "WITH top AS (SELECT rowid, rank FROM messages_fts WHERE messages_fts MATCH ? ORDER BY rank LIMIT ?)"
+    " SELECT d.dialog_id, d.role, d.timestamp,"
+    " snippet(messages_fts, 0, ?, ?, '…', ?), top.rank"
+    " FROM top JOIN messages_fts ON messages_fts.rowid = top.rowid JOIN docs d ON d.rowid = top.rowid"
+    " WHERE messages_fts MATCH ? ORDER BY top.rank"
+)
+_SEARCH_NAMES = (
+    "SELECT dialog_id, highlight(names_fts, 0, ?, ?), bm25(names_fts)"
+    " FROM names_fts WHERE names_fts MATCH ? ORDER BY bm25(names_fts) LIMIT ?"
+)
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+_CYRILLIC_RE = re.compile(r"[а-яё]", re.IGNORECASE)
+# Частые окончания русских слов (от длинных к коротким)
+_RU_ENDINGS = (
+    "иями", "ями", "ами", "ого", "его", "ому", "ему", "ыми", "ими", "иях",
+    "ях", "ах", "ов", "ев", "ей", "ой", "ий", "ый", "ая", "яя", "ое", "ее",
+    "ые", "ие", "ом", "ем", "ам", "ям", "ую", "юю", "ия", "ию",
+    "а", "я", "ы", "и", "у", "ю", "е", "о", "ь", "й",
+)
+_MIN_STEM = 3
+
+
+def _fold(text: str) -> str:
+    # unicode61 не снимает диакритику с кириллицы
+    return text.replace("ё", "е").replace("Ё", "Е")
+
+
+def _search_text(role: str, content: str) -> str:
+    """Текст сообщения для индекса: без блоков размышлений."""
+    if role == "assistant":
+        content = ThinkingHandler.strip_thinking(content)
+    return _fold(content)
+
+
+def _stem(word: str) -> str:
+    if not _CYRILLIC_RE.search(word):
+        return word
+    for ending in _RU_ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= _MIN_STEM:
+            return word[:-len(ending)]
+    return word
+
+
+def build_match_query(query: str) -> Optional[str]:
+    """Запрос пользователя → выражение MATCH: все слова, каждое по префиксу."""
+    words = _WORD_RE.findall(_fold(query.lower()))
+    if not words:
+        return None
+    return " ".join(f'"{_stem(word)}"*' for word in words)
+
+
+class DialogSearchIndex:
+    """Инкрементальный полнотекстовый индекс сообщений и названий диалогов."""
+
+    def __init__(self, db_path: str, config: Optional[dict] = None):
+        config = config or {}
+        self.db_path = db_path
+        self.max_results = config.get("max_results", 20)
+        self.snippet_tokens = config.get("snippet_tokens", 12)
+        self.backfill_pause = config.get("backfill_pause", 0.01)
+        self._logger = None
+        self._lock = threading.RLock()
+        # dialog_id -> проиндексированное название (чтобы не переписывать без изменений)
+        self._names: Dict[str, str] = {}
+        self._backfill_thread: Optional[threading.Thread] = None
+
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._transaction():
+            for statement in _SCHEMA:
+                self._conn.execute(statement)
+            self._conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+        with self._lock:
+            self._names = dict(self._conn.execute("SELECT dialog_id, name FROM names_fts").fetchall())
+
+    @property
+    def logger(self):
+        if self._logger is None:
+            self._logger = container.get_logger()
+        return self._logger
+
+    @contextmanager
+    def _transaction(self):
+        """Явная транзакция: BEGIN ... COMMIT, откат при исключении."""
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    # ========== Обновление (вызывается хранилищами) ==========
+
+    def _upsert_message(self, conn, dialog_id: str, role: str, content: str, timestamp: str, replace: bool):
+        row = conn.execute(_SELECT_DOC, (dialog_id, timestamp, role)).fetchone()
+        text = _search_text(role, content)
+        if row is None:
+            rowid = conn.execute(_INSERT_DOC, (dialog_id, role, timestamp)).lastrowid
+        elif replace:
+            rowid = row[0]
+            conn.execute("DELETE FROM messages_fts WHERE rowid = ?", (rowid,))
+        else:
+            return
+        conn.execute("INSERT INTO messages_fts (rowid, content) VALUES (?, ?)", (rowid, text))
+
+    def add_message(self, dialog: Dialog, message: Message):
+        """Индексирует новое сообщение (повтор того же сообщения игнорируется)."""
+        try:
+            with self._transaction() as conn:
+                self._upsert_message(
+                    conn, dialog.id, message.role.value, message.content, message.timestamp.isoformat(), False
+                )
+        except Exception as e:
+            self.logger.error("❌ Ошибка индексации сообщения диалога %s: %s", dialog.id, e)
+
+    def replace_message(self, dialog: Dialog, message: Message):
+        """Обновляет текст сообщения (перезапись последнего сообщения)."""
+        try:
+            with self._transaction() as conn:
+                self._upsert_message(
+                    conn, dialog.id, message.role.value, message.content, message.timestamp.isoformat(), True
+                )
+        except Exception as e:
+            self.logger.error("❌ Ошибка переиндексации сообщения диалога %s: %s", dialog.id, e)
+
+    def update_name(self, dialog: Dialog):
+        """Индексирует название диалога, если оно изменилось."""
+        name = _fold(dialog.name)
+        if self._names.get(dialog.id) == name:
+            return
+        try:
+            with self._transaction() as conn:
+                conn.execute("DELETE FROM names_fts WHERE dialog_id = ?", (dialog.id,))
+                conn.execute("INSERT INTO names_fts (name, dialog_id) VALUES (?, ?)", (name, dialog.id))
+                self._names[dialog.id] = name
+        except Exception as e:
+            self.logger.error("❌ Ошибка индексации названия диалога %s: %s", dialog.id, e)
+
+    def remove_dialog(self, dialog_id: str):
+        """Удаляет из индекса все сообщения и название диалога."""
+        try:
+            with self._transaction() as conn:
+                conn.execute(
+                    "DELETE FROM messages_fts WHERE rowid IN (SELECT rowid FROM docs WHERE dialog_id = ?)",
+                    (dialog_id,)
+                )
+                conn.execute("DELETE FROM docs WHERE dialog_id = ?", (dialog_id,))
+                conn.execute("DELETE FROM names_fts WHERE dialog_id = ?", (dialog_id,))
+                conn.execute("DELETE FROM indexed_dialogs WHERE dialog_id = ?", (dialog_id,))
+                self._names.pop(dialog_id, None)
+        except Exception as e:
+            self.logger.error("❌ Ошибка удаления диалога %s из поискового индекса: %s", dialog_id, e)
+
+    # ========== Фоновая дозагрузка ==========
+
+    def index_history(self, dialog: Dialog):
+        """Индексирует всю загруженную историю диалога и помечает его проиндексированным."""
+        with self._transaction() as conn:
+            for i in range(len(dialog.history)):
+                self._upsert_message(
+                    conn, dialog.id, dialog.history.role(i).value, dialog.history.content(i),
+                    dialog.history.timestamp(i).isoformat(), False
+                )
+            conn.execute(
+                "INSERT OR REPLACE INTO indexed_dialogs (dialog_id, indexed_at) VALUES (?, ?)",
+                (dialog.id, datetime.now().isoformat())
+            )
+        self.update_name(dialog)
+
+    def start_backfill(self, dialogs: Iterable[Dialog], storage):
+        """
+        Индексирует в фоне диалоги, записанные до появления индекса.
+
+        История читается в отдельный экземпляр Dialog, чтобы не трогать
+        резидентные истории DialogManager.
+        """
+        with self._lock:
+            indexed = {row[0] for row in self._conn.execute("SELECT dialog_id FROM indexed_dialogs")}
+        pending = [d for d in dialogs if d.id not in indexed]
+        if not pending or (self._backfill_thread and self._backfill_thread.is_alive()):
+            return
+
+        def run():
+            started = time.perf_counter()
+            done = 0
+            for dialog in pending:
+                try:
+                    copy = Dialog(id=dialog.id, name=dialog.name, created=dialog.created, updated=dialog.updated)
+                    storage.load_history(copy)
+                    self.index_history(copy)
+                    done += 1
+                except Exception as e:
+                    self.logger.error("❌ Ошибка фоновой индексации диалога %s: %s", dialog.id, e)
+                if self.backfill_pause:
+                    time.sleep(self.backfill_pause)
+            self.logger.info(
+                "🔎 Поисковый индекс дополнен: %d диалогов за %.1f с", done, time.perf_counter() - started
+            )
+
+        self._backfill_thread = threading.Thread(target=run, name="search-backfill", daemon=True)
+        self._backfill_thread.start()
+
+    # ========== Поиск ==========
+
+    def search(self, query: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Ищет диалоги по названию и содержимому сообщений.
+
+        Возвращает не больше limit диалогов, для каждого — лучший фрагмент
+        с маркерами MARK_START/MARK_END, роль и время сообщения, число совпавших
+        сообщений среди просмотренных и score (больше — релевантнее).
+        """
+        match = build_match_query(query)
+        if match is None:
+            return []
+        limit = limit or self.max_results
+        started = time.perf_counter()
+
+        results: Dict[str, Dict[str, Any]] = {}
+        try:
+            with self._lock:
+                name_rows = self._conn.execute(_SEARCH_NAMES, (MARK_START, MARK_END, match, limit)).fetchall()
+                # Несколько совпадений на диалог — берём с запасом и сворачиваем
+                message_rows = self._conn.execute(
+                    _SEARCH_MESSAGES, (match, limit * 5, MARK_START, MARK_END, self.snippet_tokens, match)
+                ).fetchall()
+        except sqlite3.OperationalError as e:
+            self.logger.warning("⚠️ Некорректный поисковый запрос %r: %s", query, e)
+            return []
+
+        for dialog_id, role, timestamp, snippet, rank in message_rows:
+            entry = results.get(dialog_id)
+            if entry is None:
+                results[dialog_id] = {
+                    "dialog_id": dialog_id,
+                    "snippet": snippet,
+                    "role": role,
+                    "timestamp": timestamp,
+                    "name_match": None,
+                    "matches": 1,
+                    "score": -rank,
+                }
+            else:
+                entry["matches"] += 1
+
+        for dialog_id, highlighted, rank in name_rows:
+            entry = results.setdefault(dialog_id, {
+                "dialog_id": dialog_id,
+                "snippet": None,
+                "role": None,
+                "timestamp": None,
+                "matches": 0,
+                "score": 0.0,
+            })
+            entry["name_match"] = highlighted
+            # Совпадение в названии важнее совпадения в тексте
+            entry["score"] += 2 * -rank
+
+        ranked = sorted(results.values(), key=lambda r: r["score"], reverse=True)[:limit]
+        self.logger.debug(
+            "🔎 Поиск %r: %d диалогов за %.1f мс", query, len(ranked), (time.perf_counter() - started) * 1000
+        )
+        return ranked
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_indexes: Dict[str, DialogSearchIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_search_index(dialogs_config: dict) -> Optional[DialogSearchIndex]:
+    """Общий поисковый индекс для save_dir (None, если поиск отключён)."""
+    config = dialogs_config.get("search_index", {})
+    if not config.get("enabled", True):
+        return None
+    save_dir = dialogs_config.get("save_dir", "saved_dialogs")
+    path = config.get("path") or os.path.join(save_dir, "search_index.sqlite")
+    with _indexes_lock:
+        index = _indexes.get(path)
+        if index is None:
+            index = _indexes[path] = DialogSearchIndex(path, config)
+        return index
@@ -0,0 +1,278 @@
+# services/storage/sqlite_backend.py
+"""
+Хранилище диалогов, сообщений и состояния контекста в одной базе SQLite.
+
+База работает в режиме WAL: чтение не блокируется записью, а сохранение
+сообщения — одна короткая транзакция (INSERT в messages + UPDATE в dialogs)
+вместо дозаписи истории и полной перезаписи meta-файла. SQL-тексты
+постоянны, поэтому sqlite3 переиспользует подготовленные выражения из
+своего кэша (cached_statements).
+
+Файлы индекса памяти (memory_*.f32/jsonl) по-прежнему лежат в папках
+chat_* внутри save_dir и удаляются вместе с диалогом.
+"""
+import json
+import os
+import shutil
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from models.compact_history import CompactHistory
+from models.dialog import Dialog
+from models.message import Message
+from services.storage.base import DialogStorageBackend, ContextStateStore
+from services.storage.search_index import get_search_index
+from container import container
+
+
+SCHEMA_VERSION = 1
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS dialogs ("
+    " id TEXT PRIMARY KEY,"
+    " name TEXT NOT NULL,"
+    " created TEXT NOT NULL,"
+    " updated TEXT NOT NULL,"
+    " status TEXT NOT NULL DEFAULT 'active',"
+    " pinned INTEGER NOT NULL DEFAULT 0,"
+    " pinned_position INTEGER,"
+    " visible INTEGER NOT NULL DEFAULT 0,"
+    " message_count INTEGER NOT NULL DEFAULT 0)",
+    "CREATE INDEX IF NOT EXISTS idx_dialogs_updated ON dialogs(updated)",
+    "CREATE INDEX IF NOT EXISTS idx_dialogs_pinned ON dialogs(pinned, pinned_position)",
+    "CREATE TABLE IF NOT EXISTS messages ("
+    " dialog_id TEXT NOT NULL,"
+    " seq INTEGER NOT NULL,"
+    " role TEXT NOT NULL,"
+    " content TEXT NOT NULL,"
+    " timestamp TEXT NOT NULL,"
+    " PRIMARY KEY (dialog_id, seq)) WITHOUT ROWID",
+    "CREATE TABLE IF NOT EXISTS context_states ("
+    " dialog_id TEXT PRIMARY KEY,"
+    " state TEXT NOT NULL,"
+    " updated_at TEXT NOT NULL)",
+)
+
+_UPSERT_DIALOG = (
+    "INSERT INTO dialogs (id, name, created, updated, status, pinned, pinned_position, visible, message_count)"
+    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+    " ON CONFLICT(id) DO UPDATE SET name = excluded.name, updated = excluded.updated,"
+    " status = excluded.status, pinned = excluded.pinned, pinned_position = excluded.pinned_position,"
+    " visible = excluded.visible"
+)
+_INSERT_MESSAGE = (
+    "INSERT INTO messages (dialog_id, seq, role, content, timestamp)"
+    " VALUES (?, (SELECT COALESCE(MAX(seq), -1) + 1 FROM messages WHERE dialog_id = ?), ?, ?, ?)"
+)
+_TOUCH_DIALOG = (
+    "UPDATE dialogs SET updated = ?, visible = ?, message_count = message_count + 1 WHERE id = ?"
+)
+_UPDATE_LAST_MESSAGE = (
+    "UPDATE messages SET role = ?, content = ?, timestamp = ?"
+    " WHERE dialog_id = ? AND seq = (SELECT MAX(seq) FROM messages WHERE dialog_id = ?)"
+)
+_SELECT_DIALOGS = (
+    "SELECT id, name, created, updated, status, pinned, pinned_position, visible, message_count FROM dialogs"
+)
+_SELECT_HISTORY = "SELECT role, content, timestamp FROM messages WHERE dialog_id = ? ORDER BY seq"
+_UPSERT_CONTEXT = (
+    "INSERT INTO context_states (dialog_id, state, updated_at) VALUES (?, ?, ?)"
+    " ON CONFLICT(dialog_id) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at"
+)
+_SELECT_CONTEXT = "SELECT state FROM context_states WHERE dialog_id = ?"
+
+
+class SQLiteStorage(DialogStorageBackend, ContextStateStore):
+    """Хранилище диалогов на SQLite (одно соединение, доступ под блокировкой)."""
+
+    engine_name = "sqlite"
+
+    def __init__(self, config: dict):
+        self.save_dir = config.get("save_dir", "saved_dialogs")
+        self.db_path = config.get("sqlite_path") or os.path.join(self.save_dir, "dialogs.sqlite")
+        self._logger = None
+        self._lock = threading.RLock()
+        self.search_index = get_search_index(config)
+
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(
+            self.db_path, check_same_thread=False, isolation_level=None, cached_statements=64
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._transaction():
+            for statement in _SCHEMA:
+                self._conn.execute(statement)
+            self._conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+
+    @property
+    def logger(self):
+        if self._logger is None:
+            self._logger = container.get_logger()
+        return self._logger
+
+    @contextmanager
+    def _transaction(self):
+        """Явная транзакция: BEGIN ... COMMIT, откат при исключении."""
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    @staticmethod
+    def _dialog_params(dialog: Dialog) -> tuple:
+        return (
+            dialog.id,
+            dialog.name,
+            dialog.created.isoformat(),
+            dialog.updated.isoformat(),
+            dialog.status,
+            int(dialog.pinned),
+            dialog.pinned_position,
+            int(dialog.visible),
+            dialog.message_count,
+        )
+
+    def _get_chat_folder_path(self, dialog: Dialog) -> str:
+        datetime_str = dialog.created.strftime("%Y%m%dT%H%M%S")
+        microseconds = dialog.created.strftime("%f")[:3]
+        return os.path.join(self.save_dir, f"chat_{datetime_str}-{microseconds}")
+
+    # ========== Диалоги ==========
+
+    def save_dialog(self, dialog: Dialog) -> bool:
+        try:
+            with self._transaction() as conn:
+                conn.execute(_UPSERT_DIALOG, self._dialog_params(dialog))
+            if self.search_index is not None:
+                self.search_index.update_name(dialog)
+            return True
+        except Exception as e:
+            self.logger.error("Ошибка сохранения метаданных диалога %s: %s", dialog.id, e)
+            return False
+
+    def append_message(self, dialog: Dialog, message: Message) -> bool:
+        try:
+            with self._transaction() as conn:
+                if conn.execute(_TOUCH_DIALOG, (dialog.updated.isoformat(), int(dialog.visible), dialog.id)).rowcount == 0:
+                    # Диалога ещё нет в базе — вставляем с уже учтённым сообщением
+                    conn.execute(_UPSERT_DIALOG, self._dialog_params(dialog))
+                conn.execute(
+                    _INSERT_MESSAGE,
+                    (dialog.id, dialog.id, message.role.value, message.content, message.timestamp.isoformat())
+                )
+            if self.search_index is not None:
+                self.search_index.add_message(dialog, message)
+            return True
+        except Exception as e:
+            self.logger.error("Ошибка добавления сообщения в диалог %s: %s", dialog.id, e)
+            return False
+
+    def rewrite_last_message(self, dialog: Dialog, message: Optional[Message] = None) -> bool:
+        if message is None:
+            if not dialog.history:
+                return False
+            message = dialog.history[-1]
+        try:
+            with self._transaction() as conn:
+                cursor = conn.execute(
+                    _UPDATE_LAST_MESSAGE,
+                    (message.role.value, message.content, message.timestamp.isoformat(), dialog.id, dialog.id)
+                )
+            if cursor.rowcount > 0 and self.search_index is not None:
+                self.search_index.replace_message(dialog, message)
+            return cursor.rowcount > 0
+        except Exception as e:
+            self.logger.error("Ошибка перезаписи последнего сообщения диалога %s: %s", dialog.id, e)
+            return False
+
+    def load_dialogs(self) -> Dict[str, Dialog]:
+        dialogs: Dict[str, Dialog] = {}
+        with self._lock:
+            rows = self._conn.execute(_SELECT_DIALOGS).fetchall()
+        for row in rows:
+            dialog_id, name, created, updated, status, pinned, pinned_position, visible, message_count = row
+            try:
+                dialog = Dialog(
+                    id=dialog_id,
+                    name=name,
+                    created=datetime.fromisoformat(created),
+                    updated=datetime.fromisoformat(updated),
+                    status=status,
+                    pinned=bool(pinned),
+                    pinned_position=pinned_position,
+                    visible=bool(visible)
+                )
+                dialog.mark_history_unloaded(message_count)
+                dialogs[dialog_id] = dialog
+            except Exception as e:
+                self.logger.error("Ошибка чтения диалога %s из базы: %s", dialog_id, e)
+        return dialogs
+
+    def load_history(self, dialog: Dialog) -> bool:
+        messages = CompactHistory()
+        try:
+            with self._lock:
+                rows = self._conn.execute(_SELECT_HISTORY, (dialog.id,)).fetchall()
+            for role, content, timestamp in rows:
+                messages.append_raw(role, content, datetime.fromisoformat(timestamp))
+            dialog.set_loaded_history(messages)
+            return True
+        except Exception as e:
+            self.logger.error("Ошибка загрузки истории диалога %s: %s", dialog.id, e)
+            dialog.set_loaded_history(messages)
+            return False
+
+    def delete_dialog_folder(self, dialog: Dialog) -> bool:
+        try:
+            with self._transaction() as conn:
+                conn.execute("DELETE FROM messages WHERE dialog_id = ?", (dialog.id,))
+                conn.execute("DELETE FROM context_states WHERE dialog_id = ?", (dialog.id,))
+                deleted = conn.execute("DELETE FROM dialogs WHERE id = ?", (dialog.id,)).rowcount
+            if self.search_index is not None:
+                self.search_index.remove_dialog(dialog.id)
+            # Индекс памяти хранится файлами в папке чата и удаляется вместе с ней
+            folder_path = self._get_chat_folder_path(dialog)
+            if os.path.exists(folder_path):
+                shutil.rmtree(folder_path)
+            return deleted > 0
+        except Exception as e:
+            self.logger.error("Ошибка удаления диалога %s: %s", dialog.id, e)
+            return False
+
+    # ========== Состояние контекста ==========
+
+    def save_context_state(self, dialog: Dialog, state_dict: Dict[str, Any]) -> bool:
+        try:
+            payload = json.dumps(state_dict, ensure_ascii=False)
+            with self._transaction() as conn:
+                conn.execute(_UPSERT_CONTEXT, (dialog.id, payload, datetime.now().isoformat()))
+            return True
+        except Exception as e:
+            self.logger.error("Ошибка сохранения состояния контекста диалога %s: %s", dialog.id, e)
+            return False
+
+    def load_context_state(self, dialog: Dialog) -> Optional[Dict[str, Any]]:
+        try:
+            with self._lock:
+                row = self._conn.execute(_SELECT_CONTEXT, (dialog.id,)).fetchone()
+            return json.loads(row[0]) if row else None
+        except Exception as e:
+            self.logger.error("Ошибка загрузки состояния контекста диалога %s: %s", dialog.id, e)
+            return None
+
+    def close(self):
+        with self._lock:
+            try:
+                self._conn.close()
+            except sqlite3.Error:
+                pass
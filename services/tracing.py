@@ -0,0 +1,300 @@
+# services/tracing.py
+"""
+Трассировка обработки сообщения (timeline по этапам).
+
+Каждое сообщение пользователя получает трассу с идентификатором запроса.
+Этапы отмечаются спанами:
+
+    with tracer.span("search.decision"):
+        ...
+
+Текущая трасса хранится в contextvars, поэтому спаны без лишних
+параметров работают в корутинах, задачах asyncio (create_task копирует
+контекст) и в asyncio.to_thread. Если трассы нет (сообщение не попало в
+выборку sample_rate или трассировка выключена), span() возвращает общий
+пустой контекст-менеджер — стоимость одного обращения к ContextVar.
+
+Спаны пишутся на «дорожки» — по потоку или по явно заданному имени
+(например, prefill и фоновые записи идут параллельно основному этапу и
+не должны пересекаться с ним на одной дорожке). Завершённые трассы
+хранятся в кольцевом буфере и выгружаются в формате Chrome trace_event
+(маршрут /traces; файл открывается в Perfetto или chrome://tracing).
+"""
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional
+
+_current_trace: ContextVar[Optional["Trace"]] = ContextVar("current_trace", default=None)
+
+# Трассы, начатые одним обработчиком и продолжаемые другим (ключ — ID диалога)
+_MAX_PARKED = 16
+
+
+class Trace:
+    """События одной трассы."""
+
+    def __init__(self, name: str, request_id: str, max_events: int, args: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.request_id = request_id
+        self.args = dict(args or {})
+        self.max_events = max_events
+        self.started_ns = time.perf_counter_ns()
+        self.started_wall = time.time()
+        self.finished_ns: Optional[int] = None
+        self.events: List[tuple] = []
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+    def add(self, name: str, start_ns: int, end_ns: int, track: Optional[str] = None,
+            args: Optional[Dict[str, Any]] = None):
+        """Добавляет завершённый спан (время — perf_counter_ns)."""
+        if track is None:
+            track = threading.current_thread().name
+        with self._lock:
+            if len(self.events) >= self.max_events:
+                self.dropped += 1
+                return
+            self.events.append((name, start_ns, end_ns, track, args))
+
+    @property
+    def duration_ms(self) -> Optional[float]:
+        if self.finished_ns is None:
+            return None
+        return (self.finished_ns - self.started_ns) / 1e6
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            events = len(self.events)
+        return {
+            "request_id": self.request_id,
+            "name": self.name,
+            "started": self.started_wall,
+            "duration_ms": self.duration_ms,
+            "events": events,
+            "dropped": self.dropped,
+            **self.args,
+        }
+
+    def to_chrome_events(self, pid: int) -> List[Dict[str, Any]]:
+        """События в формате trace_event: трасса — процесс, дорожка — поток."""
+        with self._lock:
+            events = list(self.events)
+        tracks: Dict[str, int] = {}
+        result = [{
+            "name": "process_name", "ph": "M", "pid": pid, "tid": 0,
+            "args": {"name": f"{self.name} {self.request_id}"},
+        }]
+        end_ns = self.finished_ns if self.finished_ns is not None else time.perf_counter_ns()
+        events.insert(0, (self.name, self.started_ns, end_ns, "request", self.args or None))
+        for name, start_ns, stop_ns, track, args in events:
+            tid = tracks.get(track)
+            if tid is None:
+                tid = tracks[track] = len(tracks) + 1
+                result.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": track}})
+            event = {
+                "name": name, "cat": "turn", "ph": "X", "pid": pid, "tid": tid,
+                "ts": start_ns / 1000, "dur": max(0, stop_ns - start_ns) / 1000,
+            }
+            if args:
+                event["args"] = {key: value if isinstance(value, (int, float, bool)) else str(value)
+                                 for key, value in args.items()}
+            result.append(event)
+        return result
+
+
+class _Span:
+    __slots__ = ("trace", "name", "track", "args", "start_ns")
+
+    def __init__(self, trace: Trace, name: str, track: Optional[str], args: Dict[str, Any]):
+        self.trace = trace
+        self.name = name
+        self.track = track
+        self.args = args
+
+    def set(self, **args):
+        """Дополняет аргументы спана (например, результатом этапа)."""
+        self.args.update(args)
+
+    def __enter__(self):
+        self.start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None and not issubclass(exc_type, GeneratorExit):
+            self.args["error"] = exc_type.__name__
+        self.trace.add(self.name, self.start_ns, time.perf_counter_ns(), self.track, self.args)
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def set(self, **args):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class _Activation:
+    """Делает трассу текущей на время блока with (None — ничего не меняет)."""
+
+    __slots__ = ("trace", "token")
+
+    def __init__(self, trace: Optional[Trace]):
+        self.trace = trace
+        self.token = None
+
+    def __enter__(self):
+        if self.trace is not None:
+            self.token = _current_trace.set(self.trace)
+        return self.trace
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.token is not None:
+            _current_trace.reset(self.token)
+        return False
+
+
+class Tracer:
+    """Создание трасс, выборка и кольцевой буфер завершённых трасс."""
+
+    def __init__(self):
+        self.enabled = True
+        self.sample_rate = 1.0
+        self.max_events = 2000
+        self._finished: Deque[Trace] = deque(maxlen=50)
+        self._parked: "OrderedDict[str, Trace]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def configure(self, config: dict):
+        """Применяет настройки секции tracing."""
+        self.enabled = config.get("enabled", True)
+        self.sample_rate = config.get("sample_rate", 1.0)
+        self.max_events = config.get("max_events", 2000)
+        with self._lock:
+            self._finished = deque(self._finished, maxlen=config.get("buffer_size", 50))
+
+    # ── Жизненный цикл трассы ──────────────────────────────────────────────
+
+    def start_trace(self, name: str, **args) -> Optional[Trace]:
+        """Новая трасса или None, если сообщение не попало в выборку."""
+        if not self.enabled or (self.sample_rate < 1.0 and random.random() >= self.sample_rate):
+            return None
+        return Trace(name, uuid.uuid4().hex[:12], self.max_events, args)
+
+    def activate(self, trace: Optional[Trace]) -> _Activation:
+        return _Activation(trace)
+
+    async def iterate(self, trace: Optional[Trace], agen: AsyncIterator) -> AsyncIterator:
+        """
+        Проходит асинхронный генератор, делая трассу текущей на время каждого шага.
+        Внешний генератор могут продолжать разные задачи — значение ContextVar
+        ставится и снимается в пределах одного шага.
+        """
+        try:
+            while True:
+                token = _current_trace.set(trace)
+                try:
+                    item = await agen.__anext__()
+                except StopAsyncIteration:
+                    return
+                finally:
+                    _current_trace.reset(token)
+                yield item
+        finally:
+            # Закрытие снаружи (aclose) должно дойти до finally внутреннего генератора
+            token = _current_trace.set(trace)
+            try:
+                await agen.aclose()
+            finally:
+                _current_trace.reset(token)
+
+    def park(self, key: str, trace: Optional[Trace]):
+        """Откладывает трассу, чтобы её продолжил следующий обработчик (take)."""
+        if trace is None:
+            return
+        with self._lock:
+            self._parked[key] = trace
+            evicted = []
+            while len(self._parked) > _MAX_PARKED:
+                evicted.append(self._parked.popitem(last=False)[1])
+        for stale in evicted:
+            self.finish(stale)
+
+    def take(self, key: str) -> Optional[Trace]:
+        with self._lock:
+            return self._parked.pop(key, None)
+
+    def finish(self, trace: Optional[Trace]):
+        """Завершает трассу и кладёт её в буфер (поздние фоновые спаны всё равно допишутся)."""
+        if trace is None or trace.finished_ns is not None:
+            return
+        trace.finished_ns = time.perf_counter_ns()
+        with self._lock:
+            self._finished.append(trace)
+
+    # ── Спаны ──────────────────────────────────────────────────────────────
+
+    @staticmethod
+    def current() -> Optional[Trace]:
+        return _current_trace.get()
+
+    def current_request_id(self) -> Optional[str]:
+        trace = _current_trace.get()
+        return trace.request_id if trace is not None else None
+
+    def span(self, name: str, track: Optional[str] = None, **args):
+        """Контекст-менеджер спана в текущей трассе (пустой, если трассы нет)."""
+        trace = _current_trace.get()
+        if trace is None:
+            return _NOOP_SPAN
+        return _Span(trace, name, track, args)
+
+    def record(self, name: str, start_ns: int, end_ns: Optional[int] = None,
+               track: Optional[str] = None, trace: Optional[Trace] = None, **args):
+        """Спан по готовым отметкам времени (perf_counter_ns)."""
+        trace = trace if trace is not None else _current_trace.get()
+        if trace is not None:
+            trace.add(name, start_ns, end_ns if end_ns is not None else time.perf_counter_ns(), track, args)
+
+    # ── Выгрузка ───────────────────────────────────────────────────────────
+
+    def recent(self, limit: Optional[int] = None) -> List[Trace]:
+        with self._lock:
+            traces = list(self._finished)
+        return traces[-limit:] if limit else traces
+
+    def get(self, request_id: str) -> Optional[Trace]:
+        with self._lock:
+            for trace in reversed(self._finished):
+                if trace.request_id == request_id:
+                    return trace
+        return None
+
+    def export_chrome(self, traces: Optional[List[Trace]] = None) -> Dict[str, Any]:
+        """Трассы в формате Chrome trace_event (JSON Object Format)."""
+        if traces is None:
+            traces = self.recent()
+        events = []
+        for pid, trace in enumerate(traces, start=1):
+            events.extend(trace.to_chrome_events(pid))
+        return {
+            "traceEvents": events,
+            "displayTimeUnit": "ms",
+            "otherData": {"traces": [trace.summary() for trace in traces]},
+        }
+
+
+# Глобальный экземпляр
+tracer = Tracer()
@@ -0,0 +1,229 @@
+# services/watchdog.py
+"""
+Сторож циклов событий: задержка планирования и стеки блокирующего кода.
+
+Отдельный поток раз в interval_ms ставит в каждый наблюдаемый цикл
+пустой вызов (call_soon_threadsafe) и ждёт его выполнения. Время от
+постановки до выполнения — задержка цикла (гистограмма
+chat_event_loop_lag_seconds). Если вызов не выполнился за threshold_ms,
+цикл считается заблокированным: сторож снимает стек потока цикла
+(sys._current_frames) и, пока блокировка длится, повторяет снимок каждый
+interval_ms. Снимки группируются по месту блокировки — самому глубокому
+кадру кода приложения (не стандартной библиотеки и не site-packages),
+так что число снимков × interval_ms примерно равно времени, на которое
+это место останавливало цикл. get_report() отдаёт места по убыванию
+этого времени (маршрут /watchdog).
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import Any, Dict, Optional
+
+from container import container
+from services.metrics import metrics
+
+LOOP_LAG = metrics.histogram(
+    "chat_event_loop_lag_seconds", "Задержка выполнения вызова, поставленного в цикл событий", ("loop",),
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+LOOP_STALLS = metrics.counter(
+    "chat_event_loop_stalls_total", "Блокировки цикла событий дольше порога", ("loop",)
+)
+
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _is_app_frame(filename: str) -> bool:
+    """Кадр кода приложения (каталог проекта без установленных в него пакетов)."""
+    path = os.path.abspath(filename)
+    return path.startswith(_PROJECT_ROOT + os.sep) and "site-packages" not in path
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    filename = code.co_filename
+    if filename.startswith(_PROJECT_ROOT):
+        filename = os.path.relpath(filename, _PROJECT_ROOT)
+    return f"{filename}:{frame.f_lineno} {code.co_name}"
+
+
+class _LoopProbe:
+    """Состояние наблюдения за одним циклом."""
+
+    def __init__(self, name: str, loop, thread_id: int):
+        self.name = name
+        self.loop = loop
+        self.thread_id = thread_id
+        self.posted_at: Optional[float] = None
+        self.stall_site: Optional[str] = None
+        self.beats = 0
+        self.stalls = 0
+        self.max_lag = 0.0
+
+
+class EventLoopWatchdog:
+    """Поток-сторож для нескольких циклов событий."""
+
+    def __init__(self):
+        self.enabled = True
+        self.interval = 0.05
+        self.threshold = 0.2
+        self.stack_depth = 25
+        self.log_stacks = True
+        self._probes: Dict[str, _LoopProbe] = {}
+        self._sites: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self._logger = None
+
+    @property
+    def logger(self):
+        if self._logger is None:
+            self._logger = container.get_logger()
+        return self._logger
+
+    def configure(self, config: dict):
+        """Применяет настройки секции watchdog."""
+        self.enabled = config.get("enabled", True)
+        self.interval = config.get("interval_ms", 50) / 1000.0
+        self.threshold = config.get("threshold_ms", 200) / 1000.0
+        self.stack_depth = config.get("stack_depth", 25)
+        self.log_stacks = config.get("log_stacks", True)
+
+    # ── Регистрация циклов ─────────────────────────────────────────────────
+
+    def watch_running_loop(self, name: str):
+        """Ставит под наблюдение текущий цикл событий (вызывать из него самого)."""
+        if not self.enabled:
+            return
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            probe = self._probes.get(name)
+            if probe is not None and probe.loop is loop:
+                return
+            self._probes[name] = _LoopProbe(name, loop, threading.get_ident())
+        self.logger.debug("🐕 [Watchdog] Наблюдение за циклом %s", name)
+        self._ensure_thread()
+
+    def unwatch(self, name: str):
+        with self._lock:
+            self._probes.pop(name, None)
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+
+    # ── Поток-сторож ───────────────────────────────────────────────────────
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            with self._lock:
+                probes = list(self._probes.values())
+            now = time.perf_counter()
+            for probe in probes:
+                if probe.posted_at is None:
+                    probe.posted_at = now
+                    try:
+                        probe.loop.call_soon_threadsafe(self._beat, probe, now)
+                    except RuntimeError:
+                        # Цикл закрыт
+                        self.unwatch(probe.name)
+                elif now - probe.posted_at >= self.threshold:
+                    self._sample(probe, now - probe.posted_at)
+
+    def _beat(self, probe: _LoopProbe, posted_at: float):
+        """Выполняется в наблюдаемом цикле."""
+        lag = time.perf_counter() - posted_at
+        LOOP_LAG.observe(lag, loop=probe.name)
+        probe.beats += 1
+        probe.max_lag = max(probe.max_lag, lag)
+        if probe.stall_site is not None:
+            self.logger.warning(
+                "🐢 [Watchdog] Цикл %s был заблокирован %.0f мс: %s", probe.name, 1000 * lag, probe.stall_site
+            )
+            probe.stall_site = None
+        probe.posted_at = None
+
+    def _sample(self, probe: _LoopProbe, blocked_for: float):
+        """Снимок стека заблокированного потока цикла."""
+        frame = sys._current_frames().get(probe.thread_id)
+        if frame is None:
+            return
+        site_frame = frame
+        while site_frame is not None and not _is_app_frame(site_frame.f_code.co_filename):
+            site_frame = site_frame.f_back
+        site = _frame_label(site_frame or frame)
+        first_sample = probe.stall_site is None
+        if first_sample:
+            probe.stall_site = site
+
+        with self._lock:
+            key = f"{probe.name}|{site}"
+            stats = self._sites.get(key)
+            if stats is None:
+                stats = self._sites[key] = {
+                    "loop": probe.name,
+                    "site": site,
+                    "leaf": _frame_label(frame),
+                    "stalls": 0,
+                    "samples": 0,
+                    "max_blocked_ms": 0.0,
+                    "stack": "".join(traceback.format_stack(frame, limit=self.stack_depth)),
+                }
+            stats["samples"] += 1
+            stats["max_blocked_ms"] = max(stats["max_blocked_ms"], 1000 * blocked_for)
+            if first_sample:
+                stats["stalls"] += 1
+
+        if first_sample:
+            probe.stalls += 1
+            LOOP_STALLS.inc(loop=probe.name)
+            if self.log_stacks:
+                self.logger.warning(
+                    "🐢 [Watchdog] Цикл %s заблокирован дольше %.0f мс в %s\n%s",
+                    probe.name, 1000 * self.threshold, site, stats["stack"].rstrip()
+                )
+
+    # ── Отчёт ──────────────────────────────────────────────────────────────
+
+    def get_report(self, limit: Optional[int] = None) -> Dict[str, Any]:
+        """Места блокировок по убыванию суммарного времени и сводка по циклам."""
+        with self._lock:
+            sites = [dict(stats) for stats in self._sites.values()]
+            probes = list(self._probes.values())
+        for stats in sites:
+            stats["blocked_ms"] = round(stats["samples"] * self.interval * 1000, 1)
+        sites.sort(key=lambda stats: (stats["samples"], stats["stalls"]), reverse=True)
+        return {
+            "interval_ms": self.interval * 1000,
+            "threshold_ms": self.threshold * 1000,
+            "loops": {
+                probe.name: {"beats": probe.beats, "stalls": probe.stalls, "max_lag_ms": round(1000 * probe.max_lag, 1)}
+                for probe in probes
+            },
+            "sites": sites[:limit] if limit else sites,
+        }
+
+    def log_summary(self, limit: int = 5):
+        """Пишет в лог самые долгие места блокировок (при завершении приложения)."""
+        for stats in self.get_report(limit)["sites"]:
+            self.logger.info(
+                "🐢 [Watchdog] %s: %s — блокировок %d, ~%.0f мс (макс. %.0f мс)",
+                stats["loop"], stats["site"], stats["stalls"], stats["blocked_ms"], stats["max_blocked_ms"]
+            )
+
+
+# Глобальный экземпляр
+loop_watchdog = EventLoopWatchdog()
@@ -3,8 +3,15 @@ if (!window.SELECTORS) {
     console.error('SELECTORS не определены! Загрузите selectors.js первым');
 }
 
-let chatListData = [];
-let chatGroups = {};
+// Версия списка, отрисованного на клиенте (null — ещё не было полного списка)
+let chatListVersion = null;
+let chatListResyncPending = false;
+// id → элемент и id → данные чата; разделители групп по названию
+const chatElements = new Map();
+const chatIndex = new Map();
+const groupDividers = new Map();
+
+const GROUP_ORDER = ['Закрепленные', 'Сегодня', 'Вчера', '7 дней', 'Месяц', 'Более месяца'];
 
 /**
  * Только визуальное выделение активного чата (без отправки события в Gradio)
@@ -12,18 +19,18 @@ let chatGroups = {};
 window.setActiveChatClass = function(chatId) {
     if (!window.SELECTORS) return;
     
-    document.querySelectorAll(window.SELECTORS.CHAT_ITEM).forEach(el => {
+    document.querySelectorAll(`${window.SELECTORS.CHAT_ITEM}.active`).forEach(el => {
         el.classList.remove('active');
     });
     
-    const active = document.querySelector(`[data-chat-id="${chatId}"]`);
+    const active = chatElements.get(String(chatId)) || document.querySelector(`[data-chat-id="${chatId}"]`);
     if (active) {
         active.classList.add('active');
     }
 };
 
 /**
- * Рендерит список чатов
+ * Рендерит список чатов: полный список или разницу относительно текущей версии
  * @param {Object|string} chats - данные чатов
  * @param {string} scrollTarget - 'top', 'today' или 'none'
  */
@@ -44,33 +51,146 @@ window.renderChatList = function(chats, scrollTarget = 'none') {
         }
     }
 
-    chatListData = chats.flat || [];
-    chatGroups = chats.groups || {};
+    if (chats.diff) {
+        if (!window.applyChatListDiff(container, chats)) return;
+    } else {
+        renderFullChatList(container, chats);
+    }
+
+    finishChatListUpdate(chats, scrollTarget);
+};
+
+function renderFullChatList(container, chats) {
+    const chatGroups = chats.groups || {};
 
     container.innerHTML = '';
+    chatElements.clear();
+    chatIndex.clear();
+    groupDividers.clear();
+    chatListVersion = chats.version !== undefined ? chats.version : null;
+    chatListResyncPending = false;
 
     if (!chatGroups || Object.keys(chatGroups).length === 0) {
-        container.innerHTML = '<div style="text-align: center; padding: 20px; color: #64748b;">Нет чатов</div>';
+        showEmptyChatList(container);
         return;
     }
 
     if (window.closeAllContextMenus) window.closeAllContextMenus();
 
-    const groupOrder = ['Закрепленные', 'Сегодня', 'Вчера', '7 дней', 'Месяц', 'Более месяца'];
-
-    groupOrder.forEach(groupName => {
+    GROUP_ORDER.forEach(groupName => {
         if (chatGroups[groupName] && chatGroups[groupName].length > 0) {
-            const divider = document.createElement('div');
-            divider.className = 'group-divider';
-            divider.textContent = groupName;
-            container.appendChild(divider);
+            container.appendChild(createGroupDivider(groupName));
 
             chatGroups[groupName].forEach(chat => {
-                createChatElement(container, chat);
+                createChatElement(container, chat, groupName);
             });
         }
     });
+}
+
+/**
+ * Применяет разницу списка чатов к DOM: удаляет, обновляет и переставляет
+ * только перечисленные чаты. Обновления приходят с конца списка, поэтому
+ * следующий чат (before) уже стоит на своём месте.
+ * Возвращает false, если версия не совпала и запрошен полный список.
+ */
+window.applyChatListDiff = function(container, chats) {
+    if (chatListVersion === null || chats.base_version !== chatListVersion) {
+        requestChatListResync();
+        return false;
+    }
+
+    const diff = chats.diff;
+    const removed = diff.removed || [];
+    const upserted = diff.upserted || [];
+
+    if ((removed.length || upserted.length) && window.closeAllContextMenus) {
+        window.closeAllContextMenus();
+    }
+    if (upserted.length) {
+        container.querySelector('.chat-list-empty')?.remove();
+    }
+
+    removed.forEach(chatId => {
+        chatElements.get(chatId)?.remove();
+        chatElements.delete(chatId);
+        chatIndex.delete(chatId);
+    });
+
+    for (const chat of upserted) {
+        let chatDiv = chatElements.get(chat.id);
+        if (chatDiv) {
+            updateChatElement(chatDiv, chat, chat.group);
+        } else {
+            chatDiv = buildChatElement(chat, chat.group);
+        }
+
+        let next;
+        if (chat.before) {
+            next = chatElements.get(chat.before);
+            if (!next || next.dataset.group !== chat.group) {
+                // Клиент разошёлся с сервером — проще перерисовать всё
+                requestChatListResync();
+                return false;
+            }
+        } else {
+            if (!groupDividers.has(chat.group)) {
+                container.insertBefore(createGroupDivider(chat.group), groupEnd(chat.group));
+            }
+            next = groupEnd(chat.group);
+        }
+        if (chatDiv.parentNode !== container || chatDiv.nextSibling !== next) {
+            container.insertBefore(chatDiv, next);
+        }
+    }
+
+    // Убираем разделители опустевших групп
+    groupDividers.forEach((divider, groupName) => {
+        const nextEl = divider.nextElementSibling;
+        if (!nextEl || !nextEl.classList.contains('chat-item')) {
+            divider.remove();
+            groupDividers.delete(groupName);
+        }
+    });
+
+    if (chatElements.size === 0) {
+        showEmptyChatList(container);
+    }
+
+    chatListVersion = chats.version;
+    return true;
+};
+
+function requestChatListResync() {
+    if (chatListResyncPending || !window.sendCommand) return;
+    chatListResyncPending = true;
+    window.sendCommand('chatlist:resync');
+    // Если ответ потерялся, следующая рассинхронизация запросит список снова
+    setTimeout(() => { chatListResyncPending = false; }, 2000);
+}
+
+/** Узел, перед которым заканчивается группа: разделитель следующей группы или null */
+function groupEnd(groupName) {
+    for (let i = GROUP_ORDER.indexOf(groupName) + 1; i < GROUP_ORDER.length; i++) {
+        const divider = groupDividers.get(GROUP_ORDER[i]);
+        if (divider) return divider;
+    }
+    return null;
+}
 
+function createGroupDivider(groupName) {
+    const divider = document.createElement('div');
+    divider.className = 'group-divider';
+    divider.textContent = groupName;
+    groupDividers.set(groupName, divider);
+    return divider;
+}
+
+function showEmptyChatList(container) {
+    container.innerHTML = '<div class="chat-list-empty" style="text-align: center; padding: 20px; color: #64748b;">Нет чатов</div>';
+}
+
+function finishChatListUpdate(chats, scrollTarget) {
     // Скролл списка чатов
     let target = scrollTarget;
     if (chats && typeof chats === 'object' && chats._scroll_target !== undefined) {
@@ -85,9 +205,7 @@ window.renderChatList = function(chats, scrollTarget = 'none') {
         requestAnimationFrame(() => {
             const scrollContainer = document.querySelector('.chat-list') || document.querySelector(window.SELECTORS.CHAT_LIST);
             if (!scrollContainer) return;
-            const todayHeader = Array.from(document.querySelectorAll('.group-divider')).find(
-                el => el.textContent.trim() === 'Сегодня'
-            );
+            const todayHeader = groupDividers.get('Сегодня');
             if (todayHeader) todayHeader.scrollIntoView({ behavior: 'smooth', block: 'start' });
             else scrollContainer.scrollTop = 0;
         });
@@ -108,9 +226,13 @@ window.renderChatList = function(chats, scrollTarget = 'none') {
     }
 
     // Выделение активного чата и фокус
-    const activeChat = chatListData.find(chat => chat.is_current);
-    if (activeChat) {
-        window.setActiveChatClass(activeChat.id);
+    let activeChatId = chats.current_id;
+    if (activeChatId === undefined) {
+        const activeChat = (chats.flat || []).find(chat => chat.is_current);
+        activeChatId = activeChat ? activeChat.id : null;
+    }
+    if (activeChatId && chatIndex.has(activeChatId)) {
+        window.setActiveChatClass(activeChatId);
         if (!window.isGenerating) {
             setTimeout(() => {
                 const inputField = document.querySelector('.chat-input-wrapper textarea');
@@ -128,10 +250,15 @@ window.renderChatList = function(chats, scrollTarget = 'none') {
     if (window.scrollChatToBottom) {
         setTimeout(window.scrollChatToBottom, 50);
     }
-};
+}
+
+function createChatElement(container, chat, groupName) {
+    const chatDiv = buildChatElement(chat, groupName);
+    if (chatDiv) container.appendChild(chatDiv);
+}
 
-function createChatElement(container, chat) {
-    if (!window.SELECTORS || !window.escapeHtml) return;
+function buildChatElement(chat, groupName) {
+    if (!window.SELECTORS) return null;
     
     const chatDiv = document.createElement('div');
     chatDiv.className = 'chat-item';
@@ -139,14 +266,11 @@ function createChatElement(container, chat) {
     
     chatDiv.innerHTML = `
         <div class="chat-name-wrapper">
-            <div class="chat-name">${window.escapeHtml(chat.name)}</div>
+            <div class="chat-name"></div>
         </div>
         <div class="chat-control"></div>
     `;
-    
-    if (chat.is_current) {
-        chatDiv.classList.add('active');
-    }
+    updateChatElement(chatDiv, chat, groupName);
     
     chatDiv.onclick = function(e) {
         if (!window.SELECTORS) return;
@@ -172,10 +296,81 @@ function createChatElement(container, chat) {
     const controlBtn = chatDiv.querySelector(window.SELECTORS.CHAT_CONTROL);
     controlBtn.onclick = function(e) {
         e.stopPropagation();
+        // Актуальные имя и закрепление: элемент переиспользуется между обновлениями
+        const current = chatIndex.get(chat.id) || chat;
         if (window.toggleContextMenu) {
-            window.toggleContextMenu(chatDiv, chat.id, chat.name, chat.pinned || false);
+            window.toggleContextMenu(chatDiv, current.id, current.name, current.pinned || false);
         }
     };
     
-    container.appendChild(chatDiv);
-}
\ No newline at end of file
+    chatElements.set(chat.id, chatDiv);
+    return chatDiv;
+}
+
+/** Обновляет имя, группу и выделение существующего элемента чата */
+function updateChatElement(chatDiv, chat, groupName) {
+    chatIndex.set(chat.id, chat);
+    chatDiv.dataset.group = groupName;
+
+    const nameEl = chatDiv.querySelector('.chat-name');
+    if (nameEl && nameEl.textContent !== chat.name) {
+        nameEl.textContent = chat.name;
+    }
+    chatDiv.classList.toggle('active', !!chat.is_current);
+}
+
+/**
+ * Результаты поиска по чатам: список заменяет обычный список чатов,
+ * пока в поле поиска есть запрос
+ * @param {Object|null} data - {query, results: [{id, name, name_match, snippet, ...}]}
+ */
+window.renderChatSearchResults = function(data) {
+    const resultsEl = document.querySelector('#chat_search_results_list');
+    const listEl = document.querySelector(window.SELECTORS ? window.SELECTORS.CHAT_LIST : '#chat_list');
+    if (!resultsEl || !listEl) return;
+
+    const input = document.querySelector('#chat_search_input textarea, #chat_search_input input');
+    const currentQuery = input ? input.value.trim() : '';
+    if (data && input && data.query !== currentQuery) {
+        // Ответ на устаревший запрос — дождёмся следующего
+        return;
+    }
+
+    if (!data || !data.query) {
+        resultsEl.style.display = 'none';
+        resultsEl.innerHTML = '';
+        listEl.style.display = '';
+        return;
+    }
+
+    listEl.style.display = 'none';
+    resultsEl.style.display = '';
+    resultsEl.innerHTML = '';
+
+    if (!data.results || data.results.length === 0) {
+        resultsEl.innerHTML = '<div class="chat-list-empty" style="text-align: center; padding: 20px; color: #64748b;">Ничего не найдено</div>';
+        return;
+    }
+
+    data.results.forEach(result => {
+        const item = document.createElement('div');
+        item.className = 'chat-search-item';
+        item.setAttribute('data-chat-id', result.id);
+        item.innerHTML = `
+            <div class="chat-search-name">${highlightSearchText(result.name_match || result.name)}</div>
+            ${result.snippet ? `<div class="chat-search-snippet">${highlightSearchText(result.snippet)}</div>` : ''}
+        `;
+        item.onclick = function() {
+            if (window.selectChat) {
+                window.selectChat(result.id);
+            }
+        };
+        resultsEl.appendChild(item);
+    });
+};
+
+/** Экранирует фрагмент и заменяет маркеры подсветки (\x02 … \x03) на <mark> */
+function highlightSearchText(text) {
+    const escaped = window.escapeHtml ? window.escapeHtml(text || '') : (text || '');
+    return escaped.replace(/\u0002/g, '<mark>').replace(/\u0003/g, '</mark>');
+}
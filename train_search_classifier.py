@@ -0,0 +1,119 @@
+# train_search_classifier.py
+"""
+Обучение предварительного классификатора поиска на журнале решений Pass 1.
+
+Разметка — решения LLM (source="llm") из search.preclassifier.log_path.
+Часть записей откладывается для проверки; по ней печатаются матрицы
+ошибок: модели при пороге 0.5 и всего каскада (правила + модель с
+порогами из конфигурации), а также доля сообщений, решённых без Pass 1.
+
+Примеры:
+    python train_search_classifier.py
+    python train_search_classifier.py --epochs 30 --holdout 0.25
+    python train_search_classifier.py --report      # только оценка сохранённой модели
+"""
+import argparse
+import random
+from typing import List, Optional, Tuple
+
+import container  # noqa: F401  (контейнер инициализируется до импорта сервисов)
+import services  # noqa: F401
+from container import container as app_container
+from services.search.preclassifier import LogisticModel, match_rule, read_decision_log
+
+
+def _print_matrix(title: str, pairs: List[Tuple[bool, bool]]):
+    """pairs: (истина, предсказание)."""
+    tp = sum(1 for y, p in pairs if y and p)
+    fn = sum(1 for y, p in pairs if y and not p)
+    fp = sum(1 for y, p in pairs if not y and p)
+    tn = sum(1 for y, p in pairs if not y and not p)
+    total = len(pairs)
+    print(f"\n{title} (примеров: {total})")
+    print(f"{'':>16}{'pred: поиск':>14}{'pred: нет':>12}")
+    print(f"{'LLM: поиск':>16}{tp:>14}{fn:>12}")
+    print(f"{'LLM: нет':>16}{fp:>14}{tn:>12}")
+    if total:
+        precision = tp / (tp + fp) if tp + fp else 0.0
+        recall = tp / (tp + fn) if tp + fn else 0.0
+        print(f"accuracy {(tp + tn) / total:.3f}, precision {precision:.3f}, recall {recall:.3f}")
+
+
+def evaluate(model: Optional[LogisticModel], records, search_threshold: float, skip_threshold: float,
+             use_rules: bool):
+    if model is not None:
+        _print_matrix("Модель, порог 0.5", [
+            (bool(r["search"]), model.predict_proba(r["prompt"]) >= 0.5) for r in records
+        ])
+
+    decided = []
+    by_source = {"rule": 0, "model": 0, "llm": 0}
+    for record in records:
+        label = bool(record["search"])
+        rule = match_rule(record["prompt"]) if use_rules else None
+        if rule is not None:
+            decided.append((label, rule[1]))
+            by_source["rule"] += 1
+            continue
+        if model is not None:
+            probability = model.predict_proba(record["prompt"])
+            if probability >= search_threshold or probability <= skip_threshold:
+                decided.append((label, probability >= search_threshold))
+                by_source["model"] += 1
+                continue
+        by_source["llm"] += 1
+
+    _print_matrix(f"Каскад на решённых без LLM (пороги {skip_threshold}/{search_threshold})", decided)
+    total = len(records)
+    if total:
+        print(f"\n⚡ Решено без Pass 1: {(by_source['rule'] + by_source['model']) / total:.1%} "
+              f"(правила {by_source['rule']}, модель {by_source['model']}, LLM {by_source['llm']})")
+
+
+def main():
+    config = app_container.get_config().get("search", {}).get("preclassifier", {})
+
+    parser = argparse.ArgumentParser(description="Обучение классификатора «нужен ли поиск»")
+    parser.add_argument("--log", default=config.get("log_path", "cache/search_decisions.jsonl"))
+    parser.add_argument("--model", default=config.get("model_path", "cache/search_classifier.npz"))
+    parser.add_argument("--holdout", type=float, default=0.2, help="доля записей для проверки")
+    parser.add_argument("--epochs", type=int, default=20)
+    parser.add_argument("--lr", type=float, default=5.0)
+    parser.add_argument("--l2", type=float, default=1e-5)
+    parser.add_argument("--search-threshold", type=float, default=config.get("search_threshold", 0.9))
+    parser.add_argument("--skip-threshold", type=float, default=config.get("skip_threshold", 0.1))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--report", action="store_true", help="только оценить сохранённую модель")
+    args = parser.parse_args()
+    use_rules = config.get("rules", True)
+
+    records = read_decision_log(args.log)
+    positives = sum(1 for r in records if r["search"])
+    print(f"📊 Решений LLM в журнале: {len(records)} (с поиском: {positives})")
+    if not records:
+        print("❌ Журнал пуст: включите search.preclassifier.log_decisions и накопите решения Pass 1")
+        return
+
+    if args.report:
+        evaluate(LogisticModel.load(args.model), records, args.search_threshold, args.skip_threshold, use_rules)
+        return
+
+    random.Random(args.seed).shuffle(records)
+    split = int(len(records) * (1 - args.holdout))
+    train, test = records[:split], records[split:]
+    if positives == 0 or positives == len(records):
+        print("❌ В журнале только один класс — обучать нечего")
+        return
+
+    model = LogisticModel()
+    model.fit([r["prompt"] for r in train], [int(bool(r["search"])) for r in train],
+              epochs=args.epochs, lr=args.lr, l2=args.l2, seed=args.seed)
+    print(f"✅ Обучено на {len(train)} примерах, проверка на {len(test)}")
+    evaluate(model, test or train, args.search_threshold, args.skip_threshold, use_rules)
+
+    model.save(args.model)
+    print(f"\n💾 Модель сохранена: {args.model}")
+
+
+if __name__ == "__main__":
+    main()
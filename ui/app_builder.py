@@ -44,6 +44,8 @@ def create_app():
             "settings_btn": settings_btn,
             "create_dialog_btn": create_dialog_btn,
             "chat_input": chat_input,
+            "chat_search": sidebar_components["chat_search"],
+            "chat_search_results": sidebar_components["chat_search_results"],
             "settings_data": settings_data,
             "chat_list_data": chat_list_data,
             "js_trigger": js_trigger,
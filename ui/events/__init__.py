@@ -44,6 +44,10 @@ class EventBinder:
             components["generation_js_trigger"]
         )
         self.chat_events.bind_chat_list_update(components["chat_list_data"])
+        self.chat_events.bind_chat_search_events(
+            components["chat_search"],
+            components["chat_search_results"]
+        )
 
         # Инициализация: получаем историю, ID, список чатов И настройки
         demo.load(
@@ -107,4 +107,33 @@ class ChatEvents:
                 return [];
             }
             """
-        )
\ No newline at end of file
+        )
+
+    @staticmethod
+    def bind_chat_search_events(chat_search, chat_search_results):
+        """Поиск по чатам: запрос на сервер при вводе, отрисовка результатов в JS."""
+        chat_search.input(
+            fn=ui_handlers.search_chats_handler,
+            inputs=[chat_search],
+            outputs=[chat_search_results],
+            trigger_mode="always_last",
+            show_progress="hidden"
+        )
+
+        chat_search_results.change(
+            fn=None,
+            inputs=[chat_search_results],
+            outputs=[],
+            js="""
+            (data) => {
+                try {
+                    if (window.renderChatSearchResults) {
+                        window.renderChatSearchResults(data ? JSON.parse(data) : null);
+                    }
+                } catch (e) {
+                    console.error('Ошибка отображения результатов поиска:', e);
+                }
+                return [];
+            }
+            """
+        )
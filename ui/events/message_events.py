@@ -11,6 +11,7 @@ from container import container
 from handlers import ui_handlers
 from models.enums import MessageRole
 from services.chat.core import validate_message
+from services.tracing import tracer
 from services.user_config_service import user_config_service
 
 STOP_GENERATION_JS = """
@@ -82,15 +83,19 @@ class MessageEvents:
             """
             return history, chat_id or "", chat_list_data, js_toast, ""
 
-        dialog_service = container.get_dialog_service()
-        if not chat_id:
-            chat_id = dialog_service.create_dialog()
+        # Трасса сообщения начинается здесь и продолжается в stream_and_save_context
+        trace = tracer.start_trace("turn")
+        with tracer.activate(trace), tracer.span("save_and_show_user_message"):
+            dialog_service = container.get_dialog_service()
+            if not chat_id:
+                chat_id = dialog_service.create_dialog()
 
-        dialog_service.add_message(chat_id, MessageRole.USER, prompt)
+            dialog_service.add_message(chat_id, MessageRole.USER, prompt)
 
-        dialog = dialog_service.get_dialog(chat_id)
-        history = dialog.to_ui_format() if dialog else []
-        chat_list_data = ui_handlers.get_chat_list_data(scroll_target="today")
+            dialog = dialog_service.get_dialog(chat_id)
+            history = dialog.to_ui_format() if dialog else []
+            chat_list_data = ui_handlers.get_chat_list_data(scroll_target="today")
+        tracer.park(chat_id, trace)
 
         js_start = """
         <script>
@@ -132,10 +137,11 @@ class MessageEvents:
         accumulated_response = ""
         last_chat_list_data = ""
         stream_completed_normally = False
+        trace = tracer.take(chat_id) or tracer.start_trace("turn")
 
         try:
-            async for history, _, dialog_id, chat_list_data, js_code in ui_handlers.send_message_stream_handler(
-                saved_prompt, chat_id, max_tokens, temperature
+            async for history, _, dialog_id, chat_list_data, js_code in tracer.iterate(
+                trace, ui_handlers.send_message_stream_handler(saved_prompt, chat_id, max_tokens, temperature)
             ):
                 if history and history[-1]["role"] == "assistant":
                     accumulated_response = history[-1]["content"]
@@ -152,9 +158,10 @@ class MessageEvents:
             logger.error("Error in stream: %s", error)
 
         finally:
+            tracer.finish(trace)
             if not stream_completed_normally:
                 # Нештатное завершение: явно останавливаем кнопки
-                final_dialog = dialog_service.get_dialog(chat_id)
+                final_dialog = await dialog_service.get_dialog_async(chat_id)
                 final_history = final_dialog.to_ui_format() if final_dialog else []
                 fallback_chat_list = last_chat_list_data or ui_handlers.get_chat_list_data()
                 yield final_history, chat_id, fallback_chat_list, STOP_GENERATION_JS
@@ -167,9 +174,9 @@ class MessageEvents:
 
                     async def _save_cancelled_context():
                         try:
-                            dialog = dialog_service.get_dialog(_chat_id)
+                            dialog = await dialog_service.get_dialog_async(_chat_id)
                             if dialog:
-                                dialog.add_interaction_to_context(_prompt, _response)
+                                await asyncio.to_thread(dialog.add_interaction_to_context, _prompt, _response)
                                 dialog.save_context_state()
                         except Exception as ctx_err:
                             logger.warning("Ошибка обновления контекста при отмене: %s", ctx_err)
@@ -21,8 +21,23 @@ def create_sidebar_layout():
             elem_classes="new-chat-btn"
         )
 
+        chat_search = gr.Textbox(
+            placeholder="🔍 Поиск по чатам",
+            elem_id="chat_search_input",
+            show_label=False,
+            container=False,
+            elem_classes="chat-search-input",
+            interactive=True
+        )
+        chat_search_results = gr.Textbox(
+            visible=False,
+            elem_id="chat_search_results",
+            interactive=False
+        )
+
         gr.HTML("""
         <div class="chat-list-container">
+            <div class="chat-search-results" id="chat_search_results_list" style="display: none;"></div>
             <div class="chat-list" id="chat_list">
                 <div style="text-align: center; padding: 20px; color: #64748b;">
                     Загрузка чатов...
@@ -58,6 +73,8 @@ def create_sidebar_layout():
     return {
         "create_dialog_btn": create_dialog_btn,
         "chat_input": chat_input,
+        "chat_search": chat_search,
+        "chat_search_results": chat_search_results,
         "settings_data": settings_data,   # ← вернули
         "js_trigger": js_trigger,
         "generation_js_trigger": generation_js_trigger